@@ -0,0 +1,133 @@
+"""Cold-start and warm-latency benchmark for routes.lambda_handler.
+
+Compares the direct API Gateway dispatcher (LAMBDA_FAST_PATH=true) with the
+awsgi + Flask path by invoking the handler in-process with API Gateway proxy
+events. Needs a reachable database (DB_HOST etc., as for the API itself).
+
+    python bench_lambda_handler.py [--iterations 500] [--cold-runs 10] [--code-dir DIR]
+
+--code-dir can point at another checkout of code_and_queries to measure an
+older handler the same way (only the wsgi path exists there).
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+import subprocess
+from harness import summarize, git_commit
+
+DEFAULT_CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code_and_queries')
+
+
+class Context:
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+
+def api_gateway_event(method, path, query=None, headers=None, body=None):
+    if body is not None:
+        headers = {"Content-Type": "application/json", **(headers or {})}
+    return {
+        "httpMethod": method,
+        "path": path,
+        "queryStringParameters": query,
+        "headers": {"Host": "localhost", "User-Agent": "bench", **(headers or {})},
+        "body": json.dumps(body) if body is not None else None,
+        "isBase64Encoded": False,
+        "requestContext": {"stage": os.environ.get('ENVIRONMENT', 'dev')},
+    }
+
+
+# Run in a fresh interpreter per sample: import the handler, then serve the first request
+COLD_START_SCRIPT = """
+import sys, time, json, logging
+t0 = time.perf_counter()
+sys.path.insert(0, {code_dir!r})
+import routes
+t1 = time.perf_counter()
+logging.getLogger().handlers[:] = [logging.StreamHandler(open('/dev/null', 'w'))]
+class Context: aws_request_id = 'cold-start'
+response = routes.lambda_handler({event!r}, Context())
+t2 = time.perf_counter()
+assert int(response['statusCode']) < 400, response
+print(json.dumps({{"import_ms": (t1 - t0) * 1000, "first_request_ms": (t2 - t1) * 1000}}))
+"""
+
+
+def cold_start(code_dir, event, fast_path, runs):
+    env = dict(os.environ, LAMBDA_FAST_PATH='true' if fast_path else 'false')
+    imports, firsts = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START_SCRIPT.format(code_dir=code_dir, event=event)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        total = (time.perf_counter() - started) * 1000
+        sample = json.loads(output.strip().splitlines()[-1])
+        imports.append(sample["import_ms"])
+        firsts.append(sample["first_request_ms"])
+    return {
+        "import_ms_median": round(statistics.median(imports), 1),
+        "first_request_ms_median": round(statistics.median(firsts), 1),
+        "process_ms_last": round(total, 1),
+    }
+
+
+def warm(routes, event, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = routes.lambda_handler(event, Context())
+        samples.append((time.perf_counter() - started) * 1000)
+        assert int(response['statusCode']) < 400, response
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--code-dir', default=DEFAULT_CODE_DIR)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--cold-runs', type=int, default=10)
+    args = parser.parse_args()
+
+    code_dir = os.path.abspath(args.code_dir)
+    sys.path.insert(0, code_dir)
+    import logging
+    import routes
+    # Keep the handler's logging (and EMF metrics) work but discard the output
+    logging.getLogger().handlers[:] = [logging.StreamHandler(open(os.devnull, 'w'))]
+    results_out, sys.stdout = sys.stdout, open(os.devnull, 'w')
+
+    prefix = f"/{os.environ.get('ENVIRONMENT')}"
+    created = routes.lambda_handler(api_gateway_event('POST', f"{prefix}/create_fake_user"), Context())
+    user_uuid = json.loads(created['body'])['user_uuid']
+    # A fixed garage size, so runs against different code are comparable
+    cars = [{"make": "Toyota", "model": "Corolla", "year": 2015, "mileage": 90000 + i} for i in range(10)]
+    added = routes.lambda_handler(api_gateway_event('POST', f"{prefix}/user/{user_uuid}/car/add_user_cars", body={"cars": cars}), Context())
+    assert int(added['statusCode']) < 400, added
+    events = {
+        "health": api_gateway_event('GET', f"{prefix}/health"),
+        "get_user_cars": api_gateway_event('GET', f"{prefix}/user/{user_uuid}/cars"),
+    }
+
+    has_fast_path = hasattr(routes, 'fast_path')
+    modes = {"direct": True, "wsgi": False} if has_fast_path else {"wsgi": False}
+    results = {"commit": git_commit(cwd=code_dir), "code_dir": code_dir, "iterations": args.iterations, "cold_start": {}, "warm": {}}
+    for mode, enabled in modes.items():
+        if has_fast_path:
+            routes.fast_path.LAMBDA_FAST_PATH = enabled
+        for name, event in events.items():
+            warm(routes, event, min(50, args.iterations))  # settle the pool and caches
+            results["warm"][f"{mode}/{name}"] = warm(routes, event, args.iterations)
+        results["cold_start"][f"{mode}/get_user_cars"] = cold_start(code_dir, events["get_user_cars"], enabled, args.cold_runs)
+        results["cold_start"][f"{mode}/health"] = cold_start(code_dir, events["health"], enabled, args.cold_runs)
+
+    print(json.dumps(results, indent=2), file=results_out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,454 @@
+"""Route-level load test of the Flask app against a disposable PostgreSQL database.
+
+Creates a throwaway database (on the server named by DB_HOST / DB_PORT /
+DB_USERNAME / DB_PASSWORD, or in a temporary cluster started with --initdb),
+migrates and seeds it at the requested scale, serves routes.app (or, with
+--server asgi, asgi_app.app under uvicorn) on a local port and drives each
+route with concurrent HTTP clients. Reports throughput,
+p50/p95/p99 latency and SQL statements per request, and writes everything to
+a JSON file so runs can be compared across commits.
+
+    python bench_routes.py --users 1000 --cars-per-user 3 --errors-per-car 5 \\
+        --concurrency 8 --requests 2000 --output results.json
+
+--initdb needs initdb and pg_ctl on PATH (or --pg-bin) and cannot run as root.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import argparse
+import tempfile
+import platform
+import threading
+import subprocess
+import http.client
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from harness import summarize, git_commit
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code_and_queries')
+ENV = 'bench'
+
+# Seeded server-side so even large fleets load in seconds. User uuids come from
+# Python, as gen_random_uuid() needs PostgreSQL 13 or pgcrypto
+SEED_STATEMENTS = [
+    """
+    INSERT INTO users (uuid, email, location)
+    SELECT u, 'bench' || i || '@example.com',
+           (ARRAY['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix'])[1 + i %% 5]
+    FROM unnest(%(uuids)s::uuid[]) WITH ORDINALITY AS t(u, i)
+    """,
+    """
+    INSERT INTO cars (user_uuid)
+    SELECT u.uuid FROM users u CROSS JOIN generate_series(1, %(cars_per_user)s)
+    """,
+    """
+    INSERT INTO car_details (car_id, make, model, year, mileage, last_maintenance_checkup,
+                             last_oil_change, purchase_date, last_brake_pad_change)
+    SELECT car_id,
+           (ARRAY['Toyota', 'Ford', 'Honda', 'Chevrolet', 'Nissan'])[1 + car_id %% 5],
+           (ARRAY['Corolla', 'F-150', 'Civic', 'Silverado', 'Altima'])[1 + car_id %% 5],
+           2000 + car_id %% 24, (car_id * 7919) %% 200000,
+           current_date - (30 + car_id %% 335), current_date - (30 + car_id %% 150),
+           current_date - (365 + car_id %% 3285), current_date - (30 + car_id %% 335)
+    FROM cars
+    """,
+    """
+    INSERT INTO error_events (car_id, error_codes, occurrence_mileage, occurrence_date)
+    SELECT car_id,
+           (ARRAY['P0128', 'P0300', 'P0171, P0174', 'P0420', 'P0442', 'C0035', 'U0100'])[1 + (car_id + n) %% 7],
+           (car_id * 7919) %% 200000, current_date - ((car_id * n) %% 365)
+    FROM cars CROSS JOIN generate_series(1, %(errors_per_car)s) AS n
+    """,
+]
+
+
+class Scenario:
+    """One route under load: how to build the i-th request from the seeded data."""
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build  # (fixtures, i) -> (method, path, body) or None when out of fixtures
+
+
+def car_payload(i):
+    return {
+        "make": random.choice(["Toyota", "Ford", "Honda"]), "model": "Bench", "year": 2010 + i % 14,
+        "mileage": 10000 + i, "last_oil_change": "2025-01-15", "purchase_date": "2019-06-01",
+    }
+
+
+def _take(fixtures, key):
+    with fixtures["lock"]:
+        return fixtures[key].pop() if fixtures[key] else None
+
+
+def _delete_request(fixtures, i):
+    car = _take(fixtures, "deletable")
+    return ("DELETE", f"/{ENV}/user/{car[0]}/car/{car[1]}", None) if car else None
+
+
+def _random_user(fixtures):
+    return random.choice(fixtures["users"])
+
+
+def _update_request(fixtures, i):
+    user_uuid, car_id = random.choice(fixtures["cars"])
+    return "PUT", f"/{ENV}/user/{user_uuid}/car/{car_id}/details", {"mileage": 20000 + i}
+
+
+SCENARIOS = [
+    Scenario("get_user_cars", lambda f, i: ("GET", f"/{ENV}/user/{_random_user(f)}/cars", None)),
+    Scenario("add_user_car", lambda f, i: ("POST", f"/{ENV}/user/{_random_user(f)}/car/add_user_car", car_payload(i))),
+    Scenario("update_car_details", _update_request),
+    Scenario("delete_user_car", _delete_request),
+    Scenario("create_fake_user", lambda f, i: ("POST", f"/{ENV}/create_fake_user", None)),
+    Scenario("maintenance_forecast", lambda f, i: ("GET", f"/{ENV}/user/{_random_user(f)}/maintenance_forecast", None)),
+    Scenario("fleet_dtc_search", lambda f, i: ("GET", f"/{ENV}/fleet/dtc_search?codes=P0128&limit=100", None)),
+]
+
+
+class TemporaryCluster:
+    """A throwaway PostgreSQL cluster in a temp directory, listening on a unix socket only."""
+
+    def __init__(self, pg_bin=None):
+        self.pg_bin = pg_bin
+        self.directory = tempfile.mkdtemp(prefix='bench_pg_')
+        self.data_dir = os.path.join(self.directory, 'data')
+
+    def _bin(self, name):
+        return os.path.join(self.pg_bin, name) if self.pg_bin else name
+
+    def start(self):
+        subprocess.run([self._bin('initdb'), '-D', self.data_dir, '-U', 'postgres', '-A', 'trust'],
+                       check=True, capture_output=True)
+        subprocess.run([self._bin('pg_ctl'), '-D', self.data_dir, '-w', '-l', os.path.join(self.directory, 'log'),
+                        '-o', f"-k {self.directory} -c listen_addresses='' -c fsync=off", 'start'],
+                       check=True, capture_output=True)
+        return {"DB_HOST": self.directory, "DB_PORT": "5432", "DB_USERNAME": "postgres", "DB_PASSWORD": ""}
+
+    def stop(self):
+        subprocess.run([self._bin('pg_ctl'), '-D', self.data_dir, '-m', 'immediate', 'stop'], capture_output=True)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def admin_connection(database='postgres'):
+    import psycopg2
+    conn = psycopg2.connect(host=os.environ.get('DB_HOST'), port=int(os.environ.get('DB_PORT', 5432)),
+                            user=os.environ.get('DB_USERNAME'), password=os.environ.get('DB_PASSWORD'),
+                            dbname=database)
+    conn.autocommit = True
+    return conn
+
+
+def configure_database(routes):
+    """Point checkouts whose DB settings are module constants (no pool yet) at the bench database."""
+    if getattr(routes, 'pool', None) is None:
+        routes.DB_HOST = os.environ.get('DB_HOST')
+        routes.DB_PORT = int(os.environ.get('DB_PORT', 5432))
+        routes.DB_NAME = os.environ.get('DB_NAME')
+        routes.DB_USER = os.environ.get('DB_USERNAME')
+        routes.DB_PASSWORD = os.environ.get('DB_PASSWORD')
+
+
+def borrow_connection(routes):
+    """A connection from the app's pool, or a new one on checkouts that have no pool."""
+    pool = getattr(routes, 'pool', None)
+    return pool.getconn() if pool else routes.get_db_connection()
+
+
+def return_connection(routes, conn):
+    pool = getattr(routes, 'pool', None)
+    if pool:
+        pool.putconn(conn)
+    else:
+        conn.close()
+
+
+def seed(routes, users, cars_per_user, errors_per_car):
+    started = time.monotonic()
+    routes.create_schema()
+    conn = borrow_connection(routes)
+    try:
+        cursor = conn.cursor()
+        params = {"uuids": [str(uuid.uuid4()) for _ in range(users)],
+                  "cars_per_user": cars_per_user, "errors_per_car": errors_per_car}
+        for statement in SEED_STATEMENTS:
+            cursor.execute(statement, params)
+        conn.commit()
+        conn.autocommit = True
+        cursor.execute("VACUUM ANALYZE")
+        cursor.execute("SELECT c.user_uuid::text, c.car_id FROM cars c ORDER BY c.car_id")
+        cars = cursor.fetchall()
+    finally:
+        return_connection(routes, conn)
+    return cars, round(time.monotonic() - started, 2)
+
+
+def install_statement_counter(routes):
+    """Count every statement the app sends, per request, and return it in an X-Bench-Statements header.
+
+    Uses the app's own per-request metrics when it has them; older code gets a
+    counting cursor factory instead, set on the pool or, before pooling, on
+    every connection get_db_connection opens.
+    """
+    if hasattr(routes, 'metrics'):
+        # The bench reads the counts from the header, so skip the EMF lines
+        routes.metrics.METRICS_ENABLED = False
+
+        @routes.app.after_request
+        def report_statement_count(response):
+            record = routes.metrics.current()
+            response.headers['X-Bench-Statements'] = str(len(record.statement_ms) if record else 0)
+            return response
+        return
+
+    import psycopg2.extensions
+    local = threading.local()
+
+    class CountingCursor(psycopg2.extensions.cursor):
+        def execute(self, query, vars=None):
+            local.statements = getattr(local, 'statements', 0) + 1
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            local.statements = getattr(local, 'statements', 0) + 1
+            return super().executemany(query, vars_list)
+
+        def copy_expert(self, sql, file, size=8192):
+            local.statements = getattr(local, 'statements', 0) + 1
+            return super().copy_expert(sql, file, size)
+
+    pool = getattr(routes, 'pool', None)
+    if pool:
+        pool.connect_kwargs['cursor_factory'] = CountingCursor
+    else:
+        connect = routes.get_db_connection
+
+        def counting_connection():
+            conn = connect()
+            conn.cursor_factory = CountingCursor
+            return conn
+        routes.get_db_connection = counting_connection
+
+    @routes.app.before_request
+    def reset_statement_count():
+        local.statements = 0
+
+    @routes.app.after_request
+    def report_statement_count(response):
+        response.headers['X-Bench-Statements'] = str(getattr(local, 'statements', 0))
+        return response
+
+
+def run_scenario(port, scenario, fixtures, requests, concurrency):
+    latencies, statements, statuses = [], [], Counter()
+    record = threading.Lock()
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            request = scenario.build(fixtures, i)
+            if request is None:
+                break
+            method, path, body = request
+            payload = json.dumps(body) if body is not None else None
+            headers = {"Content-Type": "application/json"} if payload else {}
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status, count = response.status, int(response.getheader('X-Bench-Statements', 0))
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                status, count = 'connection_error', 0
+            elapsed = (time.perf_counter() - started) * 1000
+            with record:
+                latencies.append(elapsed)
+                statements.append(count)
+                statuses[status] += 1
+        connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(client) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    if not latencies:
+        return {"requests": 0}
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / wall, 1),
+        **summarize(latencies),
+        "statements_per_request": round(sum(statements) / len(statements), 2),
+        "max_statements": max(statements),
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+def count_asgi_statements(asgi_app, metrics):
+    """Wrap the ASGI app so natively served requests also report X-Bench-Statements."""
+    async def counted(scope, receive, send):
+        async def send_with_count(message):
+            record = metrics.current()
+            if message['type'] == 'http.response.start' and record is not None:
+                headers = list(message.get('headers', [])) + [(b"x-bench-statements", str(len(record.statement_ms)).encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+        await asgi_app(scope, receive, send_with_count)
+    return counted
+
+
+def serve(code_dir, ready, server_kind='flask'):
+    """Child process: serve the app with statement counting, reporting the port through `ready`."""
+    sys.path.insert(0, code_dir)
+    import logging
+    import routes
+    # Per-request application and access logs would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    configure_database(routes)
+    install_statement_counter(routes)
+
+    if server_kind == 'asgi':
+        import socket
+        import uvicorn
+        import asgi_app
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(128)  # queue clients until uvicorn starts accepting
+        ready.put(sock.getsockname()[1])
+        config = uvicorn.Config(count_asgi_statements(asgi_app.app, routes.metrics),
+                                log_level='warning', access_log=False)
+        uvicorn.Server(config).run(sockets=[sock])
+        return
+
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, routes.app, threaded=True)
+    ready.put(server.port)
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--cars-per-user', type=int, default=3)
+    parser.add_argument('--errors-per-car', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000, help="requests per route")
+    parser.add_argument('--routes', default=','.join(s.name for s in SCENARIOS), help="comma separated subset")
+    parser.add_argument('--output', default='bench_routes_results.json')
+    parser.add_argument('--code-dir', default=CODE_DIR, help="checkout of code_and_queries to benchmark")
+    parser.add_argument('--initdb', action='store_true', help="start a temporary cluster instead of using DB_HOST")
+    parser.add_argument('--pg-bin', help="directory holding initdb and pg_ctl")
+    parser.add_argument('--keep-database', action='store_true')
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask',
+                        help="threaded Flask dev server, or asgi_app under uvicorn")
+    args = parser.parse_args()
+    code_dir = os.path.abspath(args.code_dir)
+
+    cluster = None
+    if args.initdb:
+        cluster = TemporaryCluster(args.pg_bin)
+        os.environ.update(cluster.start())
+
+    database = f"bench_{uuid.uuid4().hex[:8]}"
+    admin = admin_connection()
+    admin.cursor().execute(f"CREATE DATABASE {database}")
+    # routes and db_pool read their configuration at import time
+    os.environ.update({
+        "DB_NAME": database, "ENVIRONMENT": ENV,
+        "DB_POOL_MAX_SIZE": str(args.concurrency + 2), "DB_POOL_TIMEOUT": "60",
+        "GARAGE_CACHE_ENABLED": os.environ.get('GARAGE_CACHE_ENABLED', 'false'),
+        "LAMBDA_LOG_SAMPLE_RATE": "0",
+    })
+
+    server = None
+    try:
+        sys.path.insert(0, code_dir)
+        import logging
+        import routes
+        logging.getLogger().setLevel(logging.WARNING)
+        configure_database(routes)
+        cars, seed_seconds = seed(routes, args.users, args.cars_per_user, args.errors_per_car)
+        if getattr(routes, 'pool', None):
+            routes.pool.closeall()
+        print(f"Seeded {args.users} users, {len(cars)} cars into {database} in {seed_seconds}s", file=sys.stderr)
+
+        # The app runs in its own process so the load-generating threads do not share its GIL
+        context = multiprocessing.get_context('spawn')
+        ready = context.Queue()
+        server = context.Process(target=serve, args=(code_dir, ready, args.server), daemon=True)
+        server.start()
+        port = ready.get(timeout=60)
+
+        shuffled = random.sample(cars, len(cars))
+        fixtures = {
+            "lock": threading.Lock(),
+            "users": sorted({user for user, _ in cars}),
+            "cars": cars,
+            # Deletes consume cars, so they get their own slice of the fleet
+            "deletable": shuffled[:min(len(shuffled) // 2, args.requests)],
+        }
+        selected = set(args.routes.split(','))
+        results = {}
+        for scenario in SCENARIOS:
+            if scenario.name not in selected:
+                continue
+            results[scenario.name] = run_scenario(port, scenario, fixtures, args.requests, args.concurrency)
+            summary = results[scenario.name]
+            print(f"{scenario.name:22} {summary.get('throughput_rps', 0):>8} req/s  "
+                  f"p50 {summary.get('p50_ms', 0):>7} ms  p95 {summary.get('p95_ms', 0):>7} ms  "
+                  f"p99 {summary.get('p99_ms', 0):>7} ms  {summary.get('statements_per_request', 0):>5} stmts/req",
+                  file=sys.stderr)
+
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        connection.request('GET', f"/{ENV}/db_pool_stats")
+        response = connection.getresponse()
+        pool_stats = json.loads(response.read()).get('data') if response.status == 200 else None
+
+        report = {
+            "commit": git_commit(cwd=code_dir),
+            "code_dir": code_dir,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "scale": {"users": args.users, "cars_per_user": args.cars_per_user,
+                      "errors_per_car": args.errors_per_car, "cars": len(cars)},
+            "server": args.server,
+            "concurrency": args.concurrency,
+            "requests_per_route": args.requests,
+            "seed_seconds": seed_seconds,
+            "pool": pool_stats,
+            "routes": results,
+        }
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    finally:
+        if server:
+            server.terminate()
+            server.join()
+        if not args.keep_database:
+            admin.cursor().execute(f"DROP DATABASE IF EXISTS {database} WITH (FORCE)")
+        admin.close()
+        if cluster:
+            cluster.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Per-row CPU cost of rendering get_user_cars and the car write responses.
+
+Compares, for garages of several sizes:
+  python_rows  tuples fetched and shaped in Python (format_car_row + Flask's
+               default encoder), as get_user_cars did before
+  db_json      the car array rendered by Postgres (json_agg-style) and spliced
+               into the response body, as it does now
+and, without a database, the encoding of car write responses (insert/update
+RETURNING rows) with the isoformat loop + Flask's encoder versus the app's
+JSON provider (orjson when installed).
+
+CPU time is this process's (time.process_time), i.e. the handler's share;
+wall time includes the database. Needs a reachable database (DB_HOST etc.).
+
+    python bench_serialization.py [--sizes 10,100,1000,5000] [--iterations 50]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+from datetime import date, datetime, timedelta
+from harness import summarize, git_commit
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code_and_queries')
+# Cars inserted per statement when seeding a garage
+SEED_BATCH = 1000
+
+
+def measure(render, iterations):
+    """Wall-time summary and mean CPU milliseconds per call of render()."""
+    wall, cpu = [], 0.0
+    for _ in range(iterations):
+        started, started_cpu = time.perf_counter(), time.process_time()
+        render()
+        cpu += time.process_time() - started_cpu
+        wall.append((time.perf_counter() - started) * 1000)
+    return summarize(wall), cpu * 1000 / iterations
+
+
+def seed_garage(routes, size):
+    """A new user with `size` cars, all detail columns filled."""
+    user_uuid = uuid.uuid4()
+    conn = routes.get_db_connection()
+    try:
+        conn.cursor().execute("INSERT INTO users (uuid, email, location) VALUES (%s, %s, %s)",
+                              (user_uuid, f"bench-{user_uuid.hex[:8]}@example.com", "bench"))
+        conn.commit()
+    finally:
+        routes.release_db_connection(conn)
+    base = date(2020, 1, 1)
+    cars = [{"make": "Toyota", "model": "Corolla", "year": 2015, "mileage": 90000 + i,
+             "last_maintenance_checkup": str(base + timedelta(days=i % 300)),
+             "last_oil_change": str(base + timedelta(days=i % 200)),
+             "purchase_date": str(base - timedelta(days=i % 900)),
+             "last_brake_pad_change": str(base + timedelta(days=i % 100))} for i in range(size)]
+    for start in range(0, size, SEED_BATCH):
+        result = routes.create_cars_for_user(user_uuid, cars[start:start + SEED_BATCH])
+        assert result["created"], result
+    return user_uuid
+
+
+def drop_user(routes, user_uuid):
+    conn = routes.get_db_connection()
+    try:
+        conn.cursor().execute("DELETE FROM users WHERE uuid = %s", (user_uuid,))
+        conn.commit()
+    finally:
+        routes.release_db_connection(conn)
+
+
+def python_rows(routes, encoder, user_uuid):
+    """get_user_cars as it was rendered before: tuples -> dicts -> Flask's default encoder."""
+    fields = list(routes.CAR_COLUMNS)
+    conn = routes.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        query, params = routes.build_user_cars_query(fields)
+        cursor.execute(query, [user_uuid] + params)
+        cars = [routes.format_car_row(fields, row) for row in cursor.fetchall()]
+    finally:
+        routes.release_db_connection(conn)
+    return (encoder.dumps({"status": "success", "data": cars}, separators=(",", ":")) + "\n").encode('utf-8')
+
+
+def db_json(routes, user_uuid):
+    data, _ = routes.get_user_cars_json(user_uuid)
+    return routes.serialization.splice({"status": "success"}, data=data)
+
+
+def write_rows(size):
+    """Rows shaped like the car_details RETURNING rows of the write endpoints."""
+    now = datetime(2024, 5, 6)
+    return [{"car_id": i, "detail_id": i, "make": "Toyota", "model": "Corolla", "year": 2015, "mileage": 90000 + i,
+             "last_maintenance_checkup": now.date(), "last_oil_change": now.date(),
+             "purchase_date": now.date(), "last_brake_pad_change": None} for i in range(size)]
+
+
+def isoformat_loop(encoder, rows):
+    """Write responses as they were rendered before: convert dates in Python, then encode."""
+    data = []
+    for row in rows:
+        row = dict(row)
+        for key, value in row.items():
+            if isinstance(value, (date, datetime)):
+                row[key] = value.isoformat()
+        data.append(row)
+    return encoder.dumps({"status": "success", "data": data}, separators=(",", ":"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,5000')
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    sys.path.insert(0, CODE_DIR)
+    import logging
+    import routes
+    from flask.json.provider import DefaultJSONProvider
+    logging.getLogger().handlers[:] = [logging.StreamHandler(open(os.devnull, 'w'))]
+    routes.metrics.METRICS_ENABLED = False
+    legacy_encoder = DefaultJSONProvider(routes.app)
+
+    results = {"commit": git_commit(), "orjson": routes.serialization.orjson is not None,
+               "iterations": args.iterations, "get_user_cars": {}, "write_responses": {}}
+    for size in sizes:
+        user_uuid = seed_garage(routes, size)
+        try:
+            assert json.loads(db_json(routes, user_uuid))["data"] == \
+                json.loads(python_rows(routes, legacy_encoder, user_uuid))["data"]
+            for name, render in (("python_rows", lambda: python_rows(routes, legacy_encoder, user_uuid)),
+                                 ("db_json", lambda: db_json(routes, user_uuid))):
+                render()  # warm the pool and plan cache
+                wall, cpu_ms = measure(render, args.iterations)
+                results["get_user_cars"][f"{name}/{size}"] = {
+                    **wall, "cpu_ms": round(cpu_ms, 3), "cpu_us_per_row": round(cpu_ms * 1000 / size, 3)}
+        finally:
+            drop_user(routes, user_uuid)
+
+        rows = write_rows(size)
+        for name, render in (("isoformat_loop", lambda: isoformat_loop(legacy_encoder, rows)),
+                             ("json_provider", lambda: routes.app.json.dumps({"status": "success", "data": rows}))):
+            wall, cpu_ms = measure(render, args.iterations)
+            results["write_responses"][f"{name}/{size}"] = {
+                "cpu_ms": round(cpu_ms, 3), "cpu_us_per_row": round(cpu_ms * 1000 / size, 3)}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import os
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from telemetry import accepted_mask
+
+logger = logging.getLogger()
+
+# Fold uploads into per-car anomaly state and flag anomalies on ingest
+ANOMALY_DETECTION_ENABLED = os.environ.get('ANOMALY_DETECTION_ENABLED', 'true').lower() == 'true'
+# Weight of the newest reading in the EWMA mean and variance of coolant temperature
+COOLANT_EWMA_ALPHA = 0.05
+# Readings a car needs before deviations from its own baseline are flagged
+COOLANT_WARMUP_READINGS = 30
+# Deviation from the baseline, in EWMA standard deviations, that is flagged
+COOLANT_ZSCORE_THRESHOLD = 4.0
+# Floor on the standard deviation, so a very steady engine is not flagged for a change of a degree or two
+COOLANT_MIN_STD_C = 2.0
+# Flagged as overheating whatever the car's baseline
+COOLANT_OVERHEAT_C = 115.0
+# A DTC is new if the car has not reported it, by telemetry or error event, within this many days
+DTC_NOVELTY_DAYS = 90
+# Readings per step of the EWMA scan; bounds (1 - alpha) ** -k so the closed form stays finite
+SCAN_BLOCK = 256
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+# Current state of every car in an upload, plus the codes of its recent error
+# events, in car_id order (a car without state yet comes back with NULLs)
+LOAD_ANOMALY_STATE = """
+SELECT c.car_id,
+       s.coolant_mean,
+       s.coolant_var,
+       s.coolant_count,
+       s.coolant_anomalous,
+       s.dtc_last_seen,
+       ARRAY(
+           SELECT DISTINCT e.code FROM error_event_codes e
+           WHERE e.car_id = c.car_id AND e.occurrence_date >= %(events_since)s
+       ) AS event_codes
+FROM unnest(%(car_ids)s::integer[]) AS c(car_id)
+LEFT JOIN car_anomaly_state s ON s.car_id = c.car_id
+ORDER BY c.car_id
+"""
+
+# Writes the new state of every car in an upload and the anomalies it flagged,
+# bumping the owner's garage version when there are any (get_user_cars shows them)
+SAVE_ANOMALY_DETECTION = """
+WITH state AS (
+    INSERT INTO car_anomaly_state
+        (car_id, coolant_mean, coolant_var, coolant_count, coolant_anomalous, dtc_last_seen, updated_at)
+    SELECT t.*, now()
+    FROM unnest(%(car_id)s::integer[], %(coolant_mean)s::double precision[], %(coolant_var)s::double precision[],
+                %(coolant_count)s::integer[], %(coolant_anomalous)s::boolean[], %(dtc_last_seen)s::jsonb[])
+        AS t(car_id, coolant_mean, coolant_var, coolant_count, coolant_anomalous, dtc_last_seen)
+    ON CONFLICT (car_id) DO UPDATE SET
+        coolant_mean = EXCLUDED.coolant_mean,
+        coolant_var = EXCLUDED.coolant_var,
+        coolant_count = EXCLUDED.coolant_count,
+        coolant_anomalous = EXCLUDED.coolant_anomalous,
+        dtc_last_seen = EXCLUDED.dtc_last_seen,
+        updated_at = EXCLUDED.updated_at
+),
+found AS (
+    INSERT INTO car_anomalies (car_id, kind, recorded_at, coolant_temp_c, expected_c, zscore, dtc)
+    SELECT *
+    FROM unnest(%(anomaly_car_id)s::integer[], %(kind)s::varchar[], %(recorded_at)s::timestamptz[],
+                %(coolant_temp_c)s::real[], %(expected_c)s::real[], %(zscore)s::real[], %(dtc)s::varchar[])
+    RETURNING car_id
+)
+UPDATE users SET garage_version = garage_version + 1
+WHERE uuid = %(user_uuid)s AND EXISTS (SELECT 1 FROM found)
+"""
+
+
+def load_params(car_ids, now_ms):
+    """Parameters of LOAD_ANOMALY_STATE for the (sorted) car ids of an upload."""
+    today = datetime.fromtimestamp(now_ms / 1000.0, timezone.utc).date()
+    return {"car_ids": list(car_ids), "events_since": today - timedelta(days=DTC_NOVELTY_DAYS)}
+
+
+def parse_states(rows):
+    """Unpack LOAD_ANOMALY_STATE rows into one array (or list) per state column."""
+    return {
+        "car_id": np.array([row[0] for row in rows], dtype=np.int64),
+        "coolant_mean": np.array([np.nan if row[1] is None else row[1] for row in rows], dtype=np.float64),
+        "coolant_var": np.array([row[2] or 0.0 for row in rows], dtype=np.float64),
+        "coolant_count": np.array([row[3] or 0 for row in rows], dtype=np.int64),
+        "coolant_anomalous": np.array([bool(row[4]) for row in rows], dtype=bool),
+        "dtc_last_seen": [dict(row[5] or {}) for row in rows],
+        "event_codes": [set(row[6]) for row in rows],
+    }
+
+
+def _ewm_scan(u, decay, initial, first):
+    """y[i] = decay * y[i-1] + u[i] along runs of rows, where a run starts at each `first`
+    row with y[i-1] = initial[i].
+
+    Each block of SCAN_BLOCK rows is evaluated in closed form, so the Python loop
+    runs once per block rather than once per reading.
+    """
+    y = np.empty(len(u))
+    carry = 0.0
+    for start in range(0, len(u), SCAN_BLOCK):
+        block = slice(start, start + SCAN_BLOCK)
+        restart = first[block]
+        j = np.arange(len(restart))
+        # Row (within the block) at which each row's run starts
+        run = np.maximum.accumulate(np.where(restart, j, 0))
+        sums = np.cumsum(u[block] * decay ** -j)
+        local = (sums - np.where(run > 0, sums[run - 1], 0.0)) * decay ** j
+        # Value before the run: its car's initial value, or the last one of the previous block
+        before = np.where(restart[run], initial[block][run], carry)
+        y[block] = local + decay ** (j - run + 1) * before
+        carry = y[block][-1]
+    return y
+
+
+def _shift(values, first, initial):
+    """values[i - 1] within each run, initial[i] on the first row of a run."""
+    previous = np.empty_like(values)
+    previous[1:] = values[:-1]
+    return np.where(first, initial, previous)
+
+
+def _timestamp(ms):
+    return datetime.fromtimestamp(int(ms) / 1000.0, timezone.utc).isoformat()
+
+
+def _detect_coolant(states, car, recorded_ms, coolant, anomalies):
+    """Update the coolant EWMA of every car and flag the readings that start an excursion."""
+    has_coolant = ~np.isnan(coolant)
+    order = np.lexsort((recorded_ms[has_coolant], car[has_coolant]))
+    car, recorded_ms, x = car[has_coolant][order], recorded_ms[has_coolant][order], coolant[has_coolant][order]
+    if not len(x):
+        return
+    n = len(x)
+    first = np.ones(n, dtype=bool)
+    first[1:] = car[1:] != car[:-1]
+    last = np.ones(n, dtype=bool)
+    last[:-1] = first[1:]
+    run_start = np.maximum.accumulate(np.where(first, np.arange(n), 0))
+
+    # A car without a baseline starts from its first reading
+    mean0 = states["coolant_mean"][car]
+    mean0 = np.where(np.isnan(mean0), x[run_start], mean0)
+    var0 = states["coolant_var"][car]
+    decay = 1.0 - COOLANT_EWMA_ALPHA
+
+    mean = _ewm_scan(COOLANT_EWMA_ALPHA * x, decay, mean0, first)
+    expected = _shift(mean, first, mean0)
+    deviation = x - expected
+    # Incremental EWMA variance: var = decay * (var + alpha * deviation ** 2)
+    var = _ewm_scan(COOLANT_EWMA_ALPHA * decay * deviation ** 2, decay, var0, first)
+    count = states["coolant_count"][car] + (np.arange(n) - run_start)
+
+    zscore = deviation / np.maximum(np.sqrt(_shift(var, first, var0)), COOLANT_MIN_STD_C)
+    anomalous = (((count >= COOLANT_WARMUP_READINGS) & (np.abs(zscore) >= COOLANT_ZSCORE_THRESHOLD))
+                 | (x >= COOLANT_OVERHEAT_C))
+    # One anomaly per excursion, not one per reading while it lasts
+    onset = anomalous & ~_shift(anomalous, first, states["coolant_anomalous"][car])
+
+    states["coolant_mean"][car[last]] = mean[last]
+    states["coolant_var"][car[last]] = var[last]
+    states["coolant_count"][car[last]] = count[last] + 1
+    states["coolant_anomalous"][car[last]] = anomalous[last]
+
+    for i in np.flatnonzero(onset):
+        anomalies.append({
+            "car_id": int(states["car_id"][car[i]]),
+            "kind": "coolant_temp",
+            "recorded_at": _timestamp(recorded_ms[i]),
+            "coolant_temp_c": float(x[i]),
+            "expected_c": round(float(expected[i]), 2),
+            "zscore": round(float(zscore[i]), 2),
+            "dtc": None,
+        })
+
+
+def _detect_new_dtcs(states, car, recorded_ms, dtcs, now_ms, anomalies):
+    """Flag the first report of a code the car has not had recently, and remember when each code was seen."""
+    reported = [(i, code) for i, codes in enumerate(dtcs) for code in codes]
+    window_ms = DTC_NOVELTY_DAYS * MS_PER_DAY
+    if reported:
+        rows = np.array([i for i, _ in reported], dtype=np.int64)
+        codes = np.array([code for _, code in reported])
+        order = np.lexsort((recorded_ms[rows], codes, car[rows]))
+        car, codes, recorded_ms = car[rows][order], codes[order], recorded_ms[rows][order]
+        first = np.ones(len(codes), dtype=bool)
+        first[1:] = (car[1:] != car[:-1]) | (codes[1:] != codes[:-1])
+        last = np.ones(len(codes), dtype=bool)
+        last[:-1] = first[1:]
+
+        # One iteration per distinct (car, code) in the upload
+        for position, code, first_ms, last_ms in zip(car[first], codes[first], recorded_ms[first], recorded_ms[last]):
+            code = str(code)
+            last_seen = states["dtc_last_seen"][position]
+            previous = last_seen.get(code)
+            if code not in states["event_codes"][position] and (previous is None or previous < first_ms - window_ms):
+                anomalies.append({
+                    "car_id": int(states["car_id"][position]),
+                    "kind": "new_dtc",
+                    "recorded_at": _timestamp(first_ms),
+                    "coolant_temp_c": None,
+                    "expected_c": None,
+                    "zscore": None,
+                    "dtc": code,
+                })
+            last_seen[code] = max(previous or 0, int(last_ms))
+
+    # Forget codes that are no longer recent, so the state stays small
+    cutoff = now_ms - window_ms
+    for last_seen in states["dtc_last_seen"]:
+        for code in [code for code, ms in last_seen.items() if ms < cutoff]:
+            del last_seen[code]
+
+
+def detect(batch, states, now_ms=None):
+    """Fold the accepted readings of a telemetry batch into `states` and return the anomalies found.
+
+    Readings are applied in recorded_at order per car. `states` (from
+    parse_states) must hold every car of the accepted readings and is updated
+    in place.
+    """
+    if now_ms is None:
+        now_ms = datetime.now(timezone.utc).timestamp() * 1000.0
+    mask = accepted_mask(batch)
+    car = np.searchsorted(states["car_id"], batch["car_id"][mask])
+    recorded_ms = batch["recorded_ms"][mask]
+
+    anomalies = []
+    _detect_coolant(states, car, recorded_ms, batch["coolant_temp_c"][mask], anomalies)
+    _detect_new_dtcs(states, car, recorded_ms, [batch["dtcs"][i] for i in np.flatnonzero(mask)], now_ms, anomalies)
+    anomalies.sort(key=lambda anomaly: (anomaly["car_id"], anomaly["recorded_at"]))
+    return anomalies
+
+
+def save_params(user_uuid, states, anomalies):
+    """Parameters of SAVE_ANOMALY_DETECTION."""
+    return {
+        "user_uuid": user_uuid,
+        "car_id": states["car_id"].tolist(),
+        "coolant_mean": [None if np.isnan(mean) else mean for mean in states["coolant_mean"].tolist()],
+        "coolant_var": states["coolant_var"].tolist(),
+        "coolant_count": states["coolant_count"].tolist(),
+        "coolant_anomalous": states["coolant_anomalous"].tolist(),
+        "dtc_last_seen": [json.dumps(last_seen, sort_keys=True) for last_seen in states["dtc_last_seen"]],
+        "anomaly_car_id": [anomaly["car_id"] for anomaly in anomalies],
+        "kind": [anomaly["kind"] for anomaly in anomalies],
+        "recorded_at": [anomaly["recorded_at"] for anomaly in anomalies],
+        "coolant_temp_c": [anomaly["coolant_temp_c"] for anomaly in anomalies],
+        "expected_c": [anomaly["expected_c"] for anomaly in anomalies],
+        "zscore": [anomaly["zscore"] for anomaly in anomalies],
+        "dtc": [anomaly["dtc"] for anomaly in anomalies],
+    }
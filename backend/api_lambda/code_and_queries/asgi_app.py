@@ -0,0 +1,307 @@
+"""ASGI entry point for the long-lived container deployment.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 80      (or: python asgi_app.py)
+
+The database-bound hot routes run on the event loop with psycopg 3 and an async
+connection pool, so one process keeps many requests in flight while they wait
+on Postgres. Every other route, and any request a native handler declines,
+goes to the Flask app on a thread pool, so routes and JSON contracts are those
+of routes.py. SQL, argument parsing and response shaping are shared with
+routes.py; Lambda keeps using routes.lambda_handler. Its extra dependencies are
+in requirements-asgi.txt, which the Lambda image does not install.
+"""
+import os
+import json
+import time
+import logging
+import traceback
+from urllib.parse import parse_qsl
+from a2wsgi import WSGIMiddleware
+from psycopg_pool import AsyncConnectionPool
+from werkzeug.http import parse_etags, quote_etag
+
+import db_pool
+import metrics
+import fast_path
+import routes
+from routes import json_body
+from sql_queries import SELECT_GARAGE_VERSION, SELECT_USER_CAR_HEALTH, DELETE_USER_CAR
+from response_cache import garage_cache
+
+logger = logging.getLogger()
+
+# Connections held by the async pool; requests beyond that wait on the pool, not on a thread
+ASYNC_DB_POOL_MIN_SIZE = int(os.environ.get('ASYNC_DB_POOL_MIN_SIZE', 2))
+ASYNC_DB_POOL_MAX_SIZE = int(os.environ.get('ASYNC_DB_POOL_MAX_SIZE', 20))
+# Threads running the Flask app; each holds a connection from db_pool while it works
+WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', db_pool.DB_POOL_MAX_SIZE))
+
+# Opened and closed by the ASGI lifespan events. Every native route runs a
+# single statement (the writes are single-statement CTEs), so autocommit saves
+# the COMMIT round trip without changing what is atomic.
+pool = AsyncConnectionPool(
+    kwargs={
+        "host": db_pool.DB_HOST,
+        "dbname": db_pool.DB_NAME,
+        "user": db_pool.DB_USER,
+        "password": db_pool.DB_PASSWORD,
+        "port": db_pool.DB_PORT,
+        "autocommit": True,
+    },
+    min_size=ASYNC_DB_POOL_MIN_SIZE,
+    max_size=ASYNC_DB_POOL_MAX_SIZE,
+    timeout=db_pool.DB_POOL_TIMEOUT,
+    max_lifetime=db_pool.DB_POOL_MAX_LIFETIME,
+    open=False,
+)
+
+router = fast_path.Router(f"/{routes.ENV}")
+
+# json_payload result when Flask's request.get_json() would reject the body
+NOT_JSON = object()
+
+
+async def execute(query, params):
+    """Run one statement on a pooled connection; returns (rows, column names)."""
+    started = time.perf_counter()
+    async with pool.connection() as conn:
+        connected = time.perf_counter()
+        metrics.record_connect((connected - started) * 1000)
+        try:
+            cursor = await conn.execute(query, params)
+            rows = await cursor.fetchall() if cursor.description else []
+        finally:
+            metrics.record_statement(query, (time.perf_counter() - connected) * 1000)
+    metrics.record_rows(len(rows))
+    return rows, [column.name for column in cursor.description or ()]
+
+
+def json_payload(req):
+    """The request's JSON body, or NOT_JSON when it is missing, malformed or not declared as JSON.
+
+    Those requests are handed to Flask so they get its exact error responses.
+    """
+    mimetype = req.headers.get('content-type', '').split(';')[0].strip().lower()
+    if mimetype != 'application/json' and not (mimetype.startswith('application/') and mimetype.endswith('+json')):
+        return NOT_JSON
+    try:
+        return json.loads(req.body)
+    except ValueError:
+        return NOT_JSON
+
+
+@router.route('GET', '/health')
+async def health_check(req):
+    logger.info("Health check endpoint accessed")
+    return 200, json_body({"status": "healthy"}), {}
+
+
+@router.route('GET', '/user/<uuid:user_uuid>/cars')
+async def get_user_cars(req, user_uuid):
+    if req.query.get('stream', '').lower() in ('1', 'true'):
+        return None  # streamed by the Flask route
+    logger.info(f"Getting cars for user: {user_uuid}")
+    try:
+        status, body, etag = await render_user_cars(user_uuid, req.query, parse_etags(req.headers.get('if-none-match')))
+    except Exception as e:
+        logger.error(f"Error in get_user_cars endpoint: {str(e)}")
+        return 500, json_body({"status": "error", "message": str(e)}), {}
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag:
+        headers["ETag"] = quote_etag(etag)
+    return status, body, headers
+
+
+async def render_user_cars(user_uuid, args, if_none_match):
+    """routes.render_user_cars on the async pool."""
+    try:
+        fields, after, limit = routes.parse_user_cars_args(args)
+    except ValueError as e:
+        return 400, json_body({"status": "error", "message": str(e)}), None
+
+    rows, _ = await execute(SELECT_GARAGE_VERSION, (user_uuid,))
+    version = rows[0][0] if rows else None
+    variant = routes.user_cars_variant(fields, after, limit)
+    status, body, etag = routes.cached_user_cars(user_uuid, version, variant, if_none_match)
+    if status is not None:
+        return status, body, etag
+
+    rows, _ = await execute(*routes.build_user_cars_json_query(user_uuid, fields, after, limit))
+    data, next_cursor = routes.user_cars_page(rows[0], limit)
+    body = routes.user_cars_body(data, next_cursor, limit)
+    if version is not None:
+        garage_cache.put(user_uuid, variant, version, body)
+    return 200, body, etag
+
+
+@router.route('GET', '/user/<uuid:user_uuid>/car_health')
+async def get_car_health(req, user_uuid):
+    logger.info(f"Fetching car health for user: {user_uuid}")
+    try:
+        rows, columns = await execute(SELECT_USER_CAR_HEALTH, (user_uuid,))
+        health = [routes.format_car_row(columns, row) for row in rows]
+        return 200, json_body({"status": "success", "data": health}), {}
+    except Exception as e:
+        logger.error(f"Error in get_car_health endpoint: {str(e)}")
+        return 500, json_body({"status": "error", "message": str(e)}), {}
+
+
+@router.route('POST', '/user/<uuid:user_uuid>/car/add_user_car')
+async def add_user_car(req, user_uuid):
+    car_data = json_payload(req)
+    if car_data is NOT_JSON:
+        return None
+    logger.info(f"Received request to add car for user: {user_uuid}")
+    if not car_data:
+        logger.warning("Add car request received without JSON body")
+        return 400, json_body({"status": "error", "message": "Missing car data in request body"}), {}
+
+    try:
+        rows, columns = await execute(*routes.build_car_insert(user_uuid, car_data))
+        if not rows:
+            logger.warning(f"Failed to add car for user {user_uuid}: User not found")
+            return 404, json_body({"status": "error", "message": "User not found"}), {}
+        garage_cache.invalidate_user(user_uuid)
+        # Drop the leading `ord` column
+        new_car_details = dict(zip(columns[1:], rows[0][1:]))
+        logger.info(f"Successfully added car for user {user_uuid}. Car ID: {new_car_details['car_id']}")
+        return 201, json_body({"status": "success", "message": "Car added successfully", "data": new_car_details}), {}
+    except Exception as e:
+        logger.error(f"Unexpected error in add_user_car endpoint for user {user_uuid}: {str(e)}")
+        return 500, json_body({"status": "error", "message": "An internal error occurred"}), {}
+
+
+@router.route('PUT', '/user/<uuid:user_uuid>/car/<int:car_id>/details')
+async def update_car_details(req, user_uuid, car_id):
+    update_data = json_payload(req)
+    if update_data is NOT_JSON:
+        return None
+    logger.info(f"Updating details for car {car_id} owned by user: {user_uuid}")
+    try:
+        if not update_data:
+            return 400, json_body({"status": "error", "message": "No update data provided"}), {}
+        if routes.coalesce_requested(req.query):
+            try:
+                query, params = routes.build_mileage_queue(user_uuid, car_id, update_data)
+            except ValueError as e:
+                return 400, json_body({"status": "error", "message": str(e)}), {}
+            rows, _ = await execute(query, params)
+            status, body = routes.queued_mileage_response(car_id, rows[0] if rows else None)
+            if status == 202:
+                garage_cache.invalidate_user(user_uuid)
+            return status, json_body(body), {}
+
+        upsert = routes.build_car_details_upsert(user_uuid, car_id, update_data)
+        if upsert is None:
+            return 404, json_body({"status": "error", "message": "No valid fields to update"}), {}
+
+        rows, columns = await execute(*upsert)
+        if not rows:
+            return 404, json_body({"status": "error", "message": "Car not found or doesn't belong to this user"}), {}
+        garage_cache.invalidate_user(user_uuid)
+        return 200, json_body({"status": "success", "data": dict(zip(columns, rows[0]))}), {}
+    except Exception as e:
+        logger.error(f"Error in update_car_details endpoint: {str(e)}")
+        return 500, json_body({"status": "error", "message": str(e)}), {}
+
+
+@router.route('DELETE', '/user/<uuid:user_uuid>/car/<int:car_id>')
+async def delete_user_car(req, user_uuid, car_id):
+    logger.info(f"Deleting car {car_id} for user: {user_uuid}")
+    try:
+        rows, _ = await execute(DELETE_USER_CAR, {"car_id": car_id, "user_uuid": user_uuid})
+        if not rows:
+            logger.warning(f"Car {car_id} does not belong to user {user_uuid} or does not exist")
+            return 404, json_body({"status": "error", "message": "Car not found or doesn't belong to this user"}), {}
+        garage_cache.invalidate_user(user_uuid)
+        logger.info(f"Successfully deleted car {car_id} for user {user_uuid}")
+        return 200, json_body({"status": "success", "message": f"Car {car_id} successfully deleted"}), {}
+    except Exception as e:
+        logger.error(f"Error in delete_user_car endpoint: {str(e)}")
+        return 500, json_body({"status": "error", "message": str(e)}), {}
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get('body', b"")
+        if not message.get('more_body'):
+            return body
+
+
+def replay(body, receive):
+    """A receive callable that yields the already-read body again, then defers to `receive`."""
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def replayed():
+        return pending.pop() if pending else await receive()
+    return replayed
+
+
+class AsyncApp:
+    """ASGI application: native async routes first, the Flask app for everything else."""
+
+    def __init__(self, router, wsgi_app):
+        self.router = router
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=WSGI_THREADS)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return  # no websocket routes
+
+        matched = self.router.match(scope['method'], scope['path'])
+        if matched is None:
+            return await self.wsgi(scope, receive, send)
+        rule, handler, params = matched
+
+        body = await read_body(receive)
+        query = {}
+        for key, value in parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True):
+            query.setdefault(key, value)  # first value wins, as with Flask's request.args.get
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        request = fast_path.FastRequest(scope['method'], scope['path'], query, headers, body)
+
+        metrics.begin(rule, scope['method'], owner='asgi')
+        try:
+            result = await handler(request, **params)
+        except Exception as e:
+            logger.error(f"Error in ASGI handler for {rule}: {str(e)}")
+            logger.error(traceback.format_exc())
+            result = 500, json_body({"error": str(e)}), {}
+        if result is None:
+            metrics.discard()
+            return await self.wsgi(scope, replay(body, receive), send)
+
+        status, response_body, response_headers = result
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(response_body)).encode())]
+                       + [(key.lower().encode('latin-1'), value.encode('latin-1'))
+                          for key, value in response_headers.items()],
+        })
+        await send({"type": "http.response.body", "body": response_body})
+        metrics.end(status, len(response_body))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Connections are opened in the background, like db_pool's lazy connects
+                await pool.open(wait=False)
+                await send({"type": "lifespan.startup.complete"})
+            elif message['type'] == 'lifespan.shutdown':
+                await pool.close()
+                db_pool.pool.closeall()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = AsyncApp(router, routes.app)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 80)))
@@ -0,0 +1,234 @@
+import os
+import time
+import logging
+import threading
+
+# psycopg2 is imported when the first connection is opened, so routes that never
+# touch the database (health, DTC decoding) do not load it on a cold start.
+psycopg2 = None
+
+logger = logging.getLogger()
+
+# Database configuration
+DB_HOST = os.environ.get('DB_HOST', "terraform-20250323164944761200000005.cnqq0meu6lwj.us-east-2.rds.amazonaws.com") # can change if the database is destroyed and re-deployed
+DB_NAME = os.environ.get('DB_NAME', "dev_db")
+DB_USER = os.environ.get('DB_USERNAME')
+DB_PASSWORD = os.environ.get('DB_PASSWORD')
+DB_PORT = int(os.environ.get('DB_PORT', 5432))
+
+# Pool configuration. A Lambda instance only serves one request at a time, so a
+# small pool is enough there; the container deployment can raise DB_POOL_MAX_SIZE.
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 4))
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Connections idle for longer than this are pinged before being handed out
+DB_POOL_HEALTHCHECK_AFTER = float(os.environ.get('DB_POOL_HEALTHCHECK_AFTER', 30))
+# Connections older than this are closed and replaced on their next checkout
+DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800))
+# Also run RESET ALL on returned connections (costs one round trip per request)
+DB_POOL_RESET_ON_RETURN = os.environ.get('DB_POOL_RESET_ON_RETURN', 'false').lower() == 'true'
+
+
+def _load_driver():
+    global psycopg2
+    if psycopg2 is None:
+        import psycopg2.extensions
+        import psycopg2.extras
+        psycopg2.extras.register_uuid()
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class ConnectionPool:
+    """Bounded pool of psycopg2 connections kept alive across warm invocations.
+
+    Connections are opened lazily, health-checked when they have been idle for
+    a while, and rolled back before being handed to the next caller.
+    """
+
+    def __init__(self, max_size=DB_POOL_MAX_SIZE, timeout=DB_POOL_TIMEOUT,
+                 healthcheck_after=DB_POOL_HEALTHCHECK_AFTER, max_lifetime=DB_POOL_MAX_LIFETIME,
+                 reset_on_return=DB_POOL_RESET_ON_RETURN, **connect_kwargs):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        self.max_lifetime = max_lifetime
+        self.reset_on_return = reset_on_return
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = []     # (conn, created_at, last_used_at), most recently used last
+        self._in_use = {}   # id(conn) -> (conn, created_at)
+        self._size = 0      # idle + in use + connections currently being opened
+        self._counters = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "reconnects": 0,
+            "waits": 0,
+            "timeouts": 0,
+        }
+
+    def getconn(self):
+        """Borrow a healthy connection, opening a new one if the pool has room."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                entry = self._reserve(deadline)
+
+            if entry is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                created_at = time.monotonic()
+            else:
+                conn, created_at, last_used_at = entry
+                if not self._is_healthy(conn, created_at, last_used_at):
+                    self._discard(conn)
+                    with self._cond:
+                        self._counters["reconnects"] += 1
+                    continue
+
+            with self._cond:
+                self._in_use[id(conn)] = (conn, created_at)
+                self._counters["checkouts"] += 1
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any open transaction."""
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            logger.warning("Connection returned to the pool was not checked out from it; closing it")
+            self._close(conn)
+            return
+
+        if discard or not self._reset(conn):
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, entry[1], time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        """Close every idle connection; connections in use are closed when returned."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Return a snapshot of pool occupancy and lifetime counters."""
+        with self._cond:
+            stats = {
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+            }
+            stats.update(self._counters)
+        return stats
+
+    def _reserve(self, deadline):
+        """Pop an idle connection, or claim a slot for a new one (returns None).
+
+        Must be called with the condition held.
+        """
+        waited = False
+        while True:
+            if self._idle:
+                return self._idle.pop()
+            if self._size < self.max_size:
+                self._size += 1
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._counters["timeouts"] += 1
+                raise PoolTimeoutError(f"No database connection available after {self.timeout}s")
+            if not waited:
+                self._counters["waits"] += 1
+                waited = True
+            self._cond.wait(remaining)
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _connect(self):
+        _load_driver()
+        logger.info(f"Opening new pooled DB connection to {self.connect_kwargs.get('host')}:{self.connect_kwargs.get('port')}")
+        try:
+            conn = psycopg2.connect(**self.connect_kwargs)
+        except Exception as e:
+            logger.error(f"Database connection error: {str(e)}")
+            raise
+        with self._cond:
+            self._counters["connections_opened"] += 1
+        return conn
+
+    def _is_healthy(self, conn, created_at, last_used_at):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if now - last_used_at < self.healthcheck_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Pooled DB connection failed health check, reconnecting: {str(e)}")
+            return False
+
+    def _reset(self, conn):
+        """Put a returned connection back into a clean state; False if it is unusable."""
+        if conn.closed:
+            return False
+        try:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                return False
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+            if self.reset_on_return:
+                conn.reset()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Could not reset pooled DB connection, discarding it: {str(e)}")
+            return False
+
+    def _discard(self, conn):
+        self._close(conn)
+        self._release_slot()
+
+    def _close(self, conn):
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"Error closing DB connection: {str(e)}")
+        with self._cond:
+            self._counters["connections_closed"] += 1
+
+
+# Module-level pool shared by every request served by this Lambda instance
+pool = ConnectionPool(
+    host=DB_HOST,
+    database=DB_NAME,
+    user=DB_USER,
+    password=DB_PASSWORD,
+    port=DB_PORT
+)
+
@@ -0,0 +1,139 @@
+import os
+import re
+import bisect
+import logging
+import threading
+from functools import lru_cache
+
+logger = logging.getLogger()
+
+# code<TAB>description per line, '#' comments; shipped next to this module
+DTC_CATALOG_PATH = os.environ.get(
+    'DTC_CATALOG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dtc_catalog.tsv')
+)
+# Largest number of codes resolved in one /dtc/decode call
+MAX_DECODE_BATCH = 500
+# Most catalog entries returned for one prefix
+MAX_PREFIX_RESULTS = 1000
+DECODE_CACHE_SIZE = 4096
+
+# Same shape the firmware accepts before reporting a code: P/C/B/U + 4 hex digits
+DTC_PATTERN = re.compile(r'^[PCBU][0-9A-F]{4}$')
+# A code prefix such as "P0", "P01" or "P01xx"; trailing x's are wildcards
+PREFIX_PATTERN = re.compile(r'^[PCBU][0-9A-F]{0,4}X*$')
+
+SYSTEMS = {"P": "powertrain", "C": "chassis", "B": "body", "U": "network"}
+# Subsystem named by the third character of generic powertrain codes
+POWERTRAIN_SUBSYSTEMS = {
+    "0": "fuel and air metering and auxiliary emission controls",
+    "1": "fuel and air metering",
+    "2": "fuel and air metering (injector circuit)",
+    "3": "ignition system or misfire",
+    "4": "auxiliary emission controls",
+    "5": "vehicle speed, idle control and auxiliary inputs",
+    "6": "computer and auxiliary outputs",
+    "7": "transmission",
+    "8": "transmission",
+    "9": "transmission",
+    "A": "hybrid propulsion",
+}
+
+_lock = threading.Lock()
+_index = None   # code -> description
+_codes = None   # sorted codes, for prefix range scans
+
+
+def _load():
+    """Read the catalog file into the code index and the sorted code list (first use only)."""
+    global _index, _codes
+    with _lock:
+        if _index is not None:
+            return
+        index = {}
+        with open(DTC_CATALOG_PATH, encoding='utf-8') as catalog:
+            for line in catalog:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                code, description = line.rstrip('\n').split('\t', 1)
+                index[code] = description
+        _codes = sorted(index)
+        _index = index
+        logger.info(f"Loaded {len(index)} DTC catalog entries from {DTC_CATALOG_PATH}")
+
+
+def catalog():
+    """The code -> description index, loading it on first use."""
+    if _index is None:
+        _load()
+    return _index
+
+
+def normalize_code(code):
+    """Upper-case and strip a code; None if it is not a P/C/B/U code."""
+    if not isinstance(code, str):
+        return None
+    code = code.strip().upper()
+    return code if DTC_PATTERN.match(code) else None
+
+
+def is_generic(code):
+    """Whether the code is SAE-defined (same meaning on every vehicle) rather than manufacturer-specific."""
+    if code[0] == "P":
+        # P3000-P33FF are manufacturer controlled, P3400-P3FFF are SAE
+        return code[1] in "02" or (code[1] == "3" and code[2] >= "4")
+    return code[1] == "0"
+
+
+def structure(code):
+    """What the code's characters alone say: system, generic vs manufacturer and powertrain subsystem."""
+    subsystem = POWERTRAIN_SUBSYSTEMS.get(code[2]) if code[0] == "P" and code[1] in "012" else None
+    return {"system": SYSTEMS[code[0]], "generic": is_generic(code), "subsystem": subsystem}
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def _decode(code):
+    description = catalog().get(code)
+    return (description, tuple(structure(code).items()))
+
+
+def decode(code):
+    """Decode one code; "known" is False when the catalog has no description for it.
+
+    Returns None if the code is malformed.
+    """
+    code = normalize_code(code)
+    if code is None:
+        return None
+    description, details = _decode(code)
+    return {"code": code, "known": description is not None, "description": description, **dict(details)}
+
+
+def decode_codes(codes):
+    """Decode a batch of codes, preserving order; malformed entries map to an error entry."""
+    results = []
+    for code in codes:
+        decoded = decode(code)
+        if decoded is None:
+            results.append({"code": code, "known": False, "error": "not a P/C/B/U code"})
+        else:
+            results.append(decoded)
+    return results
+
+
+def normalize_prefix(prefix):
+    """Upper-case a prefix and drop trailing x wildcards ("p01xx" -> "P01"); None if malformed."""
+    if not isinstance(prefix, str):
+        return None
+    prefix = prefix.strip().upper()
+    if not PREFIX_PATTERN.match(prefix):
+        return None
+    return prefix.rstrip('X')
+
+
+def lookup_prefix(prefix, limit=MAX_PREFIX_RESULTS):
+    """Every catalog entry starting with the prefix, in code order, via a range scan of the sorted codes."""
+    catalog()
+    start = bisect.bisect_left(_codes, prefix)
+    # '~' sorts after every code character, so this is the end of the prefix range
+    end = bisect.bisect_right(_codes, prefix + '~', lo=start)
+    return [{"code": code, "description": _index[code]} for code in _codes[start:min(end, start + limit)]]
@@ -0,0 +1,323 @@
+"""Deterministic synthetic fleet for load testing.
+
+    python fake_fleet.py --users 1000000 --seed 42 [--as-of 2026-01-01]
+
+Users, cars, car_details, error_events and error_parts are generated with
+numpy in blocks of FLEET_BLOCK_USERS users and streamed into Postgres with
+COPY, one transaction per block. Each block draws from its own random stream
+(seed, block number), so the same seed, user count and as-of date always
+produce the same rows; only the serial ids depend on the database's sequences.
+Emails are unique per (seed, user number), so a seed can be loaded once per
+database; resume a failed run with --first-block.
+"""
+import io
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import date
+import numpy as np
+from db_pool import pool
+
+logger = logging.getLogger()
+
+# Users per block: the unit of random streams, COPY batches and commits
+FLEET_BLOCK_USERS = 10000
+MAX_CARS_PER_USER = 6
+# Each further car is owned with this probability (geometric: ~45% of users own more than one)
+EXTRA_CAR_PROBABILITY = 0.45
+OLDEST_CAR_YEARS = 30
+
+# (weight, city)
+LOCATIONS = [
+    (8.3, "New York"), (3.8, "Los Angeles"), (2.7, "Chicago"), (2.3, "Houston"), (1.6, "Phoenix"),
+    (1.6, "Philadelphia"), (1.5, "San Antonio"), (1.4, "San Diego"), (1.3, "Dallas"), (1.0, "Austin"),
+    (0.9, "Jacksonville"), (0.9, "Columbus"), (0.9, "Charlotte"), (0.8, "Denver"), (0.7, "Seattle"),
+]
+
+# (weight, make, model): roughly the mix of cars in use in the US
+MODELS = [
+    (6.0, "Ford", "F-150"), (4.5, "Chevrolet", "Silverado"), (3.0, "Ram", "1500"),
+    (4.0, "Toyota", "Camry"), (4.0, "Toyota", "RAV4"), (3.5, "Toyota", "Corolla"), (1.5, "Toyota", "Tacoma"),
+    (3.5, "Honda", "Civic"), (3.5, "Honda", "Accord"), (3.5, "Honda", "CR-V"),
+    (2.5, "Nissan", "Altima"), (2.5, "Nissan", "Rogue"), (1.5, "Nissan", "Sentra"),
+    (2.5, "Chevrolet", "Equinox"), (1.5, "Chevrolet", "Malibu"),
+    (2.0, "Ford", "Escape"), (1.5, "Ford", "Explorer"), (1.0, "Ford", "Mustang"),
+    (2.0, "Jeep", "Grand Cherokee"), (1.5, "Jeep", "Wrangler"),
+    (2.0, "Hyundai", "Elantra"), (1.5, "Hyundai", "Tucson"),
+    (1.5, "Subaru", "Outback"), (1.0, "Subaru", "Forester"),
+    (1.5, "Kia", "Sorento"), (1.0, "Volkswagen", "Jetta"), (1.0, "GMC", "Sierra"),
+    (1.0, "Tesla", "Model 3"), (0.8, "BMW", "3 Series"), (0.7, "Mercedes-Benz", "C-Class"),
+]
+
+# Car age in years ~ gamma(shape, scale): mean about 12 years, like the US fleet
+AGE_SHAPE, AGE_SCALE = 2.5, 4.8
+# Share of cars bought new; the rest were bought used at some point of their life
+BOUGHT_NEW_SHARE = 0.4
+# Miles driven per year ~ lognormal around this median
+MEDIAN_MILES_PER_YEAR = 11500
+MILES_PER_YEAR_SIGMA = 0.4
+MAX_MILEAGE = 400000
+
+# Service dates: days before the as-of date, and the share of cars with no record
+OIL_CHANGE_MEAN_DAYS = 110
+CHECKUP_MAX_DAYS = 480
+BRAKE_PADS_MAX_DAYS = 3 * 365
+MISSING_OIL_CHANGE, MISSING_CHECKUP, MISSING_BRAKE_PADS = 0.03, 0.08, 0.25
+
+# Error events per year of ownership, scaled by how far the car is driven and its age
+ERROR_EVENTS_PER_YEAR = 0.05
+MAX_ERROR_EVENTS_PER_CAR = 20
+# Codes per event: 1 + binomial(2, p)
+EXTRA_CODE_PROBABILITY = 0.2
+# Parts logged per event: binomial(2, p), limited to the parts listed for the first code
+PART_PROBABILITY = 0.4
+
+# (relative frequency, code, parts usually replaced for it)
+DTCS = [
+    (10.0, "P0420", ("Catalytic converter", "Downstream oxygen sensor")),
+    (7.0, "P0300", ("Spark plugs", "Ignition coil")),
+    (4.0, "P0301", ("Ignition coil", "Spark plugs")),
+    (3.0, "P0302", ("Ignition coil", "Spark plugs")),
+    (7.0, "P0171", ("Mass air flow sensor", "Intake vacuum hose")),
+    (3.5, "P0174", ("Mass air flow sensor", "Intake vacuum hose")),
+    (6.0, "P0442", ("Fuel cap", "EVAP purge valve")),
+    (5.0, "P0455", ("Fuel cap", "EVAP vent valve")),
+    (3.0, "P0456", ("Fuel cap",)),
+    (5.0, "P0128", ("Thermostat", "Coolant temperature sensor")),
+    (3.0, "P0401", ("EGR valve",)),
+    (3.0, "P0135", ("Upstream oxygen sensor",)),
+    (2.5, "P0141", ("Downstream oxygen sensor",)),
+    (2.5, "P0101", ("Mass air flow sensor", "Air filter")),
+    (2.0, "P0505", ("Idle air control valve", "Throttle body")),
+    (2.0, "P0700", ("Transmission control module",)),
+    (1.5, "P0715", ("Input speed sensor",)),
+    (2.0, "P0011", ("Camshaft oil control valve", "Engine oil")),
+    (2.0, "P0016", ("Timing chain", "Camshaft position sensor")),
+    (1.5, "P0340", ("Camshaft position sensor",)),
+    (1.5, "P0335", ("Crankshaft position sensor",)),
+    (1.5, "P0562", ("Battery", "Alternator")),
+    (1.0, "P0500", ("Vehicle speed sensor",)),
+    (1.0, "P0299", ("Turbocharger", "Boost hose")),
+    (1.5, "C0035", ("Front wheel speed sensor",)),
+    (1.0, "C0040", ("Front wheel speed sensor",)),
+    (1.5, "U0100", ("Wiring harness",)),
+    (0.8, "U0101", ("Wiring harness",)),
+    (0.5, "B0001", ("Airbag module",)),
+]
+
+COPY_USERS = "COPY users (uuid, email, location) FROM STDIN"
+COPY_CARS = "COPY cars (car_id, user_uuid) FROM STDIN"
+COPY_CAR_DETAILS = """
+    COPY car_details (car_id, make, model, year, mileage, last_maintenance_checkup,
+                      last_oil_change, purchase_date, last_brake_pad_change)
+    FROM STDIN
+"""
+COPY_ERROR_EVENTS = "COPY error_events (error_event_id, car_id, error_codes, occurrence_mileage, occurrence_date) FROM STDIN"
+COPY_ERROR_PARTS = "COPY error_parts (error_event_id, part_name) FROM STDIN"
+
+# Reserves `n` values of a serial column's sequence for rows that are COPYed with explicit ids
+RESERVE_IDS = "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)"
+
+
+def _weights(table):
+    weights = np.array([row[0] for row in table], dtype=np.float64)
+    return weights / weights.sum()
+
+
+def _dates(as_of, days_ago, missing=None):
+    """ISO dates `days_ago` before as_of, with '\\N' (NULL) where `missing` is set."""
+    dates = np.datetime_as_string(np.datetime64(as_of, 'D') - days_ago.astype(np.int64), unit='D').astype(object)
+    if missing is not None:
+        dates[missing] = "\\N"
+    return dates
+
+
+def generate_block(seed, block, users, as_of):
+    """Generate the rows of `users` users as column arrays, linked by position.
+
+    Cars refer to users, and events to cars, by index within the block; ids
+    are assigned when the block is copied.
+    """
+    rng = np.random.default_rng([seed, block])
+    first_user = block * FLEET_BLOCK_USERS
+
+    raw = rng.integers(0, 256, size=(users, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    uuids = []
+    for row in raw:
+        h = row.tobytes().hex()
+        uuids.append(f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}")
+    locations = rng.choice(len(LOCATIONS), users, p=_weights(LOCATIONS))
+
+    cars_per_user = np.minimum(rng.geometric(1 - EXTRA_CAR_PROBABILITY, users), MAX_CARS_PER_USER)
+    owner = np.repeat(np.arange(users), cars_per_user)
+    cars = len(owner)
+    model = rng.choice(len(MODELS), cars, p=_weights(MODELS))
+
+    age_years = np.minimum(rng.gamma(AGE_SHAPE, AGE_SCALE, cars), OLDEST_CAR_YEARS)
+    age_days = np.floor(age_years * 365.25)
+    year = as_of.year - np.floor(age_years).astype(np.int64)
+    bought_new = rng.random(cars) < BOUGHT_NEW_SHARE
+    owned_days = np.floor(np.where(bought_new, age_days, rng.random(cars) * age_days))
+    miles_per_year = MEDIAN_MILES_PER_YEAR * rng.lognormal(0.0, MILES_PER_YEAR_SIGMA, cars)
+    mileage = np.minimum(miles_per_year * age_years, MAX_MILEAGE).astype(np.int64)
+
+    oil_change = np.minimum(rng.exponential(OIL_CHANGE_MEAN_DAYS, cars), age_days)
+    checkup = np.minimum(rng.random(cars) * CHECKUP_MAX_DAYS, age_days)
+    brake_pads = np.minimum(rng.random(cars) * BRAKE_PADS_MAX_DAYS, age_days)
+
+    # Older, harder-driven cars report more faults while with this owner
+    rate = (ERROR_EVENTS_PER_YEAR * (owned_days / 365.25)
+            * np.sqrt(miles_per_year / MEDIAN_MILES_PER_YEAR) * (1 + age_years / 10))
+    events_per_car = np.minimum(rng.poisson(rate), MAX_ERROR_EVENTS_PER_CAR)
+    event_car = np.repeat(np.arange(cars), events_per_car)
+    events = len(event_car)
+    event_days_ago = np.floor(rng.random(events) * owned_days[event_car])
+    # Mileage accrues evenly over the car's life
+    event_mileage = (mileage[event_car] * (1 - event_days_ago / np.maximum(age_days[event_car], 1))).astype(np.int64)
+
+    codes_per_event = 1 + rng.binomial(2, EXTRA_CODE_PROBABILITY, events)
+    codes = rng.choice(len(DTCS), codes_per_event.sum(), p=_weights(DTCS))
+    code_start = np.concatenate(([0], np.cumsum(codes_per_event)[:-1])).astype(np.int64)
+    primary = codes[code_start] if events else codes
+    parts_per_event = np.minimum(rng.binomial(2, PART_PROBABILITY, events),
+                                 np.array([len(DTCS[code][2]) for code in primary], dtype=np.int64))
+
+    return {
+        "users": {
+            "uuid": uuids,
+            "email": [f"fleet{seed}-{first_user + i}@example.com" for i in range(users)],
+            "location": [LOCATIONS[i][1] for i in locations],
+        },
+        "cars": {
+            "owner": owner,
+            "model": model,
+            "year": year,
+            "mileage": mileage,
+            "last_maintenance_checkup": _dates(as_of, checkup, rng.random(cars) < MISSING_CHECKUP),
+            "last_oil_change": _dates(as_of, oil_change, rng.random(cars) < MISSING_OIL_CHANGE),
+            "purchase_date": _dates(as_of, owned_days),
+            "last_brake_pad_change": _dates(as_of, brake_pads, rng.random(cars) < MISSING_BRAKE_PADS),
+        },
+        "error_events": {
+            "car": event_car,
+            "mileage": event_mileage,
+            "date": _dates(as_of, event_days_ago),
+            "codes": codes,
+            "code_start": code_start,
+            "codes_per_event": codes_per_event,
+            "parts": parts_per_event,
+        },
+    }
+
+
+def _copy(cursor, sql, lines):
+    buffer = io.StringIO()
+    buffer.writelines(lines)
+    buffer.seek(0)
+    cursor.copy_expert(sql, buffer)
+
+
+def _reserve_ids(cursor, table, column, count):
+    if not count:
+        return np.empty(0, dtype=np.int64)
+    cursor.execute(RESERVE_IDS, (table, column, count))
+    return np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+
+
+def copy_block(cursor, rows):
+    """COPY one generated block into the five tables; returns row counts."""
+    users, cars, events = rows["users"], rows["cars"], rows["error_events"]
+    car_ids = _reserve_ids(cursor, 'cars', 'car_id', len(cars["owner"]))
+    event_ids = _reserve_ids(cursor, 'error_events', 'error_event_id', len(events["car"]))
+
+    _copy(cursor, COPY_USERS, (f"{uuid}\t{email}\t{location}\n" for uuid, email, location
+                               in zip(users["uuid"], users["email"], users["location"])))
+    _copy(cursor, COPY_CARS, (f"{car_id}\t{users['uuid'][owner]}\n" for car_id, owner in zip(car_ids, cars["owner"])))
+    _copy(cursor, COPY_CAR_DETAILS, (
+        f"{car_id}\t{MODELS[model][1]}\t{MODELS[model][2]}\t{year}\t{mileage}\t{checkup}\t{oil}\t{purchase}\t{brakes}\n"
+        for car_id, model, year, mileage, checkup, oil, purchase, brakes in zip(
+            car_ids, cars["model"], cars["year"], cars["mileage"], cars["last_maintenance_checkup"],
+            cars["last_oil_change"], cars["purchase_date"], cars["last_brake_pad_change"])
+    ))
+
+    code_names = [code for _, code, _ in DTCS]
+    _copy(cursor, COPY_ERROR_EVENTS, (
+        f"{event_id}\t{car_ids[car]}\t"
+        f"{', '.join(dict.fromkeys(code_names[c] for c in events['codes'][start:start + count]))}\t{mileage}\t{day}\n"
+        for event_id, car, mileage, day, start, count in zip(
+            event_ids, events["car"], events["mileage"], events["date"], events["code_start"], events["codes_per_event"])
+    ))
+    part_rows = [(event_id, part) for event_id, start, count in zip(event_ids, events["code_start"], events["parts"])
+                 for part in DTCS[events["codes"][start]][2][:count]]
+    _copy(cursor, COPY_ERROR_PARTS, (f"{event_id}\t{part}\n" for event_id, part in part_rows))
+
+    return {"users": len(users["uuid"]), "cars": len(car_ids), "error_events": len(event_ids),
+            "error_parts": len(part_rows)}
+
+
+def create_fleet(conn, users, seed, as_of=None, first_block=0):
+    """Generate and load a synthetic fleet of `users` users, committing once per block.
+
+    Returns run metrics, including the user uuids when there is a single block
+    (so a small fleet can be used right away).
+    """
+    if users < 1:
+        raise ValueError("users must be at least 1")
+    as_of = as_of or date.today()
+    cursor = conn.cursor()
+    blocks = (users + FLEET_BLOCK_USERS - 1) // FLEET_BLOCK_USERS
+    started = time.monotonic()
+    totals = {"users": 0, "cars": 0, "error_events": 0, "error_parts": 0}
+    uuids = None
+    try:
+        for block in range(first_block, blocks):
+            rows = generate_block(seed, block, min(FLEET_BLOCK_USERS, users - block * FLEET_BLOCK_USERS), as_of)
+            # Synthetic data can be regenerated, so a crash losing the last commits is acceptable
+            cursor.execute("SET LOCAL synchronous_commit TO OFF")
+            counts = copy_block(cursor, rows)
+            conn.commit()
+            for table, count in counts.items():
+                totals[table] += count
+            if blocks == 1:
+                uuids = rows["users"]["uuid"]
+            logger.info(f"Loaded fleet block {block + 1}/{blocks}: {totals} in {time.monotonic() - started:.1f}s")
+    except Exception:
+        conn.rollback()
+        logger.error(f"Fleet load failed in block {block}; rerun with first_block={block} to resume")
+        raise
+
+    elapsed = time.monotonic() - started
+    rows_loaded = sum(totals.values())
+    metrics = {
+        "seed": seed,
+        "as_of": as_of.isoformat(),
+        **totals,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows_loaded / elapsed) if elapsed else None,
+    }
+    if uuids is not None:
+        metrics["user_uuids"] = uuids
+    return metrics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load a deterministic synthetic fleet for load testing")
+    parser.add_argument('--users', type=int, required=True)
+    parser.add_argument('--seed', type=int, required=True)
+    parser.add_argument('--as-of', type=date.fromisoformat, default=None,
+                        help="date the fleet is generated relative to (default: today)")
+    parser.add_argument('--first-block', type=int, default=0, help="resume a failed run from this block")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    conn = pool.getconn()
+    try:
+        metrics = create_fleet(conn, args.users, args.seed, args.as_of, args.first_block)
+    finally:
+        pool.putconn(conn)
+    metrics.pop("user_uuids", None)
+    print(metrics, file=sys.stdout)
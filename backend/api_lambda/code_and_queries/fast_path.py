@@ -0,0 +1,142 @@
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import logging
+import metrics
+from collections import namedtuple
+
+logger = logging.getLogger()
+
+# Serve the hot GET routes straight from the API Gateway event instead of through awsgi + Flask
+LAMBDA_FAST_PATH = os.environ.get('LAMBDA_FAST_PATH', 'true').lower() == 'true'
+# Fraction of invocations whose (truncated) event and response are logged; errors are always logged
+LOG_SAMPLE_RATE = float(os.environ.get('LAMBDA_LOG_SAMPLE_RATE', 0.01))
+# Longest event / response excerpt written to the log
+LOG_MAX_BYTES = int(os.environ.get('LAMBDA_LOG_MAX_BYTES', 2048))
+# Never written to the log
+REDACTED_HEADERS = {'authorization', 'cookie', 'x-api-key'}
+
+FastRequest = namedtuple('FastRequest', ['method', 'path', 'query', 'headers', 'body'])
+
+CONVERTERS = {
+    # Same pattern as Werkzeug's UUIDConverter, so both routers accept the same paths
+    'uuid': (r'[A-Fa-f0-9]{8}-[A-Fa-f0-9]{4}-[A-Fa-f0-9]{4}-[A-Fa-f0-9]{4}-[A-Fa-f0-9]{12}', uuid.UUID),
+    'int': (r'\d+', int),
+}
+
+class Router:
+    """Minimal method + path router for API Gateway proxy events.
+
+    Handlers take a FastRequest plus the converted path parameters and return
+    (status, body bytes, headers), or None to hand the request to Flask. The
+    ASGI app (asgi_app.py) uses the same router with coroutine handlers.
+    """
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.routes = []
+
+    def route(self, method, rule):
+        """Register a handler for a Flask-style rule such as /user/<uuid:user_uuid>/cars."""
+        converters = {}
+
+        def parameter(match):
+            kind, name = match.group(1), match.group(2)
+            converters[name] = CONVERTERS[kind][1]
+            return f'(?P<{name}>{CONVERTERS[kind][0]})'
+
+        pattern = re.compile('^' + re.sub(r'<(\w+):(\w+)>', parameter, re.escape(self.prefix) + rule) + '$')
+
+        def decorator(handler):
+            self.routes.append((method, self.prefix + rule, pattern, converters, handler))
+            return handler
+        return decorator
+
+    def match(self, method, path):
+        """Return (rule, handler, converted path parameters) for the request, or None."""
+        for route_method, rule, pattern, converters, handler in self.routes:
+            if method != route_method:
+                continue
+            match = pattern.match(path)
+            if not match:
+                continue
+            try:
+                params = {name: converters[name](value) for name, value in match.groupdict().items()}
+            except ValueError:
+                return None  # let Flask produce its usual 404
+            return rule, handler, params
+        return None
+
+    def dispatch(self, event):
+        """Return an API Gateway response for the event, or None if no fast route handles it."""
+        method = event.get('httpMethod')
+        path = event.get('path') or ''
+        matched = self.match(method, path)
+        if matched is None:
+            return None
+        rule, handler, params = matched
+        record = metrics.current()
+        if record is not None:
+            record.route = rule
+        request = FastRequest(
+            method, path,
+            event.get('queryStringParameters') or {},
+            {k.lower(): v for k, v in (event.get('headers') or {}).items()},
+            event.get('body'),
+        )
+        result = handler(request, **params)
+        if result is None:
+            return None
+        status, body, headers = result
+        return {
+            "statusCode": status,
+            "headers": {"Content-Type": "application/json", **headers},
+            "body": body.decode('utf-8'),
+            "isBase64Encoded": False,
+        }
+
+
+def _truncate(text):
+    if len(text) <= LOG_MAX_BYTES:
+        return text
+    return text[:LOG_MAX_BYTES] + f"...[{len(text) - LOG_MAX_BYTES} more]"
+
+
+def _sampled(request_id):
+    # Hash the request id rather than rolling a die, so a sampled request can be
+    # found again from its id and the decision needs no random state
+    return LOG_SAMPLE_RATE > 0 and zlib.crc32(request_id.encode()) % 10000 < LOG_SAMPLE_RATE * 10000
+
+
+def log_invocation(event, context, response, started, dispatch, cold_start):
+    """Write one structured summary line per invocation, plus a size-capped excerpt when sampled or failed."""
+    request_id = getattr(context, 'aws_request_id', '') or ''
+    status = int(response.get('statusCode', 500))
+    summary = {
+        "msg": "request",
+        "request_id": request_id,
+        "method": event.get('httpMethod'),
+        "path": event.get('path'),
+        "status": status,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        "response_bytes": len(response.get('body') or ''),
+        "dispatch": dispatch,
+        "cold_start": cold_start,
+    }
+    logger.info(json.dumps(summary))
+
+    if status >= 500 or _sampled(request_id):
+        redacted = {
+            key: {k: ('[redacted]' if k.lower() in REDACTED_HEADERS else v) for k, v in event[key].items()}
+            for key in ('headers', 'multiValueHeaders') if event.get(key)
+        }
+        detail = {
+            "msg": "request_detail",
+            "request_id": request_id,
+            "event": _truncate(json.dumps({**event, **redacted}, default=str)),
+            "response": _truncate(json.dumps(response, default=str)),
+        }
+        logger.info(json.dumps(detail))
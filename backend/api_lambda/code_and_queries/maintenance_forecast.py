@@ -0,0 +1,217 @@
+import logging
+from datetime import date
+import numpy as np
+
+logger = logging.getLogger()
+
+# Default service intervals: (miles, days), whichever comes first
+SERVICE_INTERVALS = {
+    "oil_change": (5000, 182),
+    "brake_pads": (40000, 1095),
+    "maintenance_checkup": (12000, 365),
+}
+# car_details column holding the date each service was last done
+SERVICE_DATE_COLUMNS = {
+    "oil_change": "last_oil_change",
+    "brake_pads": "last_brake_pad_change",
+    "maintenance_checkup": "last_maintenance_checkup",
+}
+# Per make / make+model interval overrides, keyed by lower-case (make, model);
+# a model of None applies to every model of that make. Model entries win.
+INTERVAL_OVERRIDES = {
+    ("toyota", None): {"oil_change": (10000, 365)},
+    ("honda", None): {"oil_change": (7500, 365)},
+    ("ford", "f-150"): {"oil_change": (7500, 365), "brake_pads": (35000, 1095)},
+    ("chevrolet", "silverado"): {"oil_change": (7500, 365), "brake_pads": (35000, 1095)},
+}
+
+# Used when a car's mileage or age is unknown (about 13,500 miles a year)
+DEFAULT_MILES_PER_DAY = 37.0
+# Clamp estimated daily mileage to a plausible range
+MIN_MILES_PER_DAY = 1.0
+MAX_MILES_PER_DAY = 300.0
+
+# urgency = fraction of the interval used up; at or above DUE_SOON_URGENCY the service is due soon
+DUE_SOON_URGENCY = 0.8
+
+# Loads the columns forecast() needs; append "WHERE c.user_uuid = %s" for one user.
+# Dates come back as days since 1970-01-01 so they convert to datetime64 without
+# building a Python date object per value.
+CAR_FORECAST_QUERY = """
+    SELECT c.car_id, lower(coalesce(cd.make, '')), lower(coalesce(cd.model, '')),
+           cd.year, cd.mileage,
+           cd.purchase_date - DATE '1970-01-01',
+           cd.last_oil_change - DATE '1970-01-01',
+           cd.last_brake_pad_change - DATE '1970-01-01',
+           cd.last_maintenance_checkup - DATE '1970-01-01'
+    FROM cars c
+    LEFT JOIN car_details cd ON c.car_id = cd.car_id
+"""
+
+
+def epoch_days_to_dates(values):
+    """Convert days since 1970-01-01 (None for NULL) to a datetime64[D] array."""
+    days = np.array(values, dtype=np.float64)
+    missing = np.isnan(days)
+    days[missing] = 0
+    dates = days.astype(np.int64).astype('datetime64[D]')
+    dates[missing] = np.datetime64('NaT')
+    return dates
+
+
+def rows_to_columns(rows):
+    """Turn CAR_FORECAST_QUERY result rows into the column arrays forecast() takes."""
+    if rows:
+        car_id, make, model, year, mileage, purchase_date, oil, brakes, checkup = zip(*rows)
+    else:
+        car_id = make = model = year = mileage = purchase_date = oil = brakes = checkup = ()
+    return {
+        "car_id": np.array(car_id, dtype=np.int64),
+        "make": np.array(make, dtype=str),
+        "model": np.array(model, dtype=str),
+        "year": np.array(year, dtype=np.float64),
+        "mileage": np.array(mileage, dtype=np.float64),
+        "purchase_date": epoch_days_to_dates(purchase_date),
+        "last_oil_change": epoch_days_to_dates(oil),
+        "last_brake_pad_change": epoch_days_to_dates(brakes),
+        "last_maintenance_checkup": epoch_days_to_dates(checkup),
+    }
+
+
+def load_columns(cursor, user_uuid=None):
+    """Load one user's cars (or the whole fleet when user_uuid is None) into column arrays."""
+    if user_uuid is None:
+        cursor.execute(CAR_FORECAST_QUERY + " ORDER BY c.car_id")
+    else:
+        cursor.execute(CAR_FORECAST_QUERY + " WHERE c.user_uuid = %s ORDER BY c.car_id", (user_uuid,))
+    return rows_to_columns(cursor.fetchall())
+
+
+def interval_table(makes, models, overrides=INTERVAL_OVERRIDES):
+    """Per-car (miles, days) interval arrays for every service type.
+
+    Only distinct make/model pairs are looked up in Python; the result is
+    scattered back to every car with the inverse index.
+    """
+    pairs = np.char.add(np.char.add(makes, '|'), models) if len(makes) else np.array([], dtype=str)
+    unique_pairs, inverse = np.unique(pairs, return_inverse=True)
+
+    tables = {}
+    for service, (default_miles, default_days) in SERVICE_INTERVALS.items():
+        miles = np.full(len(unique_pairs), default_miles, dtype=np.float64)
+        days = np.full(len(unique_pairs), default_days, dtype=np.float64)
+        for i, pair in enumerate(unique_pairs):
+            make, model = pair.split('|', 1)
+            override = overrides.get((make, model), {}).get(service) or overrides.get((make, None), {}).get(service)
+            if override:
+                miles[i], days[i] = override
+        tables[service] = (miles[inverse], days[inverse])
+    return tables
+
+
+def in_service_since(columns):
+    """Purchase date, or January 1st of the model year when that is unknown (NaT if neither)."""
+    years = columns["year"]
+    year_start = (np.nan_to_num(years, nan=1970).astype(np.int64) - 1970).astype('datetime64[Y]').astype('datetime64[D]')
+    year_start[np.isnan(years)] = np.datetime64('NaT')
+    return np.where(np.isnat(columns["purchase_date"]), year_start, columns["purchase_date"])
+
+
+def estimate_miles_per_day(columns, since, today):
+    """Average daily mileage from the odometer and the time since the car entered service."""
+    age_days = (today - since).astype(np.float64)
+    age_days[np.isnat(since)] = np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = columns["mileage"] / age_days
+        rate = np.where(np.isfinite(rate) & (age_days > 30), rate, DEFAULT_MILES_PER_DAY)
+    return np.clip(rate, MIN_MILES_PER_DAY, MAX_MILES_PER_DAY)
+
+
+def forecast(columns, today=None, overrides=INTERVAL_OVERRIDES):
+    """Forecast every service for every car in one vectorized pass.
+
+    A service's interval in days is the shorter of its day limit and its mile
+    limit at the car's estimated daily mileage, counted from the last time it
+    was done (or from when the car entered service if that is unknown).
+    Returns {service: {"next_due_date", "next_due_mileage", "days_until_due",
+    "urgency"}} of arrays aligned with columns["car_id"], plus an overall
+    "urgency" array holding each car's most urgent service. Unknown values are
+    NaT/NaN.
+    """
+    today = np.datetime64(today or date.today(), 'D')
+    since = in_service_since(columns)
+    rate = estimate_miles_per_day(columns, since, today)
+    intervals = interval_table(columns["make"], columns["model"], overrides)
+
+    result = {}
+    overall = np.full(len(columns["car_id"]), np.nan)
+    for service, date_column in SERVICE_DATE_COLUMNS.items():
+        interval_miles, interval_days = intervals[service]
+        last_done = columns[date_column]
+        last_done = np.where(np.isnat(last_done), since, last_done)
+
+        effective_days = np.minimum(interval_days, interval_miles / rate)
+        days_since = (today - last_done).astype(np.float64)
+        days_since[np.isnat(last_done)] = np.nan
+        next_due_date = last_done + np.round(effective_days).astype('timedelta64[D]')
+        days_until_due = effective_days - days_since
+        next_due_mileage = np.round(columns["mileage"] + rate * days_until_due)
+        with np.errstate(invalid='ignore'):
+            urgency = np.maximum(days_since, 0) / effective_days
+
+        result[service] = {
+            "next_due_date": next_due_date,
+            "next_due_mileage": next_due_mileage,
+            "days_until_due": np.round(days_until_due),
+            "urgency": urgency,
+        }
+        overall = np.fmax(overall, urgency)
+
+    result["urgency"] = overall
+    return result
+
+
+def urgency_status(urgency):
+    """Map urgency scores to the app's ok / due_soon / overdue traffic-light states."""
+    return np.select(
+        [np.isnan(urgency), urgency >= 1.0, urgency >= DUE_SOON_URGENCY],
+        ["unknown", "overdue", "due_soon"],
+        default="ok"
+    )
+
+
+def forecast_to_json(columns, result):
+    """Shape forecast arrays into one JSON-friendly dict per car."""
+    def number(value):
+        return None if value != value else value
+
+    def integer(value):
+        return None if value != value else int(value)
+
+    services = {}
+    for service in SERVICE_DATE_COLUMNS:
+        arrays = result[service]
+        services[service] = list(zip(
+            np.datetime_as_string(arrays["next_due_date"], unit='D').tolist(),
+            arrays["next_due_mileage"].tolist(),
+            arrays["days_until_due"].tolist(),
+            np.round(arrays["urgency"], 3).tolist(),
+            urgency_status(arrays["urgency"]).tolist(),
+        ))
+
+    overall_urgency = np.round(result["urgency"], 3).tolist()
+    overall_status = urgency_status(result["urgency"]).tolist()
+    cars = []
+    for i, car_id in enumerate(columns["car_id"].tolist()):
+        car = {"car_id": car_id, "urgency": number(overall_urgency[i]), "status": overall_status[i], "services": {}}
+        for service, values in services.items():
+            due_date, due_mileage, days_until_due, urgency, status = values[i]
+            car["services"][service] = {
+                "next_due_date": None if due_date == 'NaT' else due_date,
+                "next_due_mileage": integer(due_mileage),
+                "days_until_due": integer(days_until_due),
+                "urgency": number(urgency),
+                "status": status,
+            }
+        cars.append(car)
+    return cars
@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextvars
+
+logger = logging.getLogger()
+
+# Emit one CloudWatch Embedded Metric Format record per request on stdout
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'PredictiveCarMaintenance')
+# Statements slower than this are logged with their SQL text (0 disables)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 250))
+# Longest SQL excerpt written to the slow-query log
+SLOW_QUERY_MAX_CHARS = 1000
+
+# (name, unit) of every metric in a request record, in output order
+METRICS = [
+    ("Duration", "Milliseconds"),
+    ("ConnectTime", "Milliseconds"),
+    ("SqlCount", "Count"),
+    ("SqlTime", "Milliseconds"),
+    ("SqlStatementTime", "Milliseconds"),
+    ("RowsReturned", "Count"),
+    ("SerializationTime", "Milliseconds"),
+    ("ResponseBytes", "Bytes"),
+    ("ColdStart", "Count"),
+]
+
+# Per thread, and per asyncio task under the ASGI app
+_current = contextvars.ContextVar('request_metrics', default=None)
+_cold_start = True
+_cold_start_lock = threading.Lock()
+_cursor_class = None
+
+
+class RequestMetrics:
+    """Timings and counters collected while one request is handled."""
+
+    def __init__(self, route, method, cold_start):
+        self.route = route
+        self.method = method
+        self.cold_start = cold_start
+        self.started = time.perf_counter()
+        self.connect_ms = 0.0
+        self.statement_ms = []
+        self.rows = 0
+        self.serialization_ms = 0.0
+        self.status = None
+        self.response_bytes = 0
+        self.owner = None
+
+    def to_emf(self, request_id=None):
+        values = {
+            "Duration": round((time.perf_counter() - self.started) * 1000, 3),
+            "ConnectTime": round(self.connect_ms, 3),
+            "SqlCount": len(self.statement_ms),
+            "SqlTime": round(sum(self.statement_ms), 3),
+            # A list is recorded by CloudWatch as one value per statement
+            "SqlStatementTime": [round(ms, 3) for ms in self.statement_ms] or 0,
+            "RowsReturned": self.rows,
+            "SerializationTime": round(self.serialization_ms, 3),
+            "ResponseBytes": self.response_bytes,
+            "ColdStart": 1 if self.cold_start else 0,
+        }
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["Route"]],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, unit in METRICS],
+                }],
+            },
+            "Route": self.route,
+            "Method": self.method,
+            "StatusCode": self.status,
+            **values,
+        }
+        if request_id:
+            record["RequestId"] = request_id
+        return record
+
+
+def begin(route, method, owner=None):
+    """Start collecting for the request handled by this thread and return its record."""
+    global _cold_start
+    with _cold_start_lock:
+        cold_start, _cold_start = _cold_start, False
+    record = RequestMetrics(route, method, cold_start)
+    record.owner = owner
+    _current.set(record)
+    return record
+
+
+def current():
+    """The record of the request being handled by this thread or task, if any."""
+    return _current.get()
+
+
+def end(status, response_bytes, request_id=None):
+    """Finish the current request and write its EMF record to stdout."""
+    record = current()
+    _current.set(None)
+    if record is None:
+        return None
+    record.status = status
+    record.response_bytes = response_bytes
+    if METRICS_ENABLED:
+        sys.stdout.write(json.dumps(record.to_emf(request_id)) + "\n")
+        sys.stdout.flush()
+    return record
+
+
+def discard():
+    """Drop the current record without emitting it (the request was handed to another handler)."""
+    _current.set(None)
+
+
+def record_connect(elapsed_ms):
+    record = current()
+    if record is not None:
+        record.connect_ms += elapsed_ms
+
+
+def record_serialization(elapsed_ms):
+    record = current()
+    if record is not None:
+        record.serialization_ms += elapsed_ms
+
+
+def record_statement(query, elapsed_ms):
+    record = current()
+    if record is not None:
+        record.statement_ms.append(elapsed_ms)
+    if SLOW_QUERY_MS and elapsed_ms >= SLOW_QUERY_MS:
+        text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+        logger.warning(json.dumps({
+            "msg": "slow_query",
+            "route": record.route if record else None,
+            "duration_ms": round(elapsed_ms, 3),
+            # Parameters are left out on purpose: they can hold user data
+            "statement": " ".join(text.split())[:SLOW_QUERY_MAX_CHARS],
+        }))
+
+
+def record_rows(count):
+    record = current()
+    if record is not None:
+        record.rows += count
+
+
+def cursor_class():
+    """psycopg2 cursor subclass that times every statement and counts fetched rows.
+
+    Built on first use because psycopg2 itself is only imported once the
+    first database connection is opened.
+    """
+    global _cursor_class
+    if _cursor_class is not None:
+        return _cursor_class
+    import psycopg2.extensions
+
+    class InstrumentedCursor(psycopg2.extensions.cursor):
+        def execute(self, query, vars=None):
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                record_statement(query, (time.perf_counter() - started) * 1000)
+
+        def executemany(self, query, vars_list):
+            started = time.perf_counter()
+            try:
+                return super().executemany(query, vars_list)
+            finally:
+                record_statement(query, (time.perf_counter() - started) * 1000)
+
+        def copy_expert(self, sql, file, size=8192):
+            started = time.perf_counter()
+            try:
+                return super().copy_expert(sql, file, size)
+            finally:
+                record_statement(sql, (time.perf_counter() - started) * 1000)
+
+        def fetchone(self):
+            row = super().fetchone()
+            if row is not None:
+                record_rows(1)
+            return row
+
+        def fetchmany(self, size=None):
+            rows = super().fetchmany(self.arraysize if size is None else size)
+            record_rows(len(rows))
+            return rows
+
+        def fetchall(self):
+            rows = super().fetchall()
+            record_rows(len(rows))
+            return rows
+
+    _cursor_class = InstrumentedCursor
+    return _cursor_class
+
+
+def instrument_flask(app):
+    """Collect metrics for every Flask request and time JSON serialization.
+
+    Requests that arrive through lambda_handler already have a record; the
+    hooks then only fill in the matched route.
+    """
+    from flask import request
+    provider_dumps = app.json.dumps
+
+    def timed_dumps(obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return provider_dumps(obj, **kwargs)
+        finally:
+            record_serialization((time.perf_counter() - started) * 1000)
+
+    # The provider's response() looks dumps up on the instance, so jsonify is timed too
+    app.json.dumps = timed_dumps
+
+    @app.before_request
+    def begin_request_metrics():
+        # Label by rule, not path: one dimension value per route rather than per user
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        record = current()
+        if record is None:
+            begin(route, request.method, owner='flask')
+        else:
+            record.route = route
+
+    @app.after_request
+    def record_response_metrics(response):
+        record = current()
+        if record is not None and record.owner == 'flask':
+            record.status = response.status_code
+            record.response_bytes = response.content_length or 0
+        return response
+
+    @app.teardown_request
+    def end_request_metrics(exc):
+        record = current()
+        if record is not None and record.owner == 'flask':
+            end(record.status or 500, record.response_bytes)
@@ -0,0 +1,190 @@
+import re
+import sys
+import json
+import time
+import logging
+from collections import namedtuple
+from sql_queries import (CREATE_SCHEMA, CREATE_CAR_HEALTH, CREATE_ERROR_EVENT_CODES, CREATE_TELEMETRY_ROLLUPS,
+                         CREATE_CAR_ANOMALIES, CREATE_PENDING_CAR_UPDATES, CREATE_ERROR_HISTORY_INDEXES,
+                         DELETE_DUPLICATE_CAR_DETAILS, CREATE_CAR_DETAILS_CAR_ID_KEY,
+                         CREATE_TELEMETRY_RECORDED_AT_BRIN, CREATE_ERROR_EVENT_CODES_CAR_DATE_IDX,
+                         REPLACE_ERROR_EVENTS_CAR_HISTORY_IDX, BACKFILL_ERROR_EVENT_CODES)
+from db_pool import pool
+
+logger = logging.getLogger()
+
+# Arbitrary application-wide key for pg_advisory_lock, so only one runner migrates at a time
+MIGRATION_LOCK_KEY = 7243019
+# Seconds to wait for another runner to release the migration lock
+MIGRATION_LOCK_TIMEOUT = 120
+
+# `transactional=False` migrations run statement by statement in autocommit mode,
+# which CREATE INDEX CONCURRENTLY requires; keep them idempotent (IF NOT EXISTS)
+# because a failure part way through cannot be rolled back.
+Migration = namedtuple('Migration', ['version', 'description', 'statements', 'transactional'])
+
+MIGRATIONS = [
+    Migration(1, "Baseline schema", [CREATE_SCHEMA], True),
+    Migration(2, "Indexes for per-user and per-car lookups", [
+        # Serves both the user_uuid filter and the keyset ORDER BY car_id of get_user_cars
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS cars_user_uuid_car_id_idx ON cars (user_uuid, car_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS error_events_car_id_idx ON error_events (car_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS error_parts_error_event_id_idx ON error_parts (error_event_id)",
+        # car_details.car_id is covered by the car_details_car_id_key unique index (migration 10)
+    ], False),
+    Migration(3, "Precomputed car health and batch job checkpoints", [CREATE_CAR_HEALTH], True),
+    # Older events are backfilled by migration 14, outside this transaction
+    Migration(4, "Normalized, indexed error event codes kept in sync by trigger", [CREATE_ERROR_EVENT_CODES], True),
+    Migration(5, "Hourly and daily telemetry rollups maintained on ingest", [CREATE_TELEMETRY_ROLLUPS], True),
+    Migration(6, "Per-car anomaly detection state and flagged anomalies", [CREATE_CAR_ANOMALIES], True),
+    Migration(7, "Queue table for coalesced mileage updates", [CREATE_PENDING_CAR_UPDATES], True),
+    Migration(8, "Covering indexes for the per-car error history", CREATE_ERROR_HISTORY_INDEXES, False),
+    Migration(9, "Remove duplicate car_details rows", [DELETE_DUPLICATE_CAR_DETAILS], True),
+    Migration(10, "Unique car_details.car_id for upserts", [
+        # Repeated so that a rerun also clears duplicates written since migration 9
+        DELETE_DUPLICATE_CAR_DETAILS,
+        CREATE_CAR_DETAILS_CAR_ID_KEY,
+    ], False),
+    Migration(11, "BRIN index on telemetry_readings.recorded_at for retention", [CREATE_TELEMETRY_RECORDED_AT_BRIN], False),
+    Migration(12, "Per-car index on error_event_codes for anomaly detection",
+              [CREATE_ERROR_EVENT_CODES_CAR_DATE_IDX], False),
+    Migration(13, "Error history index without the unbounded error_codes column",
+              REPLACE_ERROR_EVENTS_CAR_HISTORY_IDX, False),
+    Migration(14, "Backfill error_event_codes in committed batches", [BACKFILL_ERROR_EVENT_CODES], False),
+]
+
+CREATE_SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    duration_ms INTEGER
+)
+"""
+
+CONCURRENT_INDEX_PATTERN = re.compile(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)', re.IGNORECASE)
+
+
+def pending_migrations(cursor):
+    """Return the migrations not yet recorded in schema_version, in order."""
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if cursor.fetchone()[0]:
+        cursor.execute("SELECT version FROM schema_version")
+        applied = {row[0] for row in cursor.fetchall()}
+    else:
+        applied = set()
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+def plan(migrations):
+    """Describe migrations as JSON-friendly dicts (the dry-run output)."""
+    return [
+        {
+            "version": migration.version,
+            "description": migration.description,
+            "transactional": migration.transactional,
+            "statements": [statement.strip() for statement in migration.statements],
+        }
+        for migration in migrations
+    ]
+
+
+def migrate(conn, dry_run=False):
+    """Apply pending migrations in version order while holding the migration advisory lock.
+
+    Returns the plan of the migrations that were applied (or, with dry_run,
+    that would be applied). The connection is left in autocommit mode; the
+    pool resets it when it is returned.
+    """
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    if dry_run:
+        return plan(pending_migrations(cursor))
+
+    _acquire_lock(cursor)
+    try:
+        cursor.execute(CREATE_SCHEMA_VERSION_TABLE)
+        # Read pending steps only once the lock is held, so concurrent runners never repeat one
+        pending = pending_migrations(cursor)
+        for migration in pending:
+            _apply(conn, cursor, migration)
+        if not pending:
+            logger.info("Database schema is up to date")
+        return plan(pending)
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+
+
+def _acquire_lock(cursor):
+    deadline = time.monotonic() + MIGRATION_LOCK_TIMEOUT
+    while True:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        if cursor.fetchone()[0]:
+            return
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Another migration runner held the lock for more than {MIGRATION_LOCK_TIMEOUT}s")
+        logger.info("Waiting for another migration runner to finish")
+        time.sleep(1)
+
+
+def _apply(conn, cursor, migration):
+    logger.info(f"Applying migration {migration.version}: {migration.description}")
+    started = time.monotonic()
+
+    if migration.transactional:
+        conn.autocommit = False
+        try:
+            for statement in migration.statements:
+                cursor.execute(statement)
+            _record(cursor, migration, started)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+    else:
+        for statement in migration.statements:
+            _drop_invalid_index(cursor, statement)
+            cursor.execute(statement)
+        _record(cursor, migration, started)
+
+    logger.info(f"Applied migration {migration.version} in {time.monotonic() - started:.2f}s")
+
+
+def _drop_invalid_index(cursor, statement):
+    """Drop an index left INVALID by an earlier failed CREATE INDEX CONCURRENTLY.
+
+    IF NOT EXISTS would otherwise skip it and leave the broken index in place.
+    """
+    match = CONCURRENT_INDEX_PATTERN.search(statement)
+    if not match:
+        return
+    cursor.execute(
+        """
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid
+        """,
+        (match.group(1),)
+    )
+    if cursor.fetchone():
+        logger.warning(f"Dropping invalid index {match.group(1)} left by an earlier failed migration")
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+def _record(cursor, migration, started):
+    cursor.execute(
+        "INSERT INTO schema_version (version, description, duration_ms) VALUES (%s, %s, %s)",
+        (migration.version, migration.description, int((time.monotonic() - started) * 1000))
+    )
+
+
+if __name__ == '__main__':
+    # Usage: python migrations.py [--dry-run]
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    conn = pool.getconn()
+    try:
+        print(json.dumps(migrate(conn, dry_run='--dry-run' in sys.argv[1:]), indent=2))
+    finally:
+        pool.putconn(conn)
@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from db_pool import pool
+
+logger = logging.getLogger()
+
+JOB_NAME = "mileage_flush"
+# Queued updates written to car_details per transaction
+FLUSH_BATCH_SIZE = int(os.environ.get('MILEAGE_FLUSH_BATCH_SIZE', 5000))
+
+# Moves one batch of queued mileage updates into car_details in a single
+# statement and bumps the garage version of every owner. SKIP LOCKED leaves rows
+# that an update is replacing right now for the next batch. The mileage only
+# moves up, in case a direct write raced ahead of the queued value.
+FLUSH_PENDING_MILEAGE = """
+WITH flushed AS (
+    DELETE FROM pending_car_updates
+    WHERE car_id IN (
+        SELECT car_id FROM pending_car_updates
+        ORDER BY car_id
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING car_id, user_uuid, mileage
+),
+applied AS (
+    INSERT INTO car_details AS cd (car_id, mileage)
+    SELECT car_id, mileage FROM flushed
+    ORDER BY car_id
+    ON CONFLICT (car_id) DO UPDATE SET mileage = EXCLUDED.mileage
+    WHERE cd.mileage IS NULL OR cd.mileage < EXCLUDED.mileage
+    RETURNING car_id
+),
+bump_version AS (
+    UPDATE users SET garage_version = garage_version + 1
+    WHERE uuid IN (SELECT user_uuid FROM flushed)
+)
+SELECT (SELECT count(*) FROM flushed), (SELECT count(*) FROM applied)
+"""
+
+
+def run(batch_size=FLUSH_BATCH_SIZE):
+    """Write every queued mileage update to car_details, one committed batch at a time.
+
+    Returns run metrics.
+    """
+    conn = None
+    try:
+        conn = pool.getconn()
+        cursor = conn.cursor()
+        started = time.monotonic()
+        flushed = applied = batches = 0
+        while True:
+            cursor.execute(FLUSH_PENDING_MILEAGE, {"batch_size": batch_size})
+            batch_flushed, batch_applied = cursor.fetchone()
+            conn.commit()
+            flushed += batch_flushed
+            applied += batch_applied
+            batches += 1
+            if batch_flushed < batch_size:
+                break
+
+        elapsed = time.monotonic() - started
+        metrics = {
+            "flushed": flushed,
+            "applied": applied,
+            "batches": batches,
+            "seconds": round(elapsed, 3),
+        }
+        logger.info(f"{JOB_NAME} finished: {metrics}")
+        return metrics
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            pool.putconn(conn)
+
+
+def lambda_handler(event, context):
+    """Scheduled entry point (e.g. every minute); the event may override batch_size."""
+    event = event or {}
+    return run(batch_size=int(event.get('batch_size', FLUSH_BATCH_SIZE)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write queued mileage updates to car_details")
+    parser.add_argument('--batch-size', type=int, default=FLUSH_BATCH_SIZE)
+    parser.add_argument('--interval', type=float, default=0,
+                        help="keep running, flushing every INTERVAL seconds (0 flushes once)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    while True:
+        metrics = run(batch_size=args.batch_size)
+        print(metrics, file=sys.stdout)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,83 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# In-process cache of rendered get_user_cars responses (off unless enabled)
+GARAGE_CACHE_ENABLED = os.environ.get('GARAGE_CACHE_ENABLED', 'false').lower() == 'true'
+GARAGE_CACHE_MAX_ENTRIES = int(os.environ.get('GARAGE_CACHE_MAX_ENTRIES', 256))
+GARAGE_CACHE_MAX_BYTES = int(os.environ.get('GARAGE_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+GARAGE_CACHE_TTL = float(os.environ.get('GARAGE_CACHE_TTL', 60))
+
+
+class ResponseCache:
+    """LRU cache of rendered response bodies, bounded by entry count, total bytes and TTL.
+
+    Entries are keyed by (user_uuid, variant) and remember the garage version
+    they were rendered at; a lookup for any other version is a miss, so writes
+    made by other instances can never be served stale.
+    """
+
+    def __init__(self, max_entries=GARAGE_CACHE_MAX_ENTRIES, max_bytes=GARAGE_CACHE_MAX_BYTES,
+                 ttl=GARAGE_CACHE_TTL, enabled=GARAGE_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (user_uuid, variant) -> (version, body, expires_at)
+        self._bytes = 0
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, user_uuid, variant, version):
+        """Return the cached body for this user/variant at `version`, or None."""
+        if not self.enabled:
+            return None
+        key = (str(user_uuid), variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or entry[2] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[1]
+
+    def put(self, user_uuid, variant, version, body):
+        """Store a rendered body, evicting least recently used entries to stay in bounds."""
+        if not self.enabled or len(body) > self.max_bytes:
+            return
+        key = (str(user_uuid), variant)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, body, time.monotonic() + self.ttl)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def invalidate_user(self, user_uuid):
+        """Drop every cached variant for a user after one of their cars changes."""
+        if not self.enabled:
+            return
+        user_uuid = str(user_uuid)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_uuid]:
+                self._remove(key)
+                self._counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = {"enabled": self.enabled, "entries": len(self._entries), "bytes": self._bytes}
+            stats.update(self._counters)
+        return stats
+
+    def _remove(self, key):
+        _, body, _ = self._entries.pop(key)
+        self._bytes -= len(body)
+
+
+garage_cache = ResponseCache()
@@ -1,18 +1,28 @@
-from datetime import datetime, date, timedelta
-import random
-import string
+from datetime import datetime, date, timedelta, timezone
 import uuid
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
+from werkzeug.http import parse_etags, quote_etag
 import os
 import json
+import time
+import hashlib
 import logging
-import awsgi
 import traceback
-import psycopg2
-import psycopg2.extras
-from sql_queries import CREATE_SCHEMA
+from sql_queries import (INSERT_USER_CARS_BATCH, INSERT_USER_CARS_ROW, DELETE_USER_CAR, UPSERT_CAR_DETAILS,
+                         DISCARD_PENDING_MILEAGE, QUEUE_CAR_MILEAGE,
+                         SELECT_USER_CAR_HEALTH, SELECT_USER_CARS_JSON, SELECT_GARAGE_VERSION,
+                         COUNT_FLEET_DTCS, SEARCH_FLEET_DTCS, SELECT_TELEMETRY_TREND, TELEMETRY_ROLLUP_TABLES,
+                         SELECT_CAR_RECENT_ANOMALIES, SELECT_CAR_ERROR_HISTORY, ERROR_HISTORY_FILTERS)
+from db_pool import pool
+import dtc_catalog
+import fast_path
+import metrics
+import serialization
+from response_cache import garage_cache
 
-psycopg2.extras.register_uuid()
+# awsgi, psycopg2 and the numpy-backed modules (telemetry, anomaly,
+# maintenance_forecast, migrations) are imported where they are first used, so a cold start that only
+# serves the fast-path routes does not pay for them.
 
 ENV = os.environ.get('ENVIRONMENT')
 
@@ -25,71 +35,130 @@ logging.basicConfig(
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Database configuration
-DB_HOST = "terraform-20250323164944761200000005.cnqq0meu6lwj.us-east-2.rds.amazonaws.com" # can change if the database is destroyed and re-deployed
-DB_NAME = "dev_db"
-DB_USER = os.environ.get('DB_USERNAME')
-DB_PASSWORD = os.environ.get('DB_PASSWORD')
-DB_PORT = 5432
+# Client-writable columns of car_details
+CAR_DETAIL_FIELDS = ['make', 'model', 'year', 'mileage', 'last_maintenance_checkup',
+                     'last_oil_change', 'purchase_date', 'last_brake_pad_change']
+CAR_DATE_FIELDS = ['last_maintenance_checkup', 'last_oil_change', 'purchase_date', 'last_brake_pad_change']
+# SQL types of those columns, for casting parameters in INSERT ... SELECT
+CAR_DETAIL_TYPES = {
+    'make': 'varchar', 'model': 'varchar', 'year': 'integer', 'mileage': 'integer',
+    'last_maintenance_checkup': 'date', 'last_oil_change': 'date',
+    'purchase_date': 'date', 'last_brake_pad_change': 'date',
+}
+
+# Largest number of cars accepted by a single add_user_cars call
+MAX_BATCH_CARS = 500
+
+# Columns get_user_cars can return (selectable with `fields=`), mapped to their SQL expressions
+CAR_COLUMNS = {
+    "car_id": "c.car_id",
+    "detail_id": "cd.detail_id",
+    "make": "cd.make",
+    "model": "cd.model",
+    "year": "cd.year",
+    # Queued mileage updates are shown before they are flushed (see user_cars_joins)
+    "mileage": "GREATEST(cd.mileage, p.mileage)",
+    "last_maintenance_checkup": "cd.last_maintenance_checkup",
+    "last_oil_change": "cd.last_oil_change",
+    "purchase_date": "cd.purchase_date",
+    "last_brake_pad_change": "cd.last_brake_pad_change",
+}
+# Anomalies returned per car by get_user_cars with include=anomalies
+RECENT_ANOMALIES_PER_CAR = 5
+# Optional get_user_cars columns (requested with `include=`), mapped to their SQL expressions
+CAR_INCLUDES = {
+    "anomalies": SELECT_CAR_RECENT_ANOMALIES % RECENT_ANOMALIES_PER_CAR,
+}
+# Largest page size for keyset-paginated get_user_cars
+MAX_CARS_PAGE_SIZE = 1000
+# Fleet DTC search defaults to the last 30 days and caps how many codes one query may ask for
+FLEET_SEARCH_DEFAULT_DAYS = 30
+FLEET_SEARCH_MAX_CODES = 20
+# Telemetry trends default to the last week; ranges up to TREND_HOURLY_MAX_DAYS
+# are served from the hourly rollups unless a resolution is given, longer ones from the daily
+TREND_DEFAULT_DAYS = 7
+TREND_HOURLY_MAX_DAYS = 14
+# Most rollup buckets one trend request may span
+MAX_TREND_BUCKETS = 5000
+# Error history page size when no limit is given, and the largest allowed
+ERROR_HISTORY_DEFAULT_LIMIT = 50
+MAX_ERROR_HISTORY_PAGE_SIZE = 500
+# Rows fetched per round trip when streaming get_user_cars through a named cursor
+STREAM_CHUNK_SIZE = 500
+# Largest synthetic fleet /create_fake_user may load in one request; 0 (the default) disables fleets
+FAKE_FLEET_MAX_USERS = int(os.environ.get('FAKE_FLEET_MAX_USERS', 0))
 
 app = Flask(__name__)
+app.json = serialization.JSONProvider(app)
+metrics.instrument_flask(app)
+fast_routes = fast_path.Router(f"/{ENV}")
 
 def lambda_handler(event, context):
-    logger.info(f"Received event: {json.dumps(event)}")
+    started = time.perf_counter()
+    dispatch = "wsgi"
+    # Labelled with the matched rule once a fast route or Flask resolves it
+    record = metrics.begin("unmatched", event.get('httpMethod'), owner='lambda')
     try:
-        logger.info("Attempting to process with awsgi")
-        response = awsgi.response(app, event, context)
-        logger.info(f"AWSGI response: {json.dumps(response)}")
-        return response
+        response = fast_routes.dispatch(event) if fast_path.LAMBDA_FAST_PATH else None
+        if response is not None:
+            dispatch = "direct"
+        else:
+            import awsgi
+            response = awsgi.response(app, event, context)
     except Exception as e:
         logger.error(f"Error in lambda_handler: {str(e)}")
         logger.error(traceback.format_exc())
-        return {
+        response = {
             "statusCode": 500,
             "body": json.dumps({"error": str(e)}),
             "headers": {"Content-Type": "application/json"}
         }
+    fast_path.log_invocation(event, context, response, started, dispatch, record.cold_start)
+    metrics.end(int(response.get('statusCode', 500)), len(response.get('body') or ''),
+                getattr(context, 'aws_request_id', None))
+    return response
+
+def json_body(data):
+    """Serialize like jsonify does, for responses built outside a Flask request."""
+    return (app.json.dumps(data, separators=(",", ":")) + "\n").encode('utf-8')
 
 def get_db_connection():
-    """Establish and return a connection to the database."""
-    logger.info(f"Attempting to connect to DB at {DB_HOST}:{DB_PORT}")
-    logger.info(f"DB_NAME: {DB_NAME}, DB_USER: {DB_USER}")
-    try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
-        )
+    """Borrow a connection to the database from the shared pool."""
+    try:
+        started = time.perf_counter()
+        conn = pool.getconn()
+        metrics.record_connect((time.perf_counter() - started) * 1000)
+        # Time every statement run on this connection for the request's metrics
+        conn.cursor_factory = metrics.cursor_class()
         return conn
     except Exception as e:
         logger.error(f"Database connection error: {str(e)}")
         raise
 
-def create_schema():
-    """Create the database schema if it doesn't exist."""
+def release_db_connection(conn):
+    """Hand a borrowed connection back to the pool for the next invocation."""
+    pool.putconn(conn)
+
+def create_schema(dry_run=False):
+    """Bring the database schema up to date by applying pending migrations.
+
+    Returns the migrations that were applied, or with dry_run the ones that
+    would be applied.
+    """
+    import migrations
     conn = None
     try:
-        logger.info("new code has been deployed 2")
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Execute the entire schema as one statement
-        cursor.execute(CREATE_SCHEMA)
-        
-        # Commit the transaction
-        conn.commit()
-        logger.info("Database schema created successfully")
-        return True
+        applied = migrations.migrate(conn, dry_run=dry_run)
+        if not dry_run:
+            logger.info(f"Database schema migrated ({len(applied)} migrations applied)")
+        return applied
     except Exception as e:
         logger.error(f"Error creating schema: {str(e)}")
-        if conn:
-            conn.rollback()
         raise
     finally:
         if conn:
-            conn.close()
+            release_db_connection(conn)
 
 @app.route(f"/{ENV}/")
 def hello_world():
@@ -101,14 +170,24 @@ def health_check():
     logger.info("Health check endpoint accessed")
     return jsonify({"status": "healthy"})
 
+@fast_routes.route('GET', '/health')
+def fast_health_check(req):
+    return 200, json_body({"status": "healthy"}), {}
+
+@app.route(f"/{ENV}/db_pool_stats", methods=['GET'])
+def db_pool_stats():
+    logger.info("DB pool stats endpoint accessed")
+    return jsonify({"status": "success", "data": pool.stats()})
+
 @app.route(f"/{ENV}/create_db_schema", methods=['POST'])
 def db_create_schema():
     logger.info("Create schema endpoint accessed")
-    logger.info(f"DB username env variable: {DB_USER}")
-    logger.info(f"DB password env variable: {DB_PASSWORD}")
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true')
     try:
-        create_schema()
-        return jsonify({"status": "success", "message": "Database schema created"})
+        applied = create_schema(dry_run)
+        if dry_run:
+            return jsonify({"status": "success", "message": f"{len(applied)} pending migrations", "pending": applied})
+        return jsonify({"status": "success", "message": "Database schema created", "applied": applied})
     except Exception as e:
         logger.error(f"Error in create_schema endpoint: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500 # does and should this default to 500?
@@ -120,64 +199,301 @@ if __name__ == '__main__':
 @app.route(f"/{ENV}/user/<uuid:user_uuid>/cars", methods=['GET'])
 def get_user_cars(user_uuid):
     logger.info(f"Getting cars for user: {user_uuid}")
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        try:
+            fields, after, limit = parse_user_cars_args(request.args)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        # Connect, run the query and read the first chunk before any byte is sent, so
+        # failures up to that point still get a JSON error status
+        try:
+            conn, cursor, first_rows = open_user_cars_stream(user_uuid, fields, after, limit)
+        except Exception as e:
+            logger.error(f"Error in get_user_cars endpoint: {str(e)}")
+            return jsonify({"status": "error", "message": str(e)}), 500
+        release = connection_releaser(conn)
+        response = Response(stream_with_context(stream_user_cars(user_uuid, fields, cursor, first_rows, release)),
+                            mimetype='application/json')
+        # Also covers a body that is never iterated, where the generator's finally does not run
+        response.call_on_close(release)
+        return response
+
     try:
-        cars = get_user_cars_details(user_uuid)
-        return jsonify({"status": "success", "data": cars})
+        status, body, etag = render_user_cars(user_uuid, request.args, request.if_none_match)
+        return garage_response(body, etag, status)
     except Exception as e:
         logger.error(f"Error in get_user_cars endpoint: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
-def get_user_cars_details(user_uuid):
-    """Retrieve all cars and their details for a specific user UUID."""
+@fast_routes.route('GET', '/user/<uuid:user_uuid>/cars')
+def fast_get_user_cars(req, user_uuid):
+    if req.query.get('stream', '').lower() in ('1', 'true'):
+        return None
+    logger.info(f"Getting cars for user: {user_uuid}")
+    try:
+        status, body, etag = render_user_cars(user_uuid, req.query, parse_etags(req.headers.get('if-none-match')))
+    except Exception as e:
+        logger.error(f"Error in get_user_cars endpoint: {str(e)}")
+        return 500, json_body({"status": "error", "message": str(e)}), {}
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag:
+        headers["ETag"] = quote_etag(etag)
+    return status, body, headers
+
+def parse_user_cars_args(args):
+    """Read fields (plus any include) / after / limit from get_user_cars query parameters; raises ValueError."""
+    fields = parse_car_fields(args.get('fields')) + parse_car_includes(args.get('include'))
+    after = parse_positive_int(args.get('after'), 'after')
+    limit = parse_positive_int(args.get('limit'), 'limit')
+    if limit is not None and limit > MAX_CARS_PAGE_SIZE:
+        raise ValueError(f"limit must be at most {MAX_CARS_PAGE_SIZE}")
+    return fields, after, limit
+
+def render_user_cars(user_uuid, args, if_none_match):
+    """Render a (non-streamed) get_user_cars response as (status, body bytes, etag).
+
+    Shared by the Flask route and the Lambda fast path.
+    """
+    try:
+        fields, after, limit = parse_user_cars_args(args)
+    except ValueError as e:
+        return 400, json_body({"status": "error", "message": str(e)}), None
+
+    # Cheap primary-key lookup that lets unchanged garages skip the join entirely
+    version = get_garage_version(user_uuid)
+    variant = user_cars_variant(fields, after, limit)
+    status, body, etag = cached_user_cars(user_uuid, version, variant, if_none_match)
+    if status is not None:
+        return status, body, etag
+
+    data, next_cursor = get_user_cars_json(user_uuid, fields, after, limit)
+    body = user_cars_body(data, next_cursor, limit)
+    if version is not None:
+        garage_cache.put(user_uuid, variant, version, body)
+    return 200, body, etag
+
+def user_cars_variant(fields, after, limit):
+    """Cache / ETag key of one get_user_cars page shape."""
+    return f"fields={','.join(fields)}&after={after}&limit={limit}"
+
+def cached_user_cars(user_uuid, version, variant, if_none_match):
+    """Answer get_user_cars from the garage version alone when possible.
+
+    Returns (status, body, etag): a 304 or a cached 200, or (None, None, etag)
+    when the cars query has to run.
+    """
+    if version is None:
+        return None, None, None
+    etag = hashlib.sha1(f"{user_uuid}:{version}:{variant}".encode()).hexdigest()
+    if if_none_match.contains(etag):
+        logger.info(f"Garage for user {user_uuid} unchanged (version {version}), returning 304")
+        return 304, b"", etag
+
+    body = garage_cache.get(user_uuid, variant, version)
+    if body is not None:
+        logger.info(f"Serving cached garage for user {user_uuid} (version {version})")
+        return 200, body, etag
+    return None, None, etag
+
+def user_cars_body(data, next_cursor, limit):
+    """get_user_cars body around the car array text rendered by Postgres."""
+    envelope = {"status": "success"}
+    if limit is not None:
+        envelope["next_cursor"] = next_cursor
+    return serialization.splice(envelope, data=data)
+
+def garage_response(body, etag, status=200):
+    """Build a get_user_cars response that clients must revalidate with If-None-Match."""
+    response = app.response_class(body, status=status, mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def get_garage_version(user_uuid):
+    """Return the user's garage version, or None if the user does not exist."""
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        # SQL query to join cars and car_details tables for a specific user
-        query = """
-            SELECT c.car_id, cd.detail_id, cd.make, cd.model, cd.year, cd.mileage, 
-                   cd.last_maintenance_checkup, cd.last_oil_change, cd.purchase_date, 
-                   cd.last_brake_pad_change
-            FROM cars c
-            LEFT JOIN car_details cd ON c.car_id = cd.car_id
-            WHERE c.user_uuid = %s
-        """
-        
-        cursor.execute(query, (user_uuid,))
-        
-        # Fetch all results
-        results = cursor.fetchall()
-        
-        # Format the results
-        cars = []
-        for row in results:
-            car = {
-                "car_id": row[0],
-                "detail_id": row[1],
-                "make": row[2],
-                "model": row[3],
-                "year": row[4],
-                "mileage": row[5],
-                "last_maintenance_checkup": row[6].isoformat() if row[6] else None,
-                "last_oil_change": row[7].isoformat() if row[7] else None,
-                "purchase_date": row[8].isoformat() if row[8] else None,
-                "last_brake_pad_change": row[9].isoformat() if row[9] else None
-            }
-            cars.append(car)
-        
-        logger.info(f"Retrieved {len(cars)} cars for user {user_uuid}")
-        return cars
+        cursor.execute(SELECT_GARAGE_VERSION, (user_uuid,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+def parse_car_fields(fields_param):
+    """Turn a `fields=` query parameter into a list of CAR_COLUMNS keys (car_id always first)."""
+    if not fields_param:
+        return list(CAR_COLUMNS)
+    requested = [field.strip() for field in fields_param.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in CAR_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ['car_id'] + [field for field in dict.fromkeys(requested) if field != 'car_id']
+
+def parse_car_includes(include_param):
+    """Turn an `include=` query parameter into a list of CAR_INCLUDES keys."""
+    if not include_param:
+        return []
+    requested = [name.strip() for name in include_param.split(',') if name.strip()]
+    unknown = [name for name in requested if name not in CAR_INCLUDES]
+    if unknown:
+        raise ValueError(f"Unknown include: {', '.join(unknown)}")
+    return list(dict.fromkeys(requested))
+
+def parse_positive_int(value, name):
+    """Parse an optional positive integer query parameter."""
+    if value is None or value == '':
+        return None
+    try:
+        parsed = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a positive integer")
+    if parsed < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    return parsed
+
+def parse_non_negative_int(value, name):
+    """Parse an optional integer query parameter that may be zero."""
+    if value is None or value == '':
+        return None
+    try:
+        parsed = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a non-negative integer")
+    if parsed < 0:
+        raise ValueError(f"{name} must be a non-negative integer")
+    return parsed
+
+def build_user_cars_query(fields, after=None, limit=None):
+    """Build the keyset-ordered cars/car_details query and its parameters (minus user_uuid)."""
+    select_list = ", ".join(f"{CAR_COLUMNS.get(field) or CAR_INCLUDES[field]} AS {field}" for field in fields)
+    query = f"""
+        SELECT {select_list}
+        FROM cars c
+        LEFT JOIN car_details cd ON c.car_id = cd.car_id{user_cars_joins(fields)}
+        WHERE c.user_uuid = %s
+    """
+    params = []
+    if after is not None:
+        query += " AND c.car_id > %s"
+        params.append(after)
+    query += " ORDER BY c.car_id"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+def user_cars_joins(fields):
+    """Extra joins needed by the selected fields."""
+    if 'mileage' in fields:
+        return "\n        LEFT JOIN pending_car_updates p ON c.car_id = p.car_id"
+    return ""
+
+def format_car_row(fields, row):
+    """Map a result row onto its field names, rendering dates as ISO strings."""
+    return {field: value.isoformat() if isinstance(value, (date, datetime)) else value
+            for field, value in zip(fields, row)}
+
+def build_user_cars_json_query(user_uuid, fields, after=None, limit=None):
+    """SELECT_USER_CARS_JSON for one page, with all of its parameters."""
+    # Fetch one extra row to know whether another page exists
+    page_query, params = build_user_cars_query(fields, after, limit + 1 if limit is not None else None)
+    query = SELECT_USER_CARS_JSON.format(
+        page_query=page_query,
+        page_filter="FILTER (WHERE n <= %s)" if limit is not None else ""
+    )
+    filter_params = [limit, limit] if limit is not None else []
+    return query, filter_params + [user_uuid] + params
+
+def user_cars_page(row, limit):
+    """(data, next_cursor) from the SELECT_USER_CARS_JSON result row."""
+    data, fetched, last_car_id = row
+    return data, last_car_id if limit is not None and fetched > limit else None
+
+def get_user_cars_json(user_uuid, fields=None, after=None, limit=None):
+    """Retrieve one keyset page of a user's cars and their details as JSON array text.
+
+    Returns (data, next_cursor); next_cursor is the car_id to pass as `after`
+    for the following page, or None when there are no more cars.
+    """
+    fields = fields or list(CAR_COLUMNS)
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(*build_user_cars_json_query(user_uuid, fields, after, limit))
+        data, next_cursor = user_cars_page(cursor.fetchone(), limit)
+        logger.info(f"Retrieved a page of cars for user {user_uuid}")
+        return data, next_cursor
     except Exception as e:
         logger.error(f"Error retrieving cars for user {user_uuid}: {str(e)}")
         raise
     finally:
         if conn:
-            conn.close()
+            release_db_connection(conn)
+
+def open_user_cars_stream(user_uuid, fields, after=None, limit=None):
+    """Run the get_user_cars query through a server-side cursor and fetch its first chunk.
+
+    Returns (conn, cursor, first_rows); the connection stays checked out until
+    stream_user_cars has sent the body.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(name=f"user_cars_{uuid.uuid4().hex}")
+        cursor.itersize = STREAM_CHUNK_SIZE
+        query, params = build_user_cars_query(fields, after, limit)
+        cursor.execute(query, [user_uuid] + params)
+        return conn, cursor, cursor.fetchmany(STREAM_CHUNK_SIZE)
+    except Exception:
+        release_db_connection(conn)
+        raise
+
+def connection_releaser(conn):
+    """A callable that returns conn to the pool on its first call and does nothing after."""
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            release_db_connection(conn)
+    return release
+
+def stream_user_cars(user_uuid, fields, cursor, rows, release):
+    """Yield the get_user_cars JSON body in chunks, starting from the rows open_user_cars_stream read.
+
+    Memory stays bounded by STREAM_CHUNK_SIZE rows however many cars the user
+    has (awsgi still buffers the whole body on Lambda; the container
+    deployment sends it chunked). Errors after the status has been sent are
+    logged and end the body early, leaving it truncated (invalid JSON).
+    """
+    count = 0
+    try:
+        yield '{"status": "success", "data": ['
+        while rows:
+            chunk = ",".join(json.dumps(format_car_row(fields, row)) for row in rows)
+            yield ("," if count else "") + chunk
+            count += len(rows)
+            rows = cursor.fetchmany(STREAM_CHUNK_SIZE)
+        yield ']}'
+        logger.info(f"Streamed {count} cars for user {user_uuid}")
+    except Exception as e:
+        logger.error(f"Error streaming cars for user {user_uuid} after {count} cars: {str(e)}")
+    finally:
+        release()
 
 @app.route(f"/{ENV}/create_fake_user", methods=['POST'])
 def create_fake_user_endpoint():
     logger.info("Create fake user endpoint accessed")
+    payload = request.get_json(silent=True)
+    # Any other body (the Bruno request sends {}) creates a single user as before
+    if isinstance(payload, dict) and 'users' in payload:
+        return create_fake_fleet(payload)
     try:
         # logger.info("new code has been deployed")
         user_uuid = create_fake_user_data()
@@ -196,9 +512,50 @@ def create_fake_user_endpoint():
         return jsonify({"status": "error", "message": error_message}), 500
 
 
+def create_fake_fleet(payload):
+    """Load a deterministic synthetic fleet ({"users": n, "seed": s}) with fake_fleet.
+
+    Only served when FAKE_FLEET_MAX_USERS is set; larger fleets are loaded with the CLI.
+    """
+    if not FAKE_FLEET_MAX_USERS:
+        return jsonify({"status": "error", "message": "Synthetic fleets are disabled in this environment"}), 403
+    try:
+        users = payload.get('users')
+        seed = payload.get('seed', int.from_bytes(os.urandom(4), 'big'))
+        as_of = payload.get('as_of')
+        for name, value in (('users', users), ('seed', seed)):
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise ValueError(f"{name} must be a non-negative integer")
+        if users < 1:
+            raise ValueError("users must be at least 1")
+        as_of = date.fromisoformat(as_of) if as_of is not None else None
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if users > FAKE_FLEET_MAX_USERS:
+        return jsonify({
+            "status": "error",
+            "message": f"At most {FAKE_FLEET_MAX_USERS} users per request; use fake_fleet.py for larger fleets"
+        }), 413
+
+    import fake_fleet
+    conn = None
+    try:
+        conn = get_db_connection()
+        result = fake_fleet.create_fleet(conn, users, seed, as_of)
+    except Exception as e:
+        logger.error(f"Error creating fake fleet: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+    finally:
+        if conn:
+            release_db_connection(conn)
+    logger.info(f"Fake fleet loaded: {result['users']} users, {result['cars']} cars (seed {seed})")
+    return jsonify({"status": "success", "message": "Fake fleet created", **result}), 201
+
 
 def create_fake_user_data():
     """Generate and store random fake data for a user, their cars, and car details."""
+    import random
+    import string
     conn = None
     try:
         conn = get_db_connection()
@@ -265,7 +622,7 @@ def create_fake_user_data():
         raise
     finally:
         if conn:
-            conn.close()
+            release_db_connection(conn)
 
 
 
@@ -289,26 +646,17 @@ def delete_car_for_user(user_uuid, car_id):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # First verify that the car belongs to the user
-        verify_query = """
-            SELECT car_id FROM cars
-            WHERE car_id = %s AND user_uuid = %s
-        """
-        cursor.execute(verify_query, (car_id, user_uuid))
-        car = cursor.fetchone()
-        
-        if not car:
+        # Ownership check, delete and garage version bump in one statement
+        # (cascading delete will remove related records due to ON DELETE CASCADE)
+        cursor.execute(DELETE_USER_CAR, {"car_id": car_id, "user_uuid": user_uuid})
+        deleted = cursor.fetchone()
+        conn.commit()
+
+        if not deleted:
             logger.warning(f"Car {car_id} does not belong to user {user_uuid} or does not exist")
             return {"deleted": False, "message": "Car not found or doesn't belong to this user"}
-        
-        # Delete the car (cascading delete will remove related records due to ON DELETE CASCADE)
-        delete_query = """
-            DELETE FROM cars
-            WHERE car_id = %s
-        """
-        cursor.execute(delete_query, (car_id,))
-        conn.commit()
-        
+
+        garage_cache.invalidate_user(user_uuid)
         logger.info(f"Successfully deleted car {car_id} for user {user_uuid}")
         return {"deleted": True}
     
@@ -319,7 +667,7 @@ def delete_car_for_user(user_uuid, car_id):
         raise
     finally:
         if conn:
-            conn.close()
+            release_db_connection(conn)
 
 @app.route(f"/{ENV}/user/<uuid:user_uuid>/car/<int:car_id>/details", methods=['PUT'])
 def update_car_details(user_uuid, car_id):
@@ -328,7 +676,17 @@ def update_car_details(user_uuid, car_id):
         update_data = request.get_json()
         if not update_data:
             return jsonify({"status": "error", "message": "No update data provided"}), 400
-        
+
+        if coalesce_requested(request.args):
+            try:
+                query, params = build_mileage_queue(user_uuid, car_id, update_data)
+            except ValueError as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+            status, body = queued_mileage_response(car_id, queue_car_mileage(query, params))
+            if status == 202:
+                garage_cache.invalidate_user(user_uuid)
+            return jsonify(body), status
+
         result = update_car_details_for_user(user_uuid, car_id, update_data)
         if not result['updated']:
             return jsonify({"status": "error", "message": result['message']}), 404
@@ -338,6 +696,75 @@ def update_car_details(user_uuid, car_id):
         logger.error(f"Error in update_car_details endpoint: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def build_car_details_upsert(user_uuid, car_id, update_data):
+    """UPSERT_CAR_DETAILS and its parameters for the allowed fields in update_data, or None if there are none."""
+    # Filter the update data down to the allowed fields
+    filtered_data = {k: v for k, v in update_data.items() if k in CAR_DETAIL_FIELDS}
+    if not filtered_data:
+        return None
+
+    # Ownership check, upsert and garage version bump in one statement
+    query = UPSERT_CAR_DETAILS.format(
+        columns=", ".join(filtered_data),
+        values=", ".join(f"%({field})s::{CAR_DETAIL_TYPES[field]}" for field in filtered_data),
+        assignments=", ".join(f"{field} = EXCLUDED.{field}" for field in filtered_data),
+        discard_pending=DISCARD_PENDING_MILEAGE if 'mileage' in filtered_data else ""
+    )
+    return query, {**filtered_data, "car_id": car_id, "user_uuid": user_uuid}
+
+def coalesce_requested(args):
+    """Whether update_car_details was asked to queue the update (?coalesce=true) instead of writing it."""
+    return args.get('coalesce', '').lower() in ('1', 'true')
+
+def build_mileage_queue(user_uuid, car_id, update_data):
+    """QUEUE_CAR_MILEAGE and its parameters for a coalesced update; raises ValueError.
+
+    Only mileage can be coalesced, since only its latest value matters.
+    """
+    if not isinstance(update_data, dict):
+        raise ValueError("Request body must be a JSON object")
+    others = [field for field in update_data if field != 'mileage']
+    if others:
+        raise ValueError(f"Only mileage can be coalesced, got: {', '.join(others)}")
+    mileage = update_data.get('mileage')
+    if isinstance(mileage, bool) or not isinstance(mileage, int) or mileage < 0 or mileage > 2**31 - 1:
+        raise ValueError("mileage must be a non-negative integer")
+    return QUEUE_CAR_MILEAGE, {"car_id": car_id, "user_uuid": user_uuid, "mileage": mileage}
+
+def queued_mileage_response(car_id, row):
+    """(status, body) of a coalesced update from the QUEUE_CAR_MILEAGE result row.
+
+    202 when the value was queued; 200 when it was not higher than the car's
+    mileage (an out-of-order or repeated report), which is dropped.
+    """
+    if row is None:
+        return 404, {"status": "error", "message": "Car not found or doesn't belong to this user"}
+    current_mileage, queued_mileage = row
+    if queued_mileage is None:
+        return 200, {"status": "success", "message": "Mileage is not higher than the current value, ignored",
+                     "data": {"car_id": car_id, "mileage": current_mileage, "queued": False}}
+    return 202, {"status": "success", "message": "Mileage update queued",
+                 "data": {"car_id": car_id, "mileage": queued_mileage, "queued": True}}
+
+def queue_car_mileage(query, params):
+    """Run QUEUE_CAR_MILEAGE; returns its result row, or None if the car is not the user's."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+        conn.commit()
+        return row
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error queueing mileage update: {str(e)}")
+        raise
+    finally:
+        if conn:
+            release_db_connection(conn)
+
 def update_car_details_for_user(user_uuid, car_id, update_data):
     """Update car details if the car belongs to the specified user."""
     conn = None
@@ -345,47 +772,22 @@ def update_car_details_for_user(user_uuid, car_id, update_data):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Verify the car belongs to the user
-        cursor.execute("SELECT 1 FROM cars WHERE car_id = %s AND user_uuid = %s", (car_id, user_uuid))
-        if not cursor.fetchone():
-            return {"updated": False, "message": "Car not found or doesn't belong to this user"}
-
-        # Get allowed fields and filter the update data
-        allowed_fields = ['make', 'model', 'year', 'mileage', 'last_maintenance_checkup', 
-                          'last_oil_change', 'purchase_date', 'last_brake_pad_change']
-        filtered_data = {k: v for k, v in update_data.items() if k in allowed_fields}
-        
-        if not filtered_data:
+        upsert = build_car_details_upsert(user_uuid, car_id, update_data)
+        if upsert is None:
             return {"updated": False, "message": "No valid fields to update"}
-            
-        # Check if car_details record exists
-        cursor.execute("SELECT 1 FROM car_details WHERE car_id = %s", (car_id,))
-        details_exist = cursor.fetchone()
-        
-        if details_exist:
-            # Update existing record
-            set_clause = ", ".join([f"{field} = %s" for field in filtered_data])
-            query = f"UPDATE car_details SET {set_clause} WHERE car_id = %s RETURNING *"
-            values = list(filtered_data.values()) + [car_id]
-        else:
-            # Insert new record
-            fields = ['car_id'] + list(filtered_data.keys())
-            placeholders = ['%s'] * len(fields)
-            query = f"INSERT INTO car_details ({', '.join(fields)}) VALUES ({', '.join(placeholders)}) RETURNING *"
-            values = [car_id] + list(filtered_data.values())
-            
-        cursor.execute(query, values)
+
+        cursor.execute(*upsert)
         result = cursor.fetchone()
         conn.commit()
-        
-        # Convert to dict and format dates
+
+        if not result:
+            return {"updated": False, "message": "Car not found or doesn't belong to this user"}
+
         columns = [desc[0] for desc in cursor.description]
-        data = dict(zip(columns, result))
-        for k, v in data.items():
-            if isinstance(v, (date, datetime)):
-                data[k] = v.isoformat()
-                
-        return {"updated": True, "data": data}
+        garage_cache.invalidate_user(user_uuid)
+
+        # Dates are rendered as ISO strings by the app's JSON provider
+        return {"updated": True, "data": dict(zip(columns, result))}
     
     except Exception as e:
         if conn:
@@ -394,7 +796,7 @@ def update_car_details_for_user(user_uuid, car_id, update_data):
         raise
     finally:
         if conn:
-            conn.close()
+            release_db_connection(conn)
 
 
 
@@ -427,6 +829,16 @@ def add_user_car(user_uuid):
         return jsonify({"status": "error", "message": "An internal error occurred"}), 500
     
 
+def build_car_insert(user_uuid, car_data):
+    """INSERT_USER_CARS_BATCH for a single car, with its parameters.
+
+    User check, car insert, details insert and garage version bump run in one
+    statement (the batch insert with a single row).
+    """
+    # Use .get() to handle potentially missing optional fields
+    values = [car_data.get(field) for field in CAR_DETAIL_FIELDS]
+    return INSERT_USER_CARS_BATCH.format(values=INSERT_USER_CARS_ROW), [user_uuid, 0] + values
+
 def create_car_for_user(user_uuid, car_data):
     """Create a new car and its details for a specific user."""
     conn = None
@@ -434,55 +846,20 @@ def create_car_for_user(user_uuid, car_data):
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # 1. Verify the user exists
-        cursor.execute("SELECT 1 FROM users WHERE uuid = %s", (user_uuid,))
-        if not cursor.fetchone():
+        cursor.execute(*build_car_insert(user_uuid, car_data))
+        new_details_record = cursor.fetchone()
+
+        if not new_details_record:
             logger.warning(f"Attempt to add car for non-existent user: {user_uuid}")
             return {"created": False, "message": "User not found"}
 
-        # 2. Insert the new car record to get a car_id
-        cursor.execute(
-            "INSERT INTO cars (user_uuid) VALUES (%s) RETURNING car_id",
-            (user_uuid,)
-        )
-        car_id = cursor.fetchone()[0]
-        logger.info(f"Created new car record with car_id: {car_id} for user {user_uuid}")
-
-        # 3. Prepare and insert the car details
-        # Use .get() to handle potentially missing optional fields
-        make = car_data.get('make')
-        model = car_data.get('model')
-        year = car_data.get('year')
-        mileage = car_data.get('mileage')
-        last_maintenance_checkup = car_data.get('last_maintenance_checkup')
-        last_oil_change = car_data.get('last_oil_change')
-        purchase_date = car_data.get('purchase_date')
-        last_brake_pad_change = car_data.get('last_brake_pad_change')
-
-        details_query = """
-            INSERT INTO car_details
-            (car_id, make, model, year, mileage, last_maintenance_checkup,
-             last_oil_change, purchase_date, last_brake_pad_change)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING * 
-        """ # RETURNING * gets the newly created detail record
-        cursor.execute(
-            details_query,
-            (car_id, make, model, year, mileage, last_maintenance_checkup,
-             last_oil_change, purchase_date, last_brake_pad_change)
-        )
-        
-        new_details_record = cursor.fetchone()
         conn.commit()
+        garage_cache.invalidate_user(user_uuid)
 
-        # Convert the returned record to a dictionary for the response
-        columns = [desc[0] for desc in cursor.description]
-        new_car_details = dict(zip(columns, new_details_record))
-
-        # Format dates for JSON response
-        for key, value in new_car_details.items():
-            if isinstance(value, (date, datetime)):
-                new_car_details[key] = value.isoformat() if value else None # Handle potential None dates
+        # Convert the returned record to a dictionary for the response, dropping the leading `ord` column
+        columns = [desc[0] for desc in cursor.description][1:]
+        new_car_details = dict(zip(columns, new_details_record[1:]))
+        car_id = new_car_details["car_id"]
 
         logger.info(f"Successfully created car details for car_id: {car_id}")
         return {"created": True, "data": new_car_details}
@@ -495,4 +872,532 @@ def create_car_for_user(user_uuid, car_data):
         raise # Re-raise the exception to be caught by the route handler
     finally:
         if conn:
-            conn.close()
\ No newline at end of file
+            release_db_connection(conn)
+
+
+
+@app.route(f"/{ENV}/user/<uuid:user_uuid>/telemetry", methods=['POST'])
+def upload_telemetry(user_uuid):
+    """Endpoint to store a batch of OBD readings for one or more of a user's cars."""
+    import telemetry
+    logger.info(f"Received telemetry upload for user: {user_uuid}")
+
+    payload = request.get_json(silent=True)
+    default_car_id = None
+    if isinstance(payload, dict):
+        default_car_id = payload.get('car_id')
+        payload = payload.get('readings')
+    if not isinstance(payload, list) or not payload:
+        return jsonify({"status": "error", "message": "Request body must contain a non-empty list of readings"}), 400
+    if len(payload) > telemetry.MAX_TELEMETRY_BATCH:
+        return jsonify({"status": "error", "message": f"At most {telemetry.MAX_TELEMETRY_BATCH} readings can be uploaded per request"}), 413
+
+    try:
+        result = store_telemetry_for_user(user_uuid, payload, default_car_id)
+        return jsonify({"status": "success", **result}), 200
+    except Exception as e:
+        logger.error(f"Error in upload_telemetry endpoint for user {user_uuid}: {str(e)}")
+        return jsonify({"status": "error", "message": "An internal error occurred"}), 500
+
+def store_telemetry_for_user(user_uuid, readings, default_car_id=None):
+    """Validate a batch of readings and COPY the accepted ones into telemetry_readings.
+
+    Uses a constant number of round trips regardless of batch size: one
+    ownership query for every car referenced, one COPY and one commit, plus
+    loading and saving the cars' anomaly state when detection is enabled.
+    """
+    import telemetry
+    import anomaly
+    batch = telemetry.parse_readings(readings, default_car_id)
+
+    conn = None
+    anomalies = []
+    try:
+        car_ids = telemetry.candidate_car_ids(batch)
+        if car_ids:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+
+            # Locking the cars makes concurrent uploads for a car take turns, so
+            # each one folds its readings into the state the previous one saved
+            cursor.execute(
+                "SELECT car_id FROM cars WHERE user_uuid = %s AND car_id = ANY(%s) ORDER BY car_id"
+                + (" FOR NO KEY UPDATE" if anomaly.ANOMALY_DETECTION_ENABLED else ""),
+                (user_uuid, car_ids)
+            )
+            telemetry.reject_unowned(batch, [row[0] for row in cursor.fetchall()])
+
+            accepted = int(telemetry.accepted_mask(batch).sum())
+            if accepted:
+                cursor.copy_expert(telemetry.COPY_TELEMETRY_READINGS, telemetry.to_copy_buffer(batch))
+                if anomaly.ANOMALY_DETECTION_ENABLED:
+                    anomalies = detect_telemetry_anomalies(cursor, user_uuid, batch)
+                conn.commit()
+                if anomalies:
+                    garage_cache.invalidate_user(user_uuid)
+
+        results = telemetry.batch_results(batch)
+        accepted = sum(1 for r in results if r["accepted"])
+        logger.info(f"Stored {accepted} of {len(results)} telemetry readings for user {user_uuid}"
+                    f" ({len(anomalies)} anomalies)")
+        return {"accepted": accepted, "rejected": len(results) - accepted, "results": results,
+                "anomalies": anomalies}
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error storing telemetry for user {user_uuid}: {str(e)}")
+        raise
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+
+
+def detect_telemetry_anomalies(cursor, user_uuid, batch):
+    """Run the accepted readings of a batch through the anomaly detector, on the caller's transaction.
+
+    Returns the anomalies found, which are also stored in car_anomalies.
+    """
+    import telemetry
+    import anomaly
+    now_ms = time.time() * 1000.0
+    cursor.execute(anomaly.LOAD_ANOMALY_STATE, anomaly.load_params(telemetry.candidate_car_ids(batch), now_ms))
+    states = anomaly.parse_states(cursor.fetchall())
+    anomalies = anomaly.detect(batch, states, now_ms)
+    cursor.execute(anomaly.SAVE_ANOMALY_DETECTION, anomaly.save_params(user_uuid, states, anomalies))
+    return anomalies
+
+
+@app.route(f"/{ENV}/user/<uuid:user_uuid>/car/<int:car_id>/telemetry/trend", methods=['GET'])
+def get_telemetry_trend(user_uuid, car_id):
+    """Coolant temperature and check-engine-light history of one car, from the rollup tables.
+
+    ?since / ?until are ISO dates or timestamps (UTC unless they carry an
+    offset) and default to the last TREND_DEFAULT_DAYS days; ?resolution is
+    hour or day and is chosen from the range when omitted.
+    """
+    logger.info(f"Fetching telemetry trend of car {car_id} for user: {user_uuid}")
+    try:
+        until = parse_timestamp(request.args.get('until'), 'until') or datetime.now(timezone.utc)
+        since = parse_timestamp(request.args.get('since'), 'since') or until - timedelta(days=TREND_DEFAULT_DAYS)
+        if since >= until:
+            raise ValueError("since must be before until")
+        resolution = request.args.get('resolution') or (
+            'hour' if until - since <= timedelta(days=TREND_HOURLY_MAX_DAYS) else 'day')
+        if resolution not in TELEMETRY_ROLLUP_TABLES:
+            raise ValueError("resolution must be hour or day")
+        if (until - since) / timedelta(**{f"{resolution}s": 1}) > MAX_TREND_BUCKETS:
+            raise ValueError(f"The range spans more than {MAX_TREND_BUCKETS} {resolution} buckets")
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        trend = get_telemetry_trend_for_car(user_uuid, car_id, resolution, since, until)
+        if trend is None:
+            return jsonify({"status": "error", "message": "Car not found or doesn't belong to this user"}), 404
+        return jsonify({"status": "success", "car_id": car_id, "resolution": resolution,
+                        "since": since.isoformat(), "until": until.isoformat(), "data": trend})
+    except Exception as e:
+        logger.error(f"Error in get_telemetry_trend endpoint for user {user_uuid}: {str(e)}")
+        return jsonify({"status": "error", "message": "An internal error occurred"}), 500
+
+def parse_timestamp(value, name):
+    """Parse an optional ISO date or timestamp query parameter into an aware datetime (UTC if naive)."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO-8601 date or timestamp")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def get_telemetry_trend_for_car(user_uuid, car_id, resolution, since, until):
+    """Rollup buckets of one car in [since, until), oldest first; None if the car is not the user's."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(SELECT_TELEMETRY_TREND.format(table=TELEMETRY_ROLLUP_TABLES[resolution]), {
+            "user_uuid": user_uuid, "car_id": car_id, "since": since, "until": until,
+        })
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        columns = [desc[0] for desc in cursor.description]
+        # A car without data in the range comes back as one row with a NULL bucket
+        return [format_car_row(columns, row) for row in rows if row[0] is not None]
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+
+@app.route(f"/{ENV}/user/<uuid:user_uuid>/car/<int:car_id>/errors", methods=['GET'])
+def get_car_errors(user_uuid, car_id):
+    """One page of a car's error events with their parts, newest first.
+
+    ?since / ?until (ISO dates, inclusive) and ?min_mileage / ?max_mileage
+    filter the events; ?after takes the previous page's next_cursor.
+    """
+    logger.info(f"Fetching error history of car {car_id} for user: {user_uuid}")
+    try:
+        filters = parse_error_history_filters(request.args)
+        before = error_history_start(parse_error_history_cursor(request.args.get('after')), filters.get('until'))
+        limit = parse_positive_int(request.args.get('limit'), 'limit') or ERROR_HISTORY_DEFAULT_LIMIT
+        if limit > MAX_ERROR_HISTORY_PAGE_SIZE:
+            raise ValueError(f"limit must be at most {MAX_ERROR_HISTORY_PAGE_SIZE}")
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        page = get_car_error_history(user_uuid, car_id, filters, before, limit)
+        if page is None:
+            return jsonify({"status": "error", "message": "Car not found or doesn't belong to this user"}), 404
+        data, next_cursor = page
+        body = serialization.splice({"status": "success", "car_id": car_id, "next_cursor": next_cursor}, data=data)
+        return app.response_class(body, mimetype='application/json')
+    except Exception as e:
+        logger.error(f"Error in get_car_errors endpoint for user {user_uuid}: {str(e)}")
+        return jsonify({"status": "error", "message": "An internal error occurred"}), 500
+
+def parse_error_history_filters(args):
+    """Read the optional date and mileage filters of get_car_errors; raises ValueError."""
+    filters = {}
+    for name in ('since', 'until'):
+        if args.get(name):
+            try:
+                filters[name] = date.fromisoformat(args[name])
+            except ValueError:
+                raise ValueError(f"{name} must be an ISO-8601 date")
+    for name in ('min_mileage', 'max_mileage'):
+        value = parse_non_negative_int(args.get(name), name)
+        if value is not None:
+            filters[name] = value
+    if 'since' in filters and 'until' in filters and filters['since'] > filters['until']:
+        raise ValueError("since must not be after until")
+    if 'min_mileage' in filters and 'max_mileage' in filters and filters['min_mileage'] > filters['max_mileage']:
+        raise ValueError("min_mileage must not be above max_mileage")
+    return filters
+
+def parse_error_history_cursor(value):
+    """Turn a get_car_errors `after` cursor ("<date>:<error_event_id>") into the key to page below.
+
+    Without a cursor the key sorts above every event. Undated events carry
+    -infinity as their date.
+    """
+    if not value:
+        return 'infinity', 0
+    key, _, event_id = value.rpartition(':')
+    try:
+        if key != '-infinity':
+            date.fromisoformat(key)
+        event_id = int(event_id)
+    except ValueError:
+        raise ValueError("after must be a next_cursor returned by a previous page")
+    return key, event_id
+
+def error_history_start(before, until):
+    """Move the keyset start down to the day after `until`, so the scan begins at the newest match."""
+    if until is None or until == date.max:
+        return before
+    key, _ = before
+    day_after = until + timedelta(days=1)
+    if key == 'infinity' or (key != '-infinity' and date.fromisoformat(key) > day_after):
+        return day_after.isoformat(), 0
+    return before
+
+def get_car_error_history(user_uuid, car_id, filters, before, limit):
+    """Retrieve one page of a car's error history as (JSON array text, next_cursor).
+
+    Events and their parts come from one statement, so a page costs a single
+    round trip however many events it holds. Returns None if the car is not
+    the user's.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        query = SELECT_CAR_ERROR_HISTORY.format(
+            filters="".join(f"AND {ERROR_HISTORY_FILTERS[name]} " for name in filters))
+        cursor.execute(query, {"user_uuid": user_uuid, "car_id": car_id, "before_date": before[0],
+                               "before_id": before[1], "limit": limit, **filters})
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        data, fetched, last_cursor = row
+        return data, last_cursor if fetched > limit else None
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+
+@app.route(f"/{ENV}/user/<uuid:user_uuid>/car/add_user_cars", methods=['POST'])
+def add_user_cars(user_uuid):
+    """Endpoint to add many cars for a specific user in one call."""
+    logger.info(f"Received request to add a batch of cars for user: {user_uuid}")
+
+    payload = request.get_json(silent=True)
+    atomic = True
+    if isinstance(payload, dict):
+        atomic = payload.get('atomic', True) is not False
+        payload = payload.get('cars')
+    if not isinstance(payload, list) or not payload:
+        return jsonify({"status": "error", "message": "Request body must contain a non-empty list of cars"}), 400
+    if len(payload) > MAX_BATCH_CARS:
+        return jsonify({"status": "error", "message": f"At most {MAX_BATCH_CARS} cars can be added per request"}), 413
+
+    try:
+        result = create_cars_for_user(user_uuid, payload, atomic)
+
+        if result["created"]:
+            logger.info(f"Added {len(result['data'])} of {len(payload)} cars for user {user_uuid}")
+            return jsonify({"status": "success", "message": "Cars added successfully", "data": result["data"], "results": result["results"]}), 201
+        else:
+            logger.warning(f"Failed to add cars for user {user_uuid}: {result['message']}")
+            status_code = 404 if result["message"] == "User not found" else 400
+            return jsonify({"status": "error", "message": result["message"], "results": result["results"]}), status_code
+
+    except Exception as e:
+        logger.error(f"Unexpected error in add_user_cars endpoint for user {user_uuid}: {str(e)}")
+        return jsonify({"status": "error", "message": "An internal error occurred"}), 500
+
+def validate_car_data(car_data):
+    """Check a car payload and return (row values in CAR_DETAIL_FIELDS order, error message)."""
+    if not isinstance(car_data, dict):
+        return None, "Car must be a JSON object"
+    for field in ['make', 'model']:
+        value = car_data.get(field)
+        if value is not None and (not isinstance(value, str) or len(value) > 100):
+            return None, f"{field} must be a string of at most 100 characters"
+    for field in ['year', 'mileage']:
+        value = car_data.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0 or value > 2**31 - 1):
+            return None, f"{field} must be a non-negative integer"
+    for field in CAR_DATE_FIELDS:
+        value = car_data.get(field)
+        if value is None:
+            continue
+        try:
+            date.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None, f"{field} must be a date in YYYY-MM-DD format"
+    return [car_data.get(field) for field in CAR_DETAIL_FIELDS], None
+
+def create_cars_for_user(user_uuid, cars_data, atomic=True):
+    """Create many cars and their details for a user in a single statement.
+
+    When `atomic` is true nothing is inserted if any car fails validation;
+    otherwise the valid cars are inserted and the invalid ones reported.
+    Results and created records are returned in input order.
+    """
+    validated = [validate_car_data(car_data) for car_data in cars_data]
+    results = [
+        {"index": i, "created": False, "reason": error} if error else {"index": i, "created": False}
+        for i, (_, error) in enumerate(validated)
+    ]
+    rows = [[i] + values for i, (values, error) in enumerate(validated) if not error]
+
+    if not rows or (atomic and len(rows) != len(cars_data)):
+        return {"created": False, "message": "Invalid car data; no cars were added", "results": results}
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        query = INSERT_USER_CARS_BATCH.format(values=", ".join([INSERT_USER_CARS_ROW] * len(rows)))
+        params = [user_uuid] + [value for row in rows for value in row]
+        cursor.execute(query, params)
+        records = cursor.fetchall()
+
+        if not records:
+            conn.rollback()
+            logger.warning(f"Attempt to add cars for non-existent user: {user_uuid}")
+            return {"created": False, "message": "User not found", "results": results}
+
+        conn.commit()
+        garage_cache.invalidate_user(user_uuid)
+
+        # Drop the leading `ord` column; dates are left to the app's JSON provider
+        columns = [desc[0] for desc in cursor.description][1:]
+        created = []
+        for record in records:
+            new_car_details = dict(zip(columns, record[1:]))
+            results[record[0]] = {"index": record[0], "created": True, "car_id": new_car_details["car_id"]}
+            created.append(new_car_details)
+
+        logger.info(f"Created {len(created)} cars for user {user_uuid} in one statement")
+        return {"created": True, "data": created, "results": results}
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error creating cars for user {user_uuid}: {str(e)}")
+        raise
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+
+
+@app.route(f"/{ENV}/user/<uuid:user_uuid>/maintenance_forecast", methods=['GET'])
+def get_maintenance_forecast(user_uuid):
+    logger.info(f"Forecasting maintenance for user: {user_uuid}")
+    try:
+        forecast = get_maintenance_forecast_for_user(user_uuid)
+        return jsonify({"status": "success", "data": forecast})
+    except Exception as e:
+        logger.error(f"Error in get_maintenance_forecast endpoint: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def get_maintenance_forecast_for_user(user_uuid):
+    """Next-due date, mileage and urgency of every service for each of a user's cars."""
+    import maintenance_forecast
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        columns = maintenance_forecast.load_columns(cursor, user_uuid)
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+    result = maintenance_forecast.forecast(columns)
+    cars = maintenance_forecast.forecast_to_json(columns, result)
+    logger.info(f"Forecast maintenance for {len(cars)} cars of user {user_uuid}")
+    return cars
+
+
+@app.route(f"/{ENV}/user/<uuid:user_uuid>/car_health", methods=['GET'])
+def get_car_health(user_uuid):
+    logger.info(f"Fetching car health for user: {user_uuid}")
+    try:
+        health = get_car_health_for_user(user_uuid)
+        return jsonify({"status": "success", "data": health})
+    except Exception as e:
+        logger.error(f"Error in get_car_health endpoint: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@fast_routes.route('GET', '/user/<uuid:user_uuid>/car_health')
+def fast_get_car_health(req, user_uuid):
+    logger.info(f"Fetching car health for user: {user_uuid}")
+    try:
+        return 200, json_body({"status": "success", "data": get_car_health_for_user(user_uuid)}), {}
+    except Exception as e:
+        logger.error(f"Error in get_car_health endpoint: {str(e)}")
+        return 500, json_body({"status": "error", "message": str(e)}), {}
+
+def get_car_health_for_user(user_uuid):
+    """Health scores written by the last scoring_job run for each of a user's cars."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(SELECT_USER_CAR_HEALTH, (user_uuid,))
+        columns = [desc[0] for desc in cursor.description]
+        return [format_car_row(columns, row) for row in cursor.fetchall()]
+    finally:
+        if conn:
+            release_db_connection(conn)
+
+
+@app.route(f"/{ENV}/dtc/decode", methods=['GET', 'POST'])
+def decode_dtcs():
+    """Resolve a batch of diagnostic trouble codes against the bundled catalog.
+
+    POST takes {"codes": [...]}; GET takes ?codes=P0300,P0171.
+    """
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        codes = payload.get('codes') if isinstance(payload, dict) else payload
+    else:
+        codes = [code for code in request.args.get('codes', '').split(',') if code]
+    if not isinstance(codes, list) or not codes:
+        return jsonify({"status": "error", "message": "Provide a non-empty list of codes"}), 400
+    if len(codes) > dtc_catalog.MAX_DECODE_BATCH:
+        return jsonify({"status": "error", "message": f"At most {dtc_catalog.MAX_DECODE_BATCH} codes can be decoded per request"}), 413
+
+    try:
+        results = dtc_catalog.decode_codes(codes)
+        known = sum(1 for result in results if result["known"])
+        return jsonify({"status": "success", "known": known, "unknown": len(results) - known, "data": results})
+    except Exception as e:
+        logger.error(f"Error in decode_dtcs endpoint: {str(e)}")
+        return jsonify({"status": "error", "message": "An internal error occurred"}), 500
+
+@app.route(f"/{ENV}/dtc/codes", methods=['GET'])
+def list_dtcs():
+    """List catalog entries under a code prefix, e.g. ?prefix=P01xx."""
+    prefix = dtc_catalog.normalize_prefix(request.args.get('prefix'))
+    if prefix is None:
+        return jsonify({"status": "error", "message": "prefix must look like P, P0, P01 or P01xx"}), 400
+    try:
+        limit = parse_positive_int(request.args.get('limit'), 'limit') or dtc_catalog.MAX_PREFIX_RESULTS
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        entries = dtc_catalog.lookup_prefix(prefix, min(limit, dtc_catalog.MAX_PREFIX_RESULTS))
+        return jsonify({"status": "success", "prefix": prefix, "data": entries})
+    except Exception as e:
+        logger.error(f"Error in list_dtcs endpoint: {str(e)}")
+        return jsonify({"status": "error", "message": "An internal error occurred"}), 500
+
+
+@app.route(f"/{ENV}/fleet/dtc_search", methods=['GET'])
+def fleet_dtc_search():
+    """Find every car that logged any of the given codes in a date range, e.g. ?codes=P0128&since=2025-01-01."""
+    try:
+        codes = [dtc_catalog.normalize_code(code) for code in request.args.get('codes', '').split(',') if code.strip()]
+        if not codes or None in codes:
+            raise ValueError("codes must be a comma separated list of P/C/B/U codes")
+        if len(codes) > FLEET_SEARCH_MAX_CODES:
+            raise ValueError(f"At most {FLEET_SEARCH_MAX_CODES} codes can be searched at once")
+        until = date.fromisoformat(request.args['until']) if request.args.get('until') else date.today()
+        since = (date.fromisoformat(request.args['since']) if request.args.get('since')
+                 else until - timedelta(days=FLEET_SEARCH_DEFAULT_DAYS))
+        if since > until:
+            raise ValueError("since must not be after until")
+        after = parse_positive_int(request.args.get('after'), 'after') or 0
+        limit = parse_positive_int(request.args.get('limit'), 'limit') or 100
+        if limit > MAX_CARS_PAGE_SIZE:
+            raise ValueError(f"limit must be at most {MAX_CARS_PAGE_SIZE}")
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        result = search_fleet_dtcs(sorted(set(codes)), since, until, after, limit)
+        return jsonify({"status": "success", "since": since.isoformat(), "until": until.isoformat(), **result})
+    except Exception as e:
+        logger.error(f"Error in fleet_dtc_search endpoint: {str(e)}")
+        return jsonify({"status": "error", "message": "An internal error occurred"}), 500
+
+def search_fleet_dtcs(codes, since, until, after=0, limit=100):
+    """Per-code totals plus one keyset page of matching cars.
+
+    Both queries read only the error_event_codes indexes. Totals are only
+    computed for the first page (after=0), since they do not change between pages.
+    """
+    params = {"codes": codes, "since": since, "until": until, "after": after, "limit": limit + 1}
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        counts = None
+        if not after:
+            cursor.execute(COUNT_FLEET_DTCS, params)
+            found = {code: {"code": code, "events": events, "cars": cars} for code, events, cars in cursor.fetchall()}
+            counts = [found.get(code, {"code": code, "events": 0, "cars": 0}) for code in codes]
+
+        cursor.execute(SEARCH_FLEET_DTCS, params)
+        columns = [desc[0] for desc in cursor.description]
+        rows = cursor.fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        cars = [format_car_row(columns, row) for row in rows[:limit]]
+        logger.info(f"Fleet DTC search for {codes} from {since} to {until} matched {len(cars)} cars after car_id {after}")
+        result = {"data": cars, "next_cursor": next_cursor}
+        if counts is not None:
+            result["counts"] = counts
+        return result
+    finally:
+        if conn:
+            release_db_connection(conn)
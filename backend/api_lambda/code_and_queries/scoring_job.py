@@ -0,0 +1,259 @@
+import io
+import os
+import sys
+import time
+import uuid
+import logging
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import numpy as np
+import maintenance_forecast
+from db_pool import pool
+
+logger = logging.getLogger()
+
+JOB_NAME = "car_health_scoring"
+# Rows read from the server-side cursor and scored per task
+SCORING_CHUNK_SIZE = int(os.environ.get('SCORING_CHUNK_SIZE', 5000))
+# Worker processes; 1 scores in-process (Lambda has no /dev/shm for multiprocessing)
+SCORING_WORKERS = int(os.environ.get('SCORING_WORKERS', os.cpu_count() or 1))
+# error_events newer than this count towards a car's health
+RECENT_ERROR_DAYS = 90
+
+# Streams every car in car_id order starting after the checkpoint. The first nine
+# columns match maintenance_forecast.CAR_FORECAST_QUERY.
+SCORING_QUERY = """
+    SELECT c.car_id, lower(coalesce(cd.make, '')), lower(coalesce(cd.model, '')),
+           cd.year, cd.mileage,
+           cd.purchase_date - DATE '1970-01-01',
+           cd.last_oil_change - DATE '1970-01-01',
+           cd.last_brake_pad_change - DATE '1970-01-01',
+           cd.last_maintenance_checkup - DATE '1970-01-01',
+           (SELECT count(*) FROM error_events ee
+            WHERE ee.car_id = c.car_id AND ee.occurrence_date >= current_date - %s)
+    FROM cars c
+    LEFT JOIN car_details cd ON c.car_id = cd.car_id
+    WHERE c.car_id > %s
+    ORDER BY c.car_id
+"""
+
+CAR_HEALTH_COLUMNS = (
+    "car_id", "health_score", "urgency", "status", "recent_error_events",
+    "oil_change_due_date", "oil_change_due_mileage",
+    "brake_pads_due_date", "brake_pads_due_mileage",
+    "maintenance_checkup_due_date", "maintenance_checkup_due_mileage",
+)
+
+# Each chunk is COPYed into this staging table and upserted from there in one statement
+CREATE_CAR_HEALTH_STAGING = """
+    CREATE TEMP TABLE IF NOT EXISTS car_health_staging
+    (LIKE car_health INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+"""
+
+UPSERT_CAR_HEALTH_FROM_STAGING = """
+    INSERT INTO car_health ({columns})
+    SELECT {columns} FROM car_health_staging
+    ON CONFLICT (car_id) DO UPDATE SET
+        health_score = EXCLUDED.health_score,
+        urgency = EXCLUDED.urgency,
+        status = EXCLUDED.status,
+        recent_error_events = EXCLUDED.recent_error_events,
+        oil_change_due_date = EXCLUDED.oil_change_due_date,
+        oil_change_due_mileage = EXCLUDED.oil_change_due_mileage,
+        brake_pads_due_date = EXCLUDED.brake_pads_due_date,
+        brake_pads_due_mileage = EXCLUDED.brake_pads_due_mileage,
+        maintenance_checkup_due_date = EXCLUDED.maintenance_checkup_due_date,
+        maintenance_checkup_due_mileage = EXCLUDED.maintenance_checkup_due_mileage,
+        scored_at = now()
+""".format(columns=", ".join(CAR_HEALTH_COLUMNS))
+
+SAVE_CHECKPOINT = """
+    INSERT INTO job_checkpoints (job_name, last_car_id, rows_processed, completed, started_at, updated_at)
+    VALUES (%(job_name)s, %(last_car_id)s, %(rows_processed)s, %(completed)s, now(), now())
+    ON CONFLICT (job_name) DO UPDATE SET
+        last_car_id = EXCLUDED.last_car_id,
+        rows_processed = EXCLUDED.rows_processed,
+        completed = EXCLUDED.completed,
+        started_at = CASE WHEN %(restart)s THEN now() ELSE job_checkpoints.started_at END,
+        updated_at = now()
+"""
+
+
+def health_scores(urgency, recent_errors):
+    """0-100 score: up to 60 points lost to overdue maintenance, up to 40 to recent errors."""
+    maintenance_penalty = 40.0 * np.clip(np.nan_to_num(urgency, nan=0.0), 0.0, 1.5)
+    error_penalty = 10.0 * np.minimum(recent_errors, 4)
+    return np.round(100.0 - maintenance_penalty - error_penalty, 1)
+
+
+def score_chunk(rows, today):
+    """Score one chunk of SCORING_QUERY rows into (last car_id, row count, COPY text for car_health).
+
+    Runs in a worker process, so it only takes and returns plain Python
+    values; rendering the COPY text here keeps that work off the writer.
+    """
+    columns = maintenance_forecast.rows_to_columns([row[:9] for row in rows])
+    recent_errors = np.array([row[9] for row in rows], dtype=np.int64)
+    result = maintenance_forecast.forecast(columns, today)
+
+    def dates(values):
+        return [r'\N' if d == 'NaT' else d for d in np.datetime_as_string(values, unit='D').tolist()]
+
+    def ints(values):
+        return [r'\N' if v != v else str(int(v)) for v in values.tolist()]
+
+    per_service = []
+    for service in maintenance_forecast.SERVICE_DATE_COLUMNS:
+        per_service.append(dates(result[service]["next_due_date"]))
+        per_service.append(ints(result[service]["next_due_mileage"]))
+
+    urgency = result["urgency"]
+    lines = zip(
+        map(str, columns["car_id"].tolist()),
+        map(str, health_scores(urgency, recent_errors).tolist()),
+        [r'\N' if u != u else str(round(u, 3)) for u in urgency.tolist()],
+        maintenance_forecast.urgency_status(urgency).tolist(),
+        map(str, recent_errors.tolist()),
+        *per_service
+    )
+    text = "".join("\t".join(line) + "\n" for line in lines)
+    return int(columns["car_id"][-1]), len(rows), text
+
+
+def load_checkpoint(cursor, resume):
+    """Return the car_id to resume after (0 for a fresh run)."""
+    if not resume:
+        return 0, 0
+    cursor.execute(
+        "SELECT last_car_id, rows_processed, completed FROM job_checkpoints WHERE job_name = %s",
+        (JOB_NAME,)
+    )
+    row = cursor.fetchone()
+    if not row or row[2]:
+        return 0, 0
+    return row[0], row[1]
+
+
+def run(chunk_size=SCORING_CHUNK_SIZE, workers=SCORING_WORKERS, resume=True, today=None):
+    """Score every car into car_health, streaming, in parallel and resumably.
+
+    A reader connection streams SCORING_QUERY through a named cursor; chunks
+    are scored in a process pool (at most 2 per worker in flight, so memory
+    stays bounded); a writer connection upserts each chunk in car_id order and
+    commits it together with the checkpoint, so an interrupted run resumes
+    after the last committed chunk. Returns run metrics.
+    """
+    today = today or date.today()
+    reader = writer = executor = None
+    try:
+        reader = pool.getconn()
+        writer = pool.getconn()
+        writer_cursor = writer.cursor()
+        last_car_id, rows_processed = load_checkpoint(writer_cursor, resume)
+        if last_car_id:
+            logger.info(f"Resuming {JOB_NAME} after car_id {last_car_id} ({rows_processed} rows already scored)")
+        writer_cursor.execute(SAVE_CHECKPOINT, {
+            "job_name": JOB_NAME, "last_car_id": last_car_id, "rows_processed": rows_processed,
+            "completed": False, "restart": not last_car_id,
+        })
+        writer.commit()
+
+        read_cursor = reader.cursor(name=f"{JOB_NAME}_{uuid.uuid4().hex}")
+        read_cursor.itersize = chunk_size
+        read_cursor.execute(SCORING_QUERY, (RECENT_ERROR_DAYS, last_car_id))
+
+        if workers > 1:
+            try:
+                # spawn rather than fork: forked children would share (and on exit close)
+                # the parent's pooled database sockets
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            except (OSError, NotImplementedError) as e:
+                logger.warning(f"Process pool unavailable ({str(e)}), scoring in-process")
+
+        started = time.monotonic()
+        scored = chunks = 0
+        in_flight = deque()
+
+        writer_cursor.execute(CREATE_CAR_HEALTH_STAGING)
+
+        def write(scored_chunk):
+            nonlocal scored, chunks, last_car_id
+            chunk_last_car_id, count, copy_text = scored_chunk
+            writer_cursor.copy_expert(
+                f"COPY car_health_staging ({', '.join(CAR_HEALTH_COLUMNS)}) FROM STDIN",
+                io.StringIO(copy_text)
+            )
+            writer_cursor.execute(UPSERT_CAR_HEALTH_FROM_STAGING)
+            scored += count
+            chunks += 1
+            last_car_id = chunk_last_car_id
+            writer_cursor.execute(SAVE_CHECKPOINT, {
+                "job_name": JOB_NAME, "last_car_id": last_car_id, "rows_processed": rows_processed + scored,
+                "completed": False, "restart": False,
+            })
+            writer.commit()
+            elapsed = time.monotonic() - started
+            logger.info(f"{JOB_NAME}: {scored} rows in {elapsed:.1f}s ({scored / elapsed:.0f} rows/s), checkpoint car_id {last_car_id}")
+
+        while True:
+            rows = read_cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            if executor is None:
+                write(score_chunk(rows, today))
+                continue
+            in_flight.append(executor.submit(score_chunk, rows, today))
+            if len(in_flight) >= 2 * workers:
+                write(in_flight.popleft().result())
+        while in_flight:
+            write(in_flight.popleft().result())
+
+        writer_cursor.execute(SAVE_CHECKPOINT, {
+            "job_name": JOB_NAME, "last_car_id": last_car_id, "rows_processed": rows_processed + scored,
+            "completed": True, "restart": False,
+        })
+        writer.commit()
+
+        elapsed = time.monotonic() - started
+        metrics = {
+            "rows": scored,
+            "chunks": chunks,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(scored / elapsed, 1) if elapsed > 0 else None,
+            "workers": workers if executor else 1,
+            "resumed": rows_processed > 0,
+        }
+        logger.info(f"{JOB_NAME} finished: {metrics}")
+        return metrics
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        if reader:
+            pool.putconn(reader)
+        if writer:
+            pool.putconn(writer)
+
+
+def lambda_handler(event, context):
+    """Scheduled entry point; the event may override chunk_size, workers and resume."""
+    event = event or {}
+    return run(
+        chunk_size=int(event.get('chunk_size', SCORING_CHUNK_SIZE)),
+        workers=int(event.get('workers', 1)),
+        resume=event.get('resume', True) is not False
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score every car into the car_health table")
+    parser.add_argument('--chunk-size', type=int, default=SCORING_CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=SCORING_WORKERS)
+    parser.add_argument('--no-resume', action='store_true', help="ignore an unfinished checkpoint and start over")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    metrics = run(chunk_size=args.chunk_size, workers=args.workers, resume=not args.no_resume)
+    print(metrics, file=sys.stdout)
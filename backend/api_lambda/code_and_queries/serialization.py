@@ -0,0 +1,64 @@
+import json
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder produces the same JSON, only slower
+    orjson = None
+
+
+def _default(value):
+    """Dates and datetimes as ISO 8601 (Flask would use HTTP dates); everything else as Flask does."""
+    if isinstance(value, date):
+        return value.isoformat()
+    return DefaultJSONProvider.default(value)
+
+
+def _fast_dumps(obj):
+    """orjson encoding, or None when orjson is missing or cannot encode obj."""
+    if orjson is None:
+        return None
+    try:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SORT_KEYS).decode('utf-8')
+    except TypeError:  # e.g. integers beyond 64 bits or non-string keys
+        return None
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when it is installed.
+
+    Rows straight from psycopg2 (with date columns) can be passed to jsonify
+    without converting them first.
+    """
+
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs):
+        # orjson is always compact; anything else asked for (indent, ...) goes to the json module
+        if set(kwargs) <= {'separators'}:
+            text = _fast_dumps(obj)
+            if text is not None:
+                return text
+        kwargs.setdefault('separators', (",", ":"))
+        return super().dumps(obj, **kwargs)
+
+
+def dumps(obj):
+    """Compact JSON text, outside of any Flask app."""
+    text = _fast_dumps(obj)
+    if text is not None:
+        return text
+    return json.dumps(obj, default=_default, sort_keys=True, separators=(",", ":"))
+
+
+def splice(envelope, **raw):
+    """JSON body bytes for the `envelope` object plus keys whose values are already JSON text.
+
+    Lets a response carry JSON rendered by Postgres without decoding and
+    re-encoding it.
+    """
+    body = dumps(envelope)[:-1]
+    for key, text in raw.items():
+        body += ("," if len(body) > 1 else "") + json.dumps(key) + ":" + text
+    return (body + "}\n").encode('utf-8')
@@ -1,10 +1,16 @@
+# Baseline schema, applied as migration 1. Later schema changes are added as
+# new versions in migrations.py instead of being edited in here.
 CREATE_SCHEMA = """
 CREATE TABLE IF NOT EXISTS users (
     uuid UUID PRIMARY KEY,
     email VARCHAR(255) NOT NULL UNIQUE,
-    location VARCHAR(255)
+    location VARCHAR(255),
+    garage_version BIGINT NOT NULL DEFAULT 0
 );
 
+-- Bumped on every change to a user's cars; used as the get_user_cars ETag
+ALTER TABLE users ADD COLUMN IF NOT EXISTS garage_version BIGINT NOT NULL DEFAULT 0;
+
 CREATE TABLE IF NOT EXISTS cars (
     car_id SERIAL PRIMARY KEY,
     user_uuid UUID NOT NULL REFERENCES users(uuid) ON DELETE CASCADE
@@ -37,5 +43,540 @@ CREATE TABLE IF NOT EXISTS error_parts (
     part_name VARCHAR(255)
 );
 
+CREATE TABLE IF NOT EXISTS telemetry_readings (
+    reading_id BIGSERIAL PRIMARY KEY,
+    car_id INTEGER NOT NULL REFERENCES cars(car_id) ON DELETE CASCADE,
+    recorded_at TIMESTAMPTZ NOT NULL,
+    dtcs TEXT[] NOT NULL DEFAULT '{}',
+    coolant_temp_c REAL,
+    check_engine_light BOOLEAN,
+    vin VARCHAR(17),
+    received_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS telemetry_readings_car_id_recorded_at_idx
+    ON telemetry_readings (car_id, recorded_at);
+
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 """
+
+# Written by the nightly scoring job (scoring_job.py), read by /car_health
+CREATE_CAR_HEALTH = """
+CREATE TABLE IF NOT EXISTS car_health (
+    car_id INTEGER PRIMARY KEY REFERENCES cars(car_id) ON DELETE CASCADE,
+    health_score REAL NOT NULL,
+    urgency REAL,
+    status VARCHAR(16) NOT NULL,
+    recent_error_events INTEGER NOT NULL DEFAULT 0,
+    oil_change_due_date DATE,
+    oil_change_due_mileage INTEGER,
+    brake_pads_due_date DATE,
+    brake_pads_due_mileage INTEGER,
+    maintenance_checkup_due_date DATE,
+    maintenance_checkup_due_mileage INTEGER,
+    scored_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+    job_name VARCHAR(100) PRIMARY KEY,
+    last_car_id INTEGER NOT NULL DEFAULT 0,
+    rows_processed BIGINT NOT NULL DEFAULT 0,
+    completed BOOLEAN NOT NULL DEFAULT false,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# One row per (error event, code), kept in sync with error_events.error_codes by a
+# trigger so codes can be searched through B-tree indexes instead of LIKE scans.
+# car_id and occurrence_date are copied from the event so fleet searches are
+# answered from the indexes alone.
+CREATE_ERROR_EVENT_CODES = r"""
+CREATE TABLE IF NOT EXISTS error_event_codes (
+    error_event_id INTEGER NOT NULL REFERENCES error_events(error_event_id) ON DELETE CASCADE,
+    code VARCHAR(5) NOT NULL,
+    car_id INTEGER NOT NULL,
+    occurrence_date DATE,
+    PRIMARY KEY (error_event_id, code)
+);
+
+-- error_codes is free text: pull out every P/C/B/U + 4 hex digit code it contains
+CREATE OR REPLACE FUNCTION sync_error_event_codes() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        DELETE FROM error_event_codes WHERE error_event_id = NEW.error_event_id;
+    END IF;
+    INSERT INTO error_event_codes (error_event_id, code, car_id, occurrence_date)
+    SELECT DISTINCT NEW.error_event_id, m[1], NEW.car_id, NEW.occurrence_date
+    FROM regexp_matches(upper(coalesce(NEW.error_codes, '')), '\m([PCBU][0-9A-F]{4})\M', 'g') AS m;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS error_events_sync_codes ON error_events;
+CREATE TRIGGER error_events_sync_codes
+    AFTER INSERT OR UPDATE OF error_codes, car_id, occurrence_date ON error_events
+    FOR EACH ROW EXECUTE FUNCTION sync_error_event_codes();
+
+-- Created with the empty table; BACKFILL_ERROR_EVENT_CODES fills in older events.
+-- Per-code counts over a date range:
+CREATE INDEX IF NOT EXISTS error_event_codes_code_date_idx
+    ON error_event_codes (code, occurrence_date, car_id);
+-- Keyset pages of matching cars in car_id order:
+CREATE INDEX IF NOT EXISTS error_event_codes_code_car_idx
+    ON error_event_codes (code, car_id, occurrence_date);
+"""
+
+# Copies the codes of events written before the sync trigger existed. Each batch of
+# error_event_ids commits on its own, so writers to error_events are never held up
+# behind the whole backfill (CREATE TRIGGER's lock lasts only until migration 4
+# commits). COMMIT inside DO needs autocommit, i.e. a non-transactional migration.
+# Events that already have codes are skipped, so a rerun only does the rest.
+BACKFILL_ERROR_EVENT_CODES = r"""
+DO $$
+DECLARE
+    batch_size CONSTANT INTEGER := 10000;
+    batch_start INTEGER;
+    last_id INTEGER;
+BEGIN
+    SELECT min(error_event_id), max(error_event_id) INTO batch_start, last_id FROM error_events;
+    WHILE batch_start <= last_id LOOP
+        INSERT INTO error_event_codes (error_event_id, code, car_id, occurrence_date)
+        SELECT DISTINCT ee.error_event_id, m[1], ee.car_id, ee.occurrence_date
+        FROM error_events ee,
+             regexp_matches(upper(ee.error_codes), '\m([PCBU][0-9A-F]{4})\M', 'g') AS m
+        WHERE ee.error_event_id >= batch_start AND ee.error_event_id < batch_start + batch_size
+          AND ee.error_codes IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM error_event_codes c WHERE c.error_event_id = ee.error_event_id)
+        ON CONFLICT DO NOTHING;
+        COMMIT;
+        batch_start := batch_start + batch_size;
+    END LOOP;
+END
+$$
+"""
+
+# Events and distinct cars per code over an occurrence_date range
+COUNT_FLEET_DTCS = """
+SELECT code, count(*) AS events, count(DISTINCT car_id) AS cars
+FROM error_event_codes
+WHERE code = ANY(%(codes)s) AND occurrence_date BETWEEN %(since)s AND %(until)s
+GROUP BY code
+ORDER BY code
+"""
+
+# One keyset page of the cars that logged any of the codes in the range
+SEARCH_FLEET_DTCS = """
+SELECT car_id, array_agg(DISTINCT code ORDER BY code) AS codes, count(*) AS events,
+       min(occurrence_date) AS first_seen, max(occurrence_date) AS last_seen
+FROM error_event_codes
+WHERE code = ANY(%(codes)s) AND occurrence_date BETWEEN %(since)s AND %(until)s
+  AND car_id > %(after)s
+GROUP BY car_id
+ORDER BY car_id
+LIMIT %(limit)s
+"""
+
+# Inserts a batch of cars and their details for one user in a single statement.
+# Car ids are allocated up front so each details row can be paired with its
+# input position (`ord`); the result comes back in input order. Returns no rows
+# when the user does not exist. `{values}` is filled with one
+# INSERT_USER_CARS_ROW per car.
+INSERT_USER_CARS_BATCH = """
+WITH owner AS (
+    SELECT uuid FROM users WHERE uuid = %s
+),
+input (ord, make, model, year, mileage, last_maintenance_checkup,
+       last_oil_change, purchase_date, last_brake_pad_change) AS (
+    VALUES {values}
+),
+allocated AS (
+    SELECT input.*, nextval(pg_get_serial_sequence('cars', 'car_id'))::integer AS car_id
+    FROM input, owner
+),
+new_cars AS (
+    INSERT INTO cars (car_id, user_uuid)
+    SELECT allocated.car_id, owner.uuid FROM allocated, owner
+    RETURNING car_id
+),
+bump_version AS (
+    UPDATE users SET garage_version = garage_version + 1
+    WHERE uuid = (SELECT uuid FROM owner)
+),
+new_details AS (
+    INSERT INTO car_details
+    (car_id, make, model, year, mileage, last_maintenance_checkup,
+     last_oil_change, purchase_date, last_brake_pad_change)
+    SELECT car_id, make, model, year, mileage, last_maintenance_checkup,
+           last_oil_change, purchase_date, last_brake_pad_change
+    FROM allocated
+    RETURNING *
+)
+SELECT allocated.ord, new_details.*
+FROM new_details
+JOIN allocated ON allocated.car_id = new_details.car_id
+ORDER BY allocated.ord
+"""
+
+INSERT_USER_CARS_ROW = "(%s::integer, %s::varchar, %s::varchar, %s::integer, %s::integer, %s::date, %s::date, %s::date, %s::date)"
+
+# Deletes a car only if it belongs to the user and bumps their garage version,
+# in one statement. Returns the car_id, or no row if nothing was deleted.
+DELETE_USER_CAR = """
+WITH deleted AS (
+    DELETE FROM cars
+    WHERE car_id = %(car_id)s AND user_uuid = %(user_uuid)s
+    RETURNING car_id
+),
+bump_version AS (
+    UPDATE users SET garage_version = garage_version + 1
+    WHERE uuid = %(user_uuid)s AND EXISTS (SELECT 1 FROM deleted)
+)
+SELECT car_id FROM deleted
+"""
+
+# Inserts or updates a car's details only if the car belongs to the user, and
+# bumps their garage version, in one statement. `{columns}`, `{values}` and
+# `{assignments}` are filled from the fields being written; `{discard_pending}`
+# is DISCARD_PENDING_MILEAGE when mileage is one of them. Returns the details
+# row, or no row if the car is not the user's.
+UPSERT_CAR_DETAILS = """
+WITH upserted AS (
+    INSERT INTO car_details (car_id, {columns})
+    SELECT c.car_id, {values}
+    FROM cars c
+    WHERE c.car_id = %(car_id)s AND c.user_uuid = %(user_uuid)s
+    ON CONFLICT (car_id) DO UPDATE SET {assignments}
+    RETURNING *
+),
+bump_version AS (
+    UPDATE users SET garage_version = garage_version + 1
+    WHERE uuid = %(user_uuid)s AND EXISTS (SELECT 1 FROM upserted)
+){discard_pending}
+SELECT * FROM upserted
+"""
+
+# A mileage written directly replaces any queued one, even a higher one (a correction)
+DISCARD_PENDING_MILEAGE = """,
+discarded AS (
+    DELETE FROM pending_car_updates WHERE car_id IN (SELECT car_id FROM upserted)
+)"""
+
+# Queues a coalesced mileage update if the car belongs to the user and the value
+# is higher than both the stored and any queued mileage; a newer update replaces
+# the queued one. Returns the car's mileage before this update and the queued
+# value (NULL if it was not higher), or no row if the car is not the user's.
+QUEUE_CAR_MILEAGE = """
+WITH car AS (
+    SELECT c.car_id, c.user_uuid, GREATEST(cd.mileage, p.mileage) AS mileage
+    FROM cars c
+    LEFT JOIN car_details cd ON cd.car_id = c.car_id
+    LEFT JOIN pending_car_updates p ON p.car_id = c.car_id
+    WHERE c.car_id = %(car_id)s AND c.user_uuid = %(user_uuid)s
+),
+queued AS (
+    INSERT INTO pending_car_updates AS p (car_id, user_uuid, mileage, seq)
+    SELECT car_id, user_uuid, %(mileage)s::integer, nextval('pending_car_updates_seq')
+    FROM car
+    WHERE car.mileage IS NULL OR car.mileage < %(mileage)s::integer
+    ON CONFLICT (car_id) DO UPDATE SET
+        mileage = EXCLUDED.mileage,
+        seq = EXCLUDED.seq,
+        reported_at = now()
+    WHERE p.mileage < EXCLUDED.mileage
+    RETURNING mileage
+)
+SELECT car.mileage AS current_mileage, (SELECT mileage FROM queued) AS queued_mileage
+FROM car
+"""
+
+# A user's garage version, bumped by every write to their cars (drives ETags and the
+# response cache). Queued mileage updates do not bump it, so the newest of them is
+# appended: get_user_cars shows them before they are flushed.
+SELECT_GARAGE_VERSION = """
+SELECT u.garage_version || coalesce(
+    '.' || (SELECT max(p.seq) FROM pending_car_updates p WHERE p.user_uuid = u.uuid), '')
+FROM users u
+WHERE u.uuid = %s
+"""
+
+# A user's precomputed car health scores, in car_id order
+SELECT_USER_CAR_HEALTH = """
+SELECT ch.*
+FROM cars c
+JOIN car_health ch ON ch.car_id = c.car_id
+WHERE c.user_uuid = %s
+ORDER BY c.car_id
+"""
+
+# Renders one page of get_user_cars as a JSON array in Postgres, so rows never
+# become Python objects. `{page_query}` is the keyset page query (fetching one
+# row more than the page size); `{page_filter}` is "FILTER (WHERE n <= %s)" to
+# leave that extra row out, or empty for an unpaginated request. Returns the
+# array text, the number of rows fetched and the last car_id in the page.
+SELECT_USER_CARS_JSON = """
+SELECT '[' || coalesce(string_agg(doc, ',' ORDER BY car_id) {page_filter}, '') || ']' AS data,
+       count(*) AS fetched,
+       max(car_id) {page_filter} AS last_car_id
+FROM (
+    SELECT row_to_json(page)::text AS doc, page.car_id,
+           row_number() OVER (ORDER BY page.car_id) AS n
+    FROM ({page_query}) page
+) docs
+"""
+
+# Hourly and daily per-car telemetry aggregates, keyed by UTC bucket start
+TELEMETRY_ROLLUP_TABLES = {"hour": "telemetry_rollups_hourly", "day": "telemetry_rollups_daily"}
+
+TELEMETRY_ROLLUP_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    car_id INTEGER NOT NULL REFERENCES cars(car_id) ON DELETE CASCADE,
+    bucket TIMESTAMPTZ NOT NULL,
+    readings INTEGER NOT NULL,
+    coolant_count INTEGER NOT NULL,
+    coolant_sum DOUBLE PRECISION NOT NULL,
+    coolant_min REAL,
+    coolant_max REAL,
+    cel_readings INTEGER NOT NULL,
+    cel_on INTEGER NOT NULL,
+    PRIMARY KEY (car_id, bucket)
+);
+"""
+
+# Folds a set of readings ({source}) into one rollup table. Counts and sums are
+# stored rather than means so a batch merges by addition; LEAST / GREATEST skip
+# NULLs. Rows are upserted in key order so concurrent uploads for the same car
+# lock them in the same order.
+UPSERT_TELEMETRY_ROLLUP = """
+INSERT INTO {table} AS r
+    (car_id, bucket, readings, coolant_count, coolant_sum, coolant_min, coolant_max, cel_readings, cel_on)
+SELECT car_id,
+       date_trunc('{unit}', recorded_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+       count(*),
+       count(coolant_temp_c),
+       coalesce(sum(coolant_temp_c::double precision), 0),
+       min(coolant_temp_c),
+       max(coolant_temp_c),
+       count(check_engine_light),
+       count(*) FILTER (WHERE check_engine_light)
+FROM {source}
+GROUP BY 1, 2
+ORDER BY 1, 2
+ON CONFLICT (car_id, bucket) DO UPDATE SET
+    readings = r.readings + EXCLUDED.readings,
+    coolant_count = r.coolant_count + EXCLUDED.coolant_count,
+    coolant_sum = r.coolant_sum + EXCLUDED.coolant_sum,
+    coolant_min = LEAST(r.coolant_min, EXCLUDED.coolant_min),
+    coolant_max = GREATEST(r.coolant_max, EXCLUDED.coolant_max),
+    cel_readings = r.cel_readings + EXCLUDED.cel_readings,
+    cel_on = r.cel_on + EXCLUDED.cel_on
+"""
+
+# Rollups are kept current by a statement-level trigger that aggregates each
+# inserted batch (a COPY from /telemetry fires it once) instead of recomputing
+# from raw rows. Deletes are not folded back out: raw readings are pruned by
+# telemetry_retention.py while their rollups are kept.
+CREATE_TELEMETRY_ROLLUPS = "".join(
+    TELEMETRY_ROLLUP_TABLE.format(table=table) for table in TELEMETRY_ROLLUP_TABLES.values()
+) + """
+CREATE OR REPLACE FUNCTION rollup_telemetry_readings() RETURNS trigger AS $$
+BEGIN
+""" + "".join(
+    UPSERT_TELEMETRY_ROLLUP.format(table=table, unit=unit, source="new_readings").strip() + ";\n\n"
+    for unit, table in TELEMETRY_ROLLUP_TABLES.items()
+) + """
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS telemetry_readings_rollup ON telemetry_readings;
+CREATE TRIGGER telemetry_readings_rollup
+    AFTER INSERT ON telemetry_readings
+    REFERENCING NEW TABLE AS new_readings
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_telemetry_readings();
+
+-- Backfill readings stored before the trigger existed (the trigger's lock keeps
+-- uploads out until this transaction commits)
+""" + "".join(
+    UPSERT_TELEMETRY_ROLLUP.format(table=table, unit=unit, source="telemetry_readings").strip() + ";\n\n"
+    for unit, table in TELEMETRY_ROLLUP_TABLES.items()
+)
+
+# Lets the retention job find old readings without a full scan; readings arrive
+# roughly in recorded_at order, so a BRIN index is enough and costs little on ingest
+CREATE_TELEMETRY_RECORDED_AT_BRIN = (
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS telemetry_readings_recorded_at_brin "
+    "ON telemetry_readings USING brin (recorded_at)"
+)
+
+# One car's rollups over [since, until), ownership checked in the same query:
+# no row means the car is not the user's, a single row with a NULL bucket means
+# it has no data in the range. `{table}` is one of TELEMETRY_ROLLUP_TABLES.
+SELECT_TELEMETRY_TREND = """
+SELECT r.bucket,
+       r.readings,
+       r.coolant_count,
+       r.coolant_min,
+       r.coolant_max,
+       r.coolant_sum / nullif(r.coolant_count, 0) AS coolant_mean,
+       r.cel_readings,
+       r.cel_on::double precision / nullif(r.cel_readings, 0) AS cel_on_fraction
+FROM cars c
+LEFT JOIN {table} r
+       ON r.car_id = c.car_id AND r.bucket >= %(since)s AND r.bucket < %(until)s
+WHERE c.car_id = %(car_id)s AND c.user_uuid = %(user_uuid)s
+ORDER BY r.bucket
+"""
+
+# Online anomaly detection on telemetry ingest (anomaly.py): one compact state
+# row per car, updated by every upload, and the anomalies it flags
+CREATE_CAR_ANOMALIES = """
+CREATE TABLE IF NOT EXISTS car_anomaly_state (
+    car_id INTEGER PRIMARY KEY REFERENCES cars(car_id) ON DELETE CASCADE,
+    coolant_mean DOUBLE PRECISION,
+    coolant_var DOUBLE PRECISION NOT NULL DEFAULT 0,
+    coolant_count INTEGER NOT NULL DEFAULT 0,
+    coolant_anomalous BOOLEAN NOT NULL DEFAULT false,
+    -- code -> epoch milliseconds of the last reading that reported it
+    dtc_last_seen JSONB NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS car_anomalies (
+    anomaly_id BIGSERIAL PRIMARY KEY,
+    car_id INTEGER NOT NULL REFERENCES cars(car_id) ON DELETE CASCADE,
+    kind VARCHAR(32) NOT NULL,
+    recorded_at TIMESTAMPTZ NOT NULL,
+    coolant_temp_c REAL,
+    expected_c REAL,
+    zscore REAL,
+    dtc VARCHAR(5),
+    detected_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS car_anomalies_car_id_recorded_at_idx
+    ON car_anomalies (car_id, recorded_at DESC, anomaly_id DESC);
+"""
+
+# A car's recent error event codes, answered from the index alone on every upload
+CREATE_ERROR_EVENT_CODES_CAR_DATE_IDX = (
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS error_event_codes_car_date_idx "
+    "ON error_event_codes (car_id, occurrence_date, code)"
+)
+
+# get_user_cars `include=anomalies` column: a car's latest anomalies, newest first
+SELECT_CAR_RECENT_ANOMALIES = """(
+    SELECT coalesce(json_agg(a ORDER BY a.recorded_at DESC, a.anomaly_id DESC), '[]')
+    FROM (
+        SELECT anomaly_id, kind, recorded_at, coolant_temp_c, expected_c, zscore, dtc
+        FROM car_anomalies
+        WHERE car_id = c.car_id
+        ORDER BY recorded_at DESC, anomaly_id DESC
+        LIMIT %d
+    ) a
+)"""
+
+# Coalesced mileage updates (update_car_details with coalesce=true): only the
+# newest value per car is kept here until mileage_flush.py writes it to car_details
+CREATE_PENDING_CAR_UPDATES = """
+CREATE SEQUENCE IF NOT EXISTS pending_car_updates_seq;
+
+-- fillfactor leaves room on each page for HOT updates, as rows are rewritten on every update
+CREATE TABLE IF NOT EXISTS pending_car_updates (
+    car_id INTEGER PRIMARY KEY REFERENCES cars(car_id) ON DELETE CASCADE,
+    user_uuid UUID NOT NULL,
+    mileage INTEGER NOT NULL,
+    seq BIGINT NOT NULL,
+    reported_at TIMESTAMPTZ NOT NULL DEFAULT now()
+) WITH (fillfactor = 70);
+
+-- seq is left out of the index so that replacing a queued value stays a HOT update
+CREATE INDEX IF NOT EXISTS pending_car_updates_user_uuid_idx
+    ON pending_car_updates (user_uuid);
+"""
+
+# Older databases may hold several details rows per car; keep the newest one
+# so that car_details_car_id_key can be built
+DELETE_DUPLICATE_CAR_DETAILS = """
+DELETE FROM car_details older
+USING car_details newer
+WHERE older.car_id = newer.car_id AND older.detail_id < newer.detail_id
+"""
+
+# One details row per car, so writes can upsert with ON CONFLICT (car_id)
+CREATE_CAR_DETAILS_CAR_ID_KEY = "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS car_details_car_id_key ON car_details (car_id)"
+
+# A car's error events, newest first with undated events last. The date and
+# mileage filters are answered from the index; error_codes is unbounded TEXT,
+# which a btree tuple cannot always hold, so it is read from the heap for the
+# rows of the page only
+CREATE_ERROR_EVENTS_CAR_KEYSET_IDX = (
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS error_events_car_keyset_idx "
+    "ON error_events (car_id, (coalesce(occurrence_date, '-infinity'::date)), error_event_id) "
+    "INCLUDE (occurrence_date, occurrence_mileage)"
+)
+
+# Indexes for a car's error history: a page is one range scan of the car's
+# events plus an index-only lookup of each event's parts
+CREATE_ERROR_HISTORY_INDEXES = [
+    CREATE_ERROR_EVENTS_CAR_KEYSET_IDX,
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS error_parts_event_covering_idx "
+    "ON error_parts (error_event_id, part_id) INCLUDE (part_name)",
+    # Superseded by the covering indexes, which lead with the same column
+    "DROP INDEX CONCURRENTLY IF EXISTS error_events_car_id_idx",
+    "DROP INDEX CONCURRENTLY IF EXISTS error_parts_error_event_id_idx",
+]
+
+# Replaces the first version of migration 8's events index, which also held
+# error_codes and so refused events with long code lists
+REPLACE_ERROR_EVENTS_CAR_HISTORY_IDX = [
+    CREATE_ERROR_EVENTS_CAR_KEYSET_IDX,
+    "DROP INDEX CONCURRENTLY IF EXISTS error_events_car_history_idx",
+]
+
+# One keyset page of a car's error events with their parts, as JSON array text,
+# in error_events_car_keyset_idx order. Returns no row when the car is not the
+# user's. Fetches one extra event to tell whether another page follows;
+# last_cursor is the key of the page's last event. `{filters}` holds the
+# optional ERROR_HISTORY_FILTERS.
+SELECT_CAR_ERROR_HISTORY = """
+WITH page AS (
+    SELECT e.error_event_id, e.occurrence_date, e.occurrence_mileage, e.error_codes,
+           (SELECT coalesce(json_agg(ep.part_name ORDER BY ep.part_id), '[]')
+            FROM error_parts ep
+            WHERE ep.error_event_id = e.error_event_id) AS parts,
+           -- Spelled out so the cursor does not depend on the session's DateStyle
+           coalesce(to_char(e.occurrence_date, 'YYYY-MM-DD'), '-infinity') || ':' || e.error_event_id AS cursor,
+           row_number() OVER (ORDER BY coalesce(e.occurrence_date, '-infinity'::date) DESC,
+                                       e.error_event_id DESC) AS n
+    FROM error_events e
+    WHERE e.car_id = %(car_id)s
+      AND (coalesce(e.occurrence_date, '-infinity'::date), e.error_event_id) < (%(before_date)s::date, %(before_id)s)
+      {filters}
+    ORDER BY coalesce(e.occurrence_date, '-infinity'::date) DESC, e.error_event_id DESC
+    LIMIT %(limit)s + 1
+)
+SELECT '[' || coalesce(string_agg(json_build_object(
+           'error_event_id', p.error_event_id,
+           'occurrence_date', p.occurrence_date,
+           'occurrence_mileage', p.occurrence_mileage,
+           'error_codes', p.error_codes,
+           'parts', p.parts)::text, ',' ORDER BY p.n) FILTER (WHERE p.n <= %(limit)s), '') || ']' AS data,
+       count(p.n) AS fetched,
+       max(p.cursor) FILTER (WHERE p.n = %(limit)s) AS last_cursor
+FROM cars c
+LEFT JOIN page p ON true
+WHERE c.car_id = %(car_id)s AND c.user_uuid = %(user_uuid)s
+GROUP BY c.car_id
+"""
+
+# Optional SELECT_CAR_ERROR_HISTORY conditions. Both exclude undated events.
+# `since` compares on the index expression so the range scan stops at it; the
+# start of the scan is moved to `until` through the keyset bound (see
+# get_car_errors)
+ERROR_HISTORY_FILTERS = {
+    "since": "coalesce(e.occurrence_date, '-infinity'::date) >= %(since)s",
+    "until": "e.occurrence_date <= %(until)s",
+    "min_mileage": "e.occurrence_mileage >= %(min_mileage)s",
+    "max_mileage": "e.occurrence_mileage <= %(max_mileage)s",
+}
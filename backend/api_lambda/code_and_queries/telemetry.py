@@ -0,0 +1,188 @@
+import io
+import re
+import logging
+from datetime import datetime, timezone
+import numpy as np
+from dtc_catalog import DTC_PATTERN
+
+logger = logging.getLogger()
+
+# Largest number of readings accepted in one upload
+MAX_TELEMETRY_BATCH = 10000
+# Physical range of OBD-II PID 0105 (engine coolant temperature)
+COOLANT_TEMP_MIN_C = -40.0
+COOLANT_TEMP_MAX_C = 215.0
+# What the ESP32 firmware sends as coolant_temp_c when the ELM327 read fails
+COOLANT_READ_FAILED_C = -999.0
+# Readings stamped further than this into the future are treated as clock errors
+MAX_CLOCK_SKEW_MS = 5 * 60 * 1000
+# Readings stamped before this (2000-01-01T00:00:00Z) come from an unset clock
+MIN_RECORDED_MS = 946684800000
+# cars.car_id is a SERIAL (int4) column
+MAX_CAR_ID = 2**31 - 1
+
+VIN_PATTERN = re.compile(r'^[A-Z0-9]{1,17}$')
+
+COPY_TELEMETRY_READINGS = """
+    COPY telemetry_readings (car_id, recorded_at, dtcs, coolant_temp_c, check_engine_light, vin)
+    FROM STDIN
+"""
+
+
+def _to_float_array(values):
+    """Convert a column to float64 with None as NaN.
+
+    Also returns a mask of the values that are not JSON numbers. Booleans are
+    included, since float() would read true as 1, and so are integers too
+    large for a float.
+    """
+    floats = [_to_float(v) for v in values]
+    not_number = np.array([v is not None and f is None for v, f in zip(values, floats)], dtype=bool)
+    return np.array([np.nan if f is None else f for f in floats], dtype=np.float64), not_number
+
+
+def _to_float(value):
+    """float(value) for a JSON number that fits in a float, otherwise None."""
+    if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    try:
+        return float(value)
+    except OverflowError:
+        return None
+
+
+def _parse_timestamp_ms(value):
+    """Parse an ISO-8601 string or epoch seconds into epoch milliseconds (NaN if invalid)."""
+    if isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        try:
+            return float(value) * 1000.0
+        except OverflowError:
+            return np.nan
+    if not isinstance(value, str):
+        return np.nan
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return np.nan
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp() * 1000.0
+
+
+def _normalize_dtcs(value):
+    """Return an upper-cased tuple of codes, or None if any code is malformed."""
+    if value is None:
+        return ()
+    if not isinstance(value, list):
+        return None
+    codes = tuple(code.strip().upper() for code in value if isinstance(code, str))
+    if len(codes) != len(value) or not all(DTC_PATTERN.match(code) for code in codes):
+        return None
+    return codes
+
+
+def parse_readings(readings, default_car_id=None, now_ms=None):
+    """Unpack raw reading dicts into column arrays and validate them in one pass.
+
+    Returns a batch dict holding one array per column plus a `reasons` array
+    that is empty for accepted rows and carries the rejection reason otherwise.
+    """
+    if now_ms is None:
+        now_ms = datetime.now(timezone.utc).timestamp() * 1000.0
+
+    is_object = np.array([isinstance(r, dict) for r in readings], dtype=bool)
+    rows = [r if isinstance(r, dict) else {} for r in readings]
+
+    car_ids, car_id_not_number = _to_float_array([r.get('car_id', default_car_id) for r in rows])
+    coolant, coolant_not_number = _to_float_array([r.get('coolant_temp_c') for r in rows])
+    # A failed sensor read carries no temperature, but the reading's other fields are kept
+    read_failed = ~np.isfinite(coolant) | (coolant == COOLANT_READ_FAILED_C)
+    has_coolant = np.array([r.get('coolant_temp_c') is not None for r in rows], dtype=bool)
+    has_coolant &= coolant_not_number | ~read_failed
+    recorded_ms = np.array(
+        [_parse_timestamp_ms(r['recorded_at']) if r.get('recorded_at') is not None else now_ms for r in rows],
+        dtype=np.float64
+    )
+    raw_cel = [r.get('check_engine_light') for r in rows]
+    cel = np.array([-1 if v is None else int(v) if isinstance(v, bool) else -2 for v in raw_cel], dtype=np.int8)
+    dtcs = [_normalize_dtcs(r.get('dtcs')) for r in rows]
+    vins = [(r.get('vin').strip().upper() or None) if isinstance(r.get('vin'), str) else r.get('vin') for r in rows]
+
+    with np.errstate(invalid='ignore'):
+        bad_car_id = car_id_not_number | ~np.isfinite(car_ids) | (car_ids <= 0) | (car_ids > MAX_CAR_ID) | (car_ids != np.floor(car_ids))
+        bad_time = ~np.isfinite(recorded_ms)
+        future = recorded_ms > now_ms + MAX_CLOCK_SKEW_MS
+        too_old = recorded_ms < MIN_RECORDED_MS
+        bad_coolant = has_coolant & (coolant_not_number
+                                     | ~((coolant >= COOLANT_TEMP_MIN_C) & (coolant <= COOLANT_TEMP_MAX_C)))
+    bad_cel = cel == -2
+    bad_dtcs = np.array([codes is None for codes in dtcs], dtype=bool)
+    bad_vin = np.array([v is not None and not (isinstance(v, str) and VIN_PATTERN.match(v)) for v in vins], dtype=bool)
+
+    checks = [
+        (~is_object, "Reading must be a JSON object"),
+        (bad_car_id, "car_id must be a positive integer"),
+        (bad_time, "recorded_at must be an ISO-8601 timestamp or epoch seconds"),
+        (future, "recorded_at is in the future"),
+        (too_old, "recorded_at is before 2000-01-01"),
+        (bad_coolant, f"coolant_temp_c must be a number between {COOLANT_TEMP_MIN_C:g} and {COOLANT_TEMP_MAX_C:g}"),
+        (bad_cel, "check_engine_light must be a boolean"),
+        (bad_dtcs, "dtcs must be a list of P/C/B/U codes such as P0128"),
+        (bad_vin, "vin must be up to 17 letters or digits"),
+    ]
+    reasons = np.select([mask for mask, _ in checks], [reason for _, reason in checks], default='').astype(object)
+
+    return {
+        "car_id": np.where(bad_car_id, 0, car_ids).astype(np.int64),
+        "recorded_ms": np.where(bad_time, 0, recorded_ms).astype(np.int64),
+        "coolant_temp_c": np.where(has_coolant, coolant, np.nan),
+        "check_engine_light": cel,
+        "dtcs": dtcs,
+        "vin": vins,
+        "reasons": reasons,
+    }
+
+
+def accepted_mask(batch):
+    """Boolean mask of the rows that passed every check so far."""
+    return batch["reasons"] == ''
+
+
+def candidate_car_ids(batch):
+    """Distinct car ids among accepted rows, as plain ints for the ownership query."""
+    return np.unique(batch["car_id"][accepted_mask(batch)]).tolist()
+
+
+def reject_unowned(batch, owned_car_ids):
+    """Reject accepted rows whose car is not in `owned_car_ids`."""
+    unowned = accepted_mask(batch) & ~np.isin(batch["car_id"], np.asarray(owned_car_ids, dtype=np.int64))
+    batch["reasons"][unowned] = "Car not found or doesn't belong to this user"
+
+
+def to_copy_buffer(batch):
+    """Render accepted rows in COPY text format."""
+    mask = accepted_mask(batch)
+    indices = np.flatnonzero(mask)
+    timestamps = np.datetime_as_string(batch["recorded_ms"][mask].astype('datetime64[ms]'), unit='ms', timezone='UTC')
+    coolant = batch["coolant_temp_c"][mask]
+    cel = batch["check_engine_light"][mask]
+
+    buffer = io.StringIO()
+    for i, car_id, recorded_at, temp, light in zip(indices, batch["car_id"][mask], timestamps, coolant, cel):
+        dtcs = "{" + ",".join(batch["dtcs"][i]) + "}"
+        temp_text = "\\N" if np.isnan(temp) else repr(float(temp))
+        light_text = "\\N" if light < 0 else ("t" if light else "f")
+        vin = batch["vin"][i] or "\\N"
+        buffer.write(f"{car_id}\t{recorded_at}\t{dtcs}\t{temp_text}\t{light_text}\t{vin}\n")
+    buffer.seek(0)
+    return buffer
+
+
+def batch_results(batch):
+    """Per-row accept/reject results in input order."""
+    return [
+        {"index": i, "accepted": True} if not reason else {"index": i, "accepted": False, "reason": reason}
+        for i, reason in enumerate(batch["reasons"])
+    ]
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+from db_pool import pool
+
+logger = logging.getLogger()
+
+JOB_NAME = "telemetry_retention"
+# Raw telemetry_readings older than this are deleted; their hourly and daily rollups are kept
+TELEMETRY_RETENTION_DAYS = int(os.environ.get('TELEMETRY_RETENTION_DAYS', 90))
+# Rows deleted per transaction, so each batch holds its locks briefly and WAL stays bounded
+PRUNE_BATCH_SIZE = int(os.environ.get('TELEMETRY_PRUNE_BATCH_SIZE', 10000))
+
+# Found through the BRIN index on recorded_at
+PRUNE_RAW_READINGS = """
+    DELETE FROM telemetry_readings
+    WHERE reading_id IN (
+        SELECT reading_id FROM telemetry_readings
+        WHERE recorded_at < %s
+        LIMIT %s
+    )
+"""
+
+
+def run(days=TELEMETRY_RETENTION_DAYS, batch_size=PRUNE_BATCH_SIZE, now=None):
+    """Delete raw readings recorded more than `days` ago, one committed batch at a time.
+
+    Safe to interrupt and rerun: every batch is its own transaction. Returns
+    run metrics.
+    """
+    if days < 1:
+        raise ValueError("days must be at least 1")
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=days)
+    conn = None
+    try:
+        conn = pool.getconn()
+        cursor = conn.cursor()
+        started = time.monotonic()
+        deleted = batches = 0
+        while True:
+            cursor.execute(PRUNE_RAW_READINGS, (cutoff, batch_size))
+            count = cursor.rowcount
+            conn.commit()
+            deleted += count
+            batches += 1
+            if count < batch_size:
+                break
+            logger.info(f"{JOB_NAME}: deleted {deleted} readings so far")
+
+        elapsed = time.monotonic() - started
+        metrics = {
+            "deleted": deleted,
+            "batches": batches,
+            "cutoff": cutoff.isoformat(),
+            "seconds": round(elapsed, 3),
+        }
+        logger.info(f"{JOB_NAME} finished: {metrics}")
+        return metrics
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            pool.putconn(conn)
+
+
+def lambda_handler(event, context):
+    """Scheduled entry point; the event may override days and batch_size."""
+    event = event or {}
+    return run(
+        days=int(event.get('days', TELEMETRY_RETENTION_DAYS)),
+        batch_size=int(event.get('batch_size', PRUNE_BATCH_SIZE))
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Delete raw telemetry readings past the retention period")
+    parser.add_argument('--days', type=int, default=TELEMETRY_RETENTION_DAYS)
+    parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    metrics = run(days=args.days, batch_size=args.batch_size)
+    print(metrics, file=sys.stdout)
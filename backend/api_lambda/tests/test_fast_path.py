@@ -0,0 +1,40 @@
+"""fast_path.Router must accept exactly the paths Flask's url_map does, or the two would answer differently."""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code_and_queries'))
+werkzeug = pytest.importorskip('werkzeug')
+from werkzeug import exceptions, routing
+import fast_path
+
+RULES = ['/user/<uuid:user_uuid>/cars', '/user/<uuid:user_uuid>/car/<int:car_id>/details']
+
+
+def werkzeug_match(path):
+    adapter = routing.Map([routing.Rule('/dev' + rule, endpoint=rule) for rule in RULES]).bind('')
+    try:
+        return adapter.match(path, method='GET')
+    except exceptions.NotFound:
+        return None
+
+
+def fast_match(path):
+    router = fast_path.Router('/dev')
+    for rule in RULES:
+        router.route('GET', rule)(lambda request, **params: None)
+    match = router.match('GET', path)
+    return match and (match[0][len('/dev'):], match[2])
+
+
+@pytest.mark.parametrize('path', [
+    '/dev/user/01234567-89ab-cdef-0123-456789abcdef/cars',
+    '/dev/user/01234567-89AB-CDEF-0123-456789ABCDEF/car/7/details',
+    '/dev/user/0123456789abcdef0123456789abcdef/cars',
+    '/dev/user/{0123456789abcdef0123456789abcdef}/cars',
+    '/dev/user/0123-4567-89ab-cdef-0123-4567-89ab-cdef/cars',
+    '/dev/user/01234567-89ab-cdef-0123-456789abcdeg/cars',
+    '/dev/user/01234567-89ab-cdef-0123-456789abcdef/car/-1/details',
+])
+def test_malformed_paths_match_the_same_routes_as_flask(path):
+    assert fast_match(path) == werkzeug_match(path)
@@ -0,0 +1,120 @@
+"""Statements sent per request by the car write routes, against a disposable PostgreSQL database.
+
+The database is created on the server named by DB_HOST / DB_PORT / DB_USERNAME /
+DB_PASSWORD and dropped afterwards; the tests are skipped when DB_HOST is unset
+or the server cannot be reached.
+
+    DB_HOST=localhost DB_USERNAME=postgres python -m pytest backend/api_lambda/tests
+"""
+import os
+import sys
+import uuid
+import pytest
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code_and_queries')
+ENV = 'test'
+
+
+def admin_connection():
+    import psycopg2
+    conn = psycopg2.connect(host=os.environ.get('DB_HOST'), port=int(os.environ.get('DB_PORT', 5432)),
+                            user=os.environ.get('DB_USERNAME'), password=os.environ.get('DB_PASSWORD'),
+                            dbname='postgres', connect_timeout=5)
+    conn.autocommit = True
+    return conn
+
+
+@pytest.fixture(scope='module')
+def routes():
+    if not os.environ.get('DB_HOST'):
+        pytest.skip("DB_HOST is not set")
+    psycopg2 = pytest.importorskip('psycopg2')
+    try:
+        admin = admin_connection()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL is not reachable: {e}")
+
+    database = f"query_counts_{uuid.uuid4().hex[:12]}"
+    admin.cursor().execute(f"CREATE DATABASE {database}")
+    saved = {name: os.environ.get(name) for name in ('DB_NAME', 'ENVIRONMENT', 'METRICS_ENABLED')}
+    os.environ.update({"DB_NAME": database, "ENVIRONMENT": ENV, "METRICS_ENABLED": "false"})
+    sys.path.insert(0, CODE_DIR)
+    try:
+        import routes
+        routes.create_schema()
+        yield routes
+        routes.pool.closeall()
+    finally:
+        sys.path.remove(CODE_DIR)
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        admin.cursor().execute(f"DROP DATABASE IF EXISTS {database} WITH (FORCE)")
+        admin.close()
+
+
+@pytest.fixture
+def statements(routes, monkeypatch):
+    """SQL text of every statement the app executes during the test."""
+    executed = []
+    record_statement = routes.metrics.record_statement
+
+    def counting_record_statement(query, elapsed_ms):
+        executed.append(query)
+        record_statement(query, elapsed_ms)
+
+    monkeypatch.setattr(routes.metrics, 'record_statement', counting_record_statement)
+    return executed
+
+
+@pytest.fixture
+def car(routes):
+    """(user_uuid, car_id) of a fresh user owning one car."""
+    user_uuid = uuid.uuid4()
+    conn = routes.pool.getconn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO users (uuid, email, location) VALUES (%s, %s, 'Chicago')",
+                       (user_uuid, f"{user_uuid}@example.com"))
+        cursor.execute("INSERT INTO cars (user_uuid) VALUES (%s) RETURNING car_id", (user_uuid,))
+        car_id = cursor.fetchone()[0]
+        cursor.execute("INSERT INTO car_details (car_id, make, model, year, mileage) "
+                       "VALUES (%s, 'Honda', 'Civic', 2015, 90000)", (car_id,))
+        conn.commit()
+    finally:
+        routes.pool.putconn(conn)
+    return user_uuid, car_id
+
+
+def test_update_car_details_runs_one_statement(routes, car, statements):
+    user_uuid, car_id = car
+    response = routes.app.test_client().put(f"/{ENV}/user/{user_uuid}/car/{car_id}/details",
+                                            json={"mileage": 91000, "model": "Civic LX"})
+    assert response.status_code == 200
+    assert response.get_json()["data"]["mileage"] == 91000
+    assert len(statements) == 1
+
+
+def test_update_car_details_of_another_users_car_runs_one_statement(routes, car, statements):
+    _, car_id = car
+    response = routes.app.test_client().put(f"/{ENV}/user/{uuid.uuid4()}/car/{car_id}/details",
+                                            json={"mileage": 91000})
+    assert response.status_code == 404
+    assert len(statements) == 1
+
+
+def test_delete_user_car_runs_one_statement(routes, car, statements):
+    user_uuid, car_id = car
+    response = routes.app.test_client().delete(f"/{ENV}/user/{user_uuid}/car/{car_id}")
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+
+def test_delete_missing_car_runs_one_statement(routes, car, statements):
+    user_uuid, car_id = car
+    client = routes.app.test_client()
+    assert client.delete(f"/{ENV}/user/{uuid.uuid4()}/car/{car_id}").status_code == 404
+    assert client.delete(f"/{ENV}/user/{user_uuid}/car/{car_id + 1000000}").status_code == 404
+    assert len(statements) == 2
@@ -0,0 +1,44 @@
+"""Per-row validation of telemetry uploads (telemetry.parse_readings); needs numpy but no database."""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code_and_queries'))
+pytest.importorskip('numpy')
+import telemetry
+
+NOW_MS = 1767225600000.0  # 2026-01-01T00:00:00Z
+
+
+def reasons(readings):
+    batch = telemetry.parse_readings(readings, now_ms=NOW_MS)
+    return [result.get('reason') for result in telemetry.batch_results(batch)]
+
+
+@pytest.mark.parametrize('reading, reason', [
+    ({'car_id': 10**400}, "car_id must be a positive integer"),
+    ({'car_id': 1, 'coolant_temp_c': 10**400}, "coolant_temp_c must be a number between -40 and 215"),
+    ({'car_id': 1, 'recorded_at': 10**400}, "recorded_at must be an ISO-8601 timestamp or epoch seconds"),
+])
+def test_oversized_integers_are_rejected_per_row(reading, reason):
+    assert reasons([reading, {'car_id': 1, 'coolant_temp_c': 90}]) == [reason, None]
+
+
+def test_booleans_are_not_numbers():
+    assert reasons([{'car_id': True}, {'car_id': 1, 'coolant_temp_c': True}]) == [
+        "car_id must be a positive integer",
+        "coolant_temp_c must be a number between -40 and 215",
+    ]
+
+
+def test_failed_coolant_read_keeps_the_rest_of_the_reading():
+    batch = telemetry.parse_readings(
+        [{'car_id': 1, 'coolant_temp_c': -999.0, 'dtcs': ['P0300'], 'check_engine_light': True}], now_ms=NOW_MS)
+    assert telemetry.batch_results(batch) == [{"index": 0, "accepted": True}]
+    assert batch["dtcs"][0] == ('P0300',)
+    assert batch["check_engine_light"][0] == 1
+    assert telemetry.to_copy_buffer(batch).read().split('\t')[3] == '\\N'
+
+
+def test_timestamps_before_2000_are_rejected():
+    assert reasons([{'car_id': 1, 'recorded_at': -1e15}]) == ["recorded_at is before 2000-01-01"]